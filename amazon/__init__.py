@@ -1 +1,4 @@
 from amazon.amazon_api import AmazonAPI, AmazonAPIError, AmazonAPIResponseError
+from amazon.async_api import AsyncAmazonAPI
+from amazon.credential_pool import CredentialPool
+from amazon.coalesce import CoalescingAPI
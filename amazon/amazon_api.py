@@ -1,12 +1,25 @@
-import hmac
-from urllib import quote
-from hashlib import sha256
-from base64 import b64encode
-from time import strftime, gmtime
+import re
+import logging
+import threading
+from math import ceil
+from Queue import Queue, Empty
+from collections import deque
+from time import time, sleep, strftime, gmtime
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
 import requests
 from bs4 import BeautifulSoup
 
+from amazon import lxml_parser
+from amazon.session_pool import SessionPool
+from amazon.signing import RequestSigner
+from amazon.rate_limit import THROTTLE_ERRORS
+from amazon.metrics import CallMetrics
+from amazon.projection import Projection
+
+
+logger = logging.getLogger(__name__)
 
 HOSTS = {
     'ca': 'ecs.amazonaws.ca',
@@ -19,13 +32,56 @@ HOSTS = {
     'uk': 'ecs.amazonaws.co.uk',
     'us': 'ecs.amazonaws.com'}
 
+# Error codes caused by the state of the service or the account rather than
+# by the request itself
+TRANSIENT_ERRORS = ('InternalError', 'InvalidClientTokenId',
+                    'MissingClientTokenId') + THROTTLE_ERRORS
+
+PARSERS = ('bs4', 'lxml')
+
+# ItemLookup and SimilarityLookup accept at most 10 comma separated ItemIds
+MAX_ITEM_IDS = 10
+
+# ItemSearch returns 10 items per page and no page past the 10th, or past the
+# 5th when searching the All SearchIndex
+ITEMS_PER_PAGE = 10
+MAX_ITEM_PAGES = 10
+MAX_ALL_INDEX_PAGES = 5
+
 
 class AmazonAPIError(Exception):
 
     """
         Errors Generated before Amazon Server responds to a call
     """
-    pass
+
+    # Whether making the same call again may succeed
+    retryable = False
+
+
+class CircuitOpenError(AmazonAPIError):
+
+    """
+        Call failed fast, the circuit breaker of its host is open.
+    """
+
+    retryable = True
+
+
+class DeadlineExceededError(AmazonAPIError):
+
+    """
+        Call ran out of time before it could be made or retried.
+    """
+
+    retryable = True
+
+
+class ArchiveMissError(AmazonAPIError):
+
+    """
+        Replayed call whose request was never recorded in the archive.
+    """
 
 
 class AmazonAPIResponseError(Exception):
@@ -33,16 +89,208 @@ class AmazonAPIResponseError(Exception):
     """
         Exception thrown after evaluating a response from Amazon Server
     """
+
+    retryable = False
+
+    def __init__(self, message=None, code=None, item_id=None,
+                 retryable=None, status=None):
+
+        """
+            :param message: String, error message sent by Amazon.
+            :param code: String, Amazon error code (i.e: RequestThrottled)
+            :param item_id: String, ItemId the error is about, None if it
+                            is about the whole request.
+            :param retryable: Boolean, whether the same request may succeed
+                              later, defaults to the one of the class.
+            :param status: Integer, HTTP status of the response, None when
+                           the error came in a 200 response.
+        """
+
+        super(AmazonAPIResponseError, self).__init__(message)
+        self.code = code
+        self.item_id = item_id
+        self.status = status
+
+        if retryable is not None:
+            self.retryable = retryable
+
+    @property
+    def permanent(self):
+        return not self.retryable
+
+
+class ServiceError(AmazonAPIResponseError):
+
+    """
+        Amazon failed to handle the request (i.e: InternalError)
+    """
+
+    retryable = True
+
+
+class ThrottlingError(AmazonAPIResponseError):
+
+    """
+        Request over the budget of its credential (i.e: RequestThrottled)
+    """
+
+    retryable = True
+
+
+class CredentialsError(AmazonAPIResponseError):
+
+    """
+        Access key missing or unknown to Amazon.
+    """
+    pass
+
+
+class InvalidRequestError(AmazonAPIResponseError):
+
+    """
+        Request, or one of its ItemIds, that Amazon won't accept as it is.
+    """
     pass
 
 
+class NoMatchesError(AmazonAPIResponseError):
+
+    """
+        Valid request that nothing matched.
+    """
+    pass
+
+
+# Error code to (exception class, retryable) for the errors Amazon sends.
+# AccountLimitExceeded is a throttle that lasts until the hourly budget of
+# the credential comes back, so it's not worth retrying right away.
+RESPONSE_ERRORS = {
+    'AWS.ECommerceService.NoExactMatches': (NoMatchesError, False),
+    'AWS.ECommerceService.NoSimilarities': (NoMatchesError, False),
+    'AWS.InvalidEnumeratedParameter': (InvalidRequestError, False),
+    'AWS.InvalidParameterValue': (InvalidRequestError, False),
+    'AWS.MissingParameters': (InvalidRequestError, False),
+    'AWS.RestrictedParameterValueCombination': (InvalidRequestError, False),
+    'AccountLimitExceeded': (ThrottlingError, False),
+    'Deprecated': (InvalidRequestError, False),
+    'InternalError': (ServiceError, True),
+    'InvalidClientTokenId': (CredentialsError, False),
+    'MissingClientTokenId': (CredentialsError, False),
+    'RequestThrottled': (ThrottlingError, True)}
+
+
+def response_error(code, message=None, item_id=None, status=None):
+
+    """
+        :rType: AmazonAPIResponseError, of the class RESPONSE_ERRORS maps
+                code to. Unknown codes give a permanent
+                AmazonAPIResponseError.
+    """
+
+    error_class, retryable = RESPONSE_ERRORS.get(
+        code, (AmazonAPIResponseError, False))
+
+    return error_class(message, code, item_id, retryable, status)
+
+
+def _batch_error(code, message, item_id=None):
+
+    """
+        :rType: Exception, response_error of code, or a generic
+                AmazonAPIError when the <Error> has no Code to type it by.
+    """
+
+    if code is None:
+        return AmazonAPIError(message or "Error with no Code in the response")
+
+    return response_error(code, message, item_id)
+
+
+def is_retryable(error):
+
+    """
+        Whether the call that raised error may succeed if made again.
+
+        :param error: Exception, raised by an AmazonAPI call.
+
+        :rType: Boolean
+    """
+
+    retryable = getattr(error, 'retryable', None)
+    if retryable is not None:
+        return retryable
+
+    if isinstance(error, requests.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+
+    # Network errors and timeouts
+    return isinstance(error, requests.RequestException)
+
+
+class BatchResult(object):
+
+    """
+        Outcome of a lookup of several ItemIds in one request, which
+        doesn't fail as a whole when some of the ItemIds do. Holds the
+        Items that came back, and an error per ItemId that failed, so only
+        those need to be looked up again.
+    """
+
+    def __init__(self, item_ids, response=None, items=(), errors=None):
+
+        """
+            :param item_ids: List, ItemIds requested.
+            :param response: XML Object, None if the request failed.
+            :param items: List, of <Item> in response order.
+            :param errors: dictionary, of ItemId to its exception.
+        """
+
+        self.item_ids = list(item_ids)
+        self.response = response
+        self.items = list(items)
+        self.errors = dict(errors or ())
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def failed_ids(self, retryable=None):
+
+        """
+            :param retryable: Boolean, only the ItemIds whose error is (True)
+                              or isn't (False) worth retrying. None for
+                              every failed ItemId.
+
+            :rType: List, of ItemIds in request order.
+        """
+
+        return [item_id for item_id in self.item_ids
+                if item_id in self.errors and
+                (retryable is None or
+                 is_retryable(self.errors[item_id]) == retryable)]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return 'BatchResult(%d items, %d errors)' % (len(self.items),
+                                                     len(self.errors))
+
+
 class AmazonAPI(object):
 
     _service = "AWSECommerceService"
     _api_version = "2013-09-01"
     _resource = "onca/xml"
 
-    def __init__(self, aws_access_key, secret_key, associate_tag):
+    def __init__(self, aws_access_key, secret_key, associate_tag, pool=True,
+                 pool_size=10, pool_idle_timeout=60, pool_retries=1,
+                 rate_limiter=None, cache=None, parser='bs4', hooks=None,
+                 timeout=30, deadline=None, retry=None, breakers=None,
+                 hedger=None, archive=None):
 
         """
             :param aws_access_key: Amazon access key
@@ -51,12 +299,79 @@ class AmazonAPI(object):
             :param version: AmazonAPI version, this is for internal use only
                             the version corresponds to this API abstract class
                             version.
+            :param pool: Boolean, keep persistent connections open per host.
+                         If False every call opens a new connection.
+            :param pool_size: Integer, max connections kept open per host.
+            :param pool_idle_timeout: Integer, seconds before idle pooled
+                                      connections are dropped, None to keep
+                                      them forever.
+            :param pool_retries: Integer, retries on a stale pooled
+                                 connection.
+            :param rate_limiter: RateLimiter, paces the calls of this client.
+                                 It can be shared with other clients and
+                                 threads. None disables pacing.
+            :param cache: ResponseCache, serves repeated requests without
+                          calling Amazon. None disables caching.
+            :param parser: String, 'bs4' to get BeautifulSoup objects, or
+                           'lxml' for the faster lxml_parser.XMLNode that
+                           supports the same attribute access
+                           (response.Items.Item.ASIN.string).
+            :param hooks: List, of callables called with the
+                          metrics.CallMetrics of every call (i.e:
+                          metrics.MetricsRecorder). Calls are only timed
+                          when there is a hook.
+            :param timeout: Float, seconds to connect and seconds to wait
+                            for data on each attempt, None to wait forever.
+            :param deadline: Float, seconds a whole call can take, retries
+                             included. None for no limit.
+            :param retry: resilience.RetryPolicy, retries retryable errors
+                          with backoff. None makes a single attempt.
+            :param breakers: resilience.CircuitBreakers, fail calls fast
+                             while their host keeps failing. None disables
+                             them.
+            :param hedger: resilience.Hedger, sends a duplicate of requests
+                           slower than usual and keeps the first response.
+                           None disables hedging.
+            :param archive: archive.ResponseArchive, records every response
+                            in 'record' mode, or answers every call with no
+                            network access in 'replay' mode. None disables
+                            it.
         """
 
+        if parser not in PARSERS:
+            raise AmazonAPIError("Invalid parser, parser must be: %s" %
+                                 ', '.join(PARSERS))
+
         self.aws_access_key = aws_access_key.strip()
         self.secret_key = secret_key.strip()
         self.associate_tag = associate_tag.strip()
 
+        # Params of every call are encoded, and the secret key is set up,
+        # once per client instead of once per call.
+        self._signer = RequestSigner(self.secret_key, self._resource, {
+            'AWSAccessKeyId': self.aws_access_key,
+            'AssociateTag': self.associate_tag,
+            'Service': self._service,
+            'Version': self._api_version})
+
+        if pool:
+            self._session_pool = SessionPool(pool_size=pool_size,
+                                             idle_timeout=pool_idle_timeout,
+                                             max_retries=pool_retries)
+        else:
+            self._session_pool = None
+
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.parser = parser
+        self.hooks = list(hooks or ())
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retry = retry
+        self.breakers = breakers
+        self.hedger = hedger
+        self.archive = archive
+
     def _request_parameters(self, params):
 
         """
@@ -99,150 +414,734 @@ class AmazonAPI(object):
 
         return params
 
-    def _build_url(self, params):
+    def _build_url(self, host, params):
 
         """
             Receives a dictionary with the necessary parameters to make a
             request to the Amazon API and returns a url to be used to make
             the request to amazon. Alse here the params are sorted.
 
+            :param  host: String, amazon host name the request goes to.
             :param  params: dictionary, with request parameters
 
             :rType: String
         """
 
-        # Convert to string and sort params
-        string_params = ['%s=%s' % (key, quote(unicode(val).encode('utf-8'),
-                                    safe='~'))
-                         for key, val
-                         in params.iteritems()]
-        sorted_params = sorted(string_params)
-
-        params = '&'.join(sorted_params)
+        params = self._canonical_query(params)
 
-        signature = self._sign(params)
+        signature = self._sign(host, params)
 
-        url = 'http://%s/%s?%s&Signature=%s' % (self._host,
+        url = 'http://%s/%s?%s&Signature=%s' % (host,
                                                 self._resource,
                                                 params,
                                                 signature)
 
         return url
 
-    def _sign(self, params):
+    def _canonical_query(self, params):
+
+        """
+            Receives a dictionary with request parameters and returns them
+            quoted and sorted as the query string to be signed.
+
+            :param  params: dictionary, with request parameters
+
+            :rType: String
+        """
+
+        return self._signer.canonical_query(params)
+
+    def _sign(self, host, params):
 
         """
             Receives a String with the parameters to make a request ready
             to be signed and returns a signature to be used as the last
             parameter to be added to the request url.
 
+            :param host: String, amazon host name the request goes to.
             :param params: String
 
             :rType: String
         """
-        # Build string to sign
-        string_to_sign = 'GET'
-        string_to_sign += '\n%s' % self._host
-        string_to_sign += '\n/%s' % self._resource
-        string_to_sign += '\n%s' % params
+        return self._signer.sign(host, params)
 
-        # Get signature
-        digest = hmac.new(self.secret_key, string_to_sign, sha256).digest()
-        signature = quote(b64encode(digest))
+    def _parse(self, content, raw=False):
 
-        return signature
+        """
+            Parses the XML content of a response with the parser chosen for
+            this client.
 
-    def _check_response(self, xml_content):
+            :param raw: Boolean, if True content with no <Error> is returned
+                        as it is, only errors need a tree to be read.
 
-        try:
-            error_code = xml_content.Errors.Error.Code.string
-            error_msg = xml_content.Errors.Error.Message.string
+            :rType: BeautifulSoup XML Object or lxml_parser.XMLDocument
+        """
+
+        if raw and '<Error>' not in content:
+            return content
 
-            if error_code == 'InternalError':
-                raise AmazonAPIResponseError(error_msg)
+        if self.parser == 'lxml':
+            return lxml_parser.parse(content)
+
+        return BeautifulSoup(content, "xml")
+
+    def _error_code(self, xml_content):
+
+        """
+            Returns the code of the first error in xml_content, None if the
+            response has no errors.
+        """
 
-            if error_code == 'InvalidClientTokenId':
-                raise AmazonAPIResponseError(error_msg)
+        if isinstance(xml_content, basestring):
+            return None
 
-            if error_code == 'MissingClientTokenId':
-                raise AmazonAPIResponseError(error_msg)
+        error = xml_content.find('Error')
 
-            if error_code == 'AWS.MissingParameters':
-                raise AmazonAPIResponseError(error_msg)
+        if error is None or error.Code is None:
+            return None
 
-            if error_code == 'RequestThrottled':
-                raise AmazonAPIResponseError(error_msg)
+        return error.Code.string
 
-            if error_code == 'Deprecated':
-                raise AmazonAPIResponseError(error_msg)
+    def _is_cacheable(self, xml_content):
 
-            if error_code == 'AWS.ECommerceService.NoExactMatches':
-                raise AmazonAPIResponseError(error_msg)
+        """
+            Responses failed for transient reasons must not be cached, the
+            same request may well succeed when retried.
+        """
 
-            if error_code == 'AWS.ECommerceService.NoExactMatches':
-                raise AmazonAPIResponseError(error_msg)
+        return self._error_code(xml_content) not in TRANSIENT_ERRORS
 
-            if error_code == 'AWS.ECommerceService.NoSimilarities':
-                raise AmazonAPIResponseError(error_msg)
+    def _check_response(self, xml_content, status=None):
 
-            if error_code == 'AWS.InvalidEnumeratedParameter':
-                raise AmazonAPIResponseError(error_msg)
+        """
+            Raises the first error of xml_content as the exception its code
+            maps to in RESPONSE_ERRORS, or returns xml_content if it has no
+            errors.
 
-            if error_code == 'AWS.InvalidParameterValue':
-                raise AmazonAPIResponseError(error_msg)
+            :param status: Integer, HTTP status of the response, None for
+                           a 200.
+        """
 
-            if error_code == 'AWS.RestrictedParameterValueCombination':
-                raise AmazonAPIResponseError(error_msg)
+        # Raw content is only left unparsed when it has no errors
+        if isinstance(xml_content, basestring):
+            return xml_content
 
-            if error_code == 'AccountLimitExceeded':
-                raise AmazonAPIResponseError(error_msg)
+        error = xml_content.find('Error')
 
-        except AttributeError:
+        if error is None or error.Code is None:
             return xml_content
 
-    def _call(self, params):
+        message = error.Message.string if error.Message is not None else None
+
+        raise response_error(error.Code.string, message, status=status)
+
+    def _call(self, host, params, check=True, raw=False):
 
         """
-            Receives a dictionary with the params for the request.
-            Gets a url and then makes a call to the amazon advertising
-            API which sends back a http response with XML content to
-            be consumed.
+            Receives a host and a dictionary with the params for the
+            request. Gets a url and then makes a call to the amazon
+            advertising API which sends back a http response with XML
+            content to be consumed.
 
+            :param  host: String, host key (i.e: us)
             :param  params: dictionary, with request parameters
+            :param  check: Boolean, if False errors inside the XML content
+                           are left for the caller to inspect instead of
+                           raising AmazonAPIResponseError.
+            :param  raw: Boolean, if True a response with no errors is
+                         returned as the raw XML String, unparsed, for
+                         callers extracting from it on their own.
 
             :rType: BeautifulSoup XML Object
         """
 
-        # Prepare params for request
+        host_name, request_url, cache_entry, metrics = \
+            self._prepare(host, params)
+
+        return self._fetch(host_name, request_url, check, cache_entry,
+                           metrics, raw)
+
+    def _prepare(self, host, params):
+
+        """
+            Signs the request for params on host, the first half of _call,
+            for callers that fetch it later or in another thread. The host
+            travels with the request, nothing is stored on the client, so
+            any number of threads can sign at once.
+
+            :param  host: String, host key (i.e: us)
+            :param  params: dictionary, with request parameters, completed
+                            in place by _request_parameters.
+
+            :rType: Tuple, (host name, signed url, cache entry, metrics)
+                    to be given to _fetch.
+        """
+
+        host_name = self._host_name(host)
+        metrics = self._metrics(host_name, params)
+
         request_params = self._request_parameters(params)
-        request_url = self._build_url(request_params)
+        if metrics is not None:
+            metrics.mark('params')
+
+        cache_entry = self._cache_entry(host_name, request_params)
+        request_url = self._build_url(host_name, request_params)
+        if metrics is not None:
+            metrics.mark('sign')
+
+        return host_name, request_url, cache_entry, metrics
+
+    def add_hook(self, hook):
+
+        """
+            Registers hook to be called with the metrics.CallMetrics of
+            every call from now on.
+        """
+
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _metrics(self, host, params):
+
+        """
+            Returns the CallMetrics to fill for a call, None when nobody is
+            listening so untimed calls pay a single check per phase.
+        """
+
+        if not self.hooks:
+            return None
+
+        return CallMetrics(host, params.get('Operation'))
+
+    def _emit(self, metrics):
+
+        metrics.finish()
+
+        # A broken hook must never fail, or change the outcome of, a call
+        for hook in self.hooks:
+            try:
+                hook(metrics)
+            except Exception:
+                logger.exception("Metrics hook %r failed", hook)
+
+    def _cache_entry(self, host, params):
+
+        """
+            Returns the (key, ttl) under which the response to params is
+            cached, None if this client has no cache.
+        """
+
+        if self.cache is None:
+            return None
+
+        key = self.cache.key(host, self._canonical_query(params))
+
+        return key, self.cache.ttl(params)
+
+    def _fetch(self, host, request_url, check=True, cache_entry=None,
+               metrics=None, raw=False):
+
+        """
+            Makes the request to an already signed url and parses the XML
+            content of the response. Split from _call so the network and
+            parsing work can run apart from signing.
+
+            :param  host: String, amazon host name the url was signed for.
+            :param  request_url: String, signed url.
+            :param  check: Boolean, see _call.
+            :param  cache_entry: Tuple, (key, ttl) from _cache_entry.
+            :param  metrics: CallMetrics, filled in and handed to the hooks
+                             when the call is over. None to skip timing.
+            :param  raw: Boolean, see _call.
 
-        # Make request to Amazon's API
-        response = requests.get(request_url)
-        xml_content = BeautifulSoup(response.content, "xml")
+            :rType: BeautifulSoup XML Object
+        """
+
+        try:
+            return self._fetch_response(host, request_url, check, cache_entry,
+                                        metrics, raw)
+        except Exception as e:
+            if metrics is not None:
+                metrics.error = e
+            raise
+        finally:
+            if metrics is not None:
+                self._emit(metrics)
+
+    def _fetch_response(self, host, request_url, check, cache_entry,
+                        metrics, raw):
+
+        if self.archive is not None and self.archive.mode == 'replay':
+            return self._replay(host, request_url, check, metrics, raw)
+
+        if cache_entry is not None:
+            content = self.cache.get(cache_entry[0])
+            if metrics is not None:
+                metrics.mark('cache')
+
+            if content is not None:
+                xml_content = self._parse(content, raw)
+                if metrics is not None:
+                    metrics.mark('parse')
+                    metrics.cached = True
+                    metrics.bytes = len(content)
+
+                if check:
+                    xml_content = self._check_response(xml_content)
+                    if metrics is not None:
+                        metrics.mark('check')
+                return xml_content
+
+        deadline = time() + self.deadline if self.deadline else None
+        attempt = 0
+
+        while True:
+            try:
+                response, xml_content = self._attempt(host, request_url,
+                                                      deadline, metrics, raw)
+            except requests.RequestException:
+                # Network error or timeout
+                if not self._backoff(attempt, deadline, metrics):
+                    raise
+            else:
+                # Some retryable errors come in a 200 response
+                status = response.status_code
+                error_code = self._error_code(xml_content)
+                if (status == 200 and error_code is None) or \
+                        not self._backoff(attempt, deadline, metrics, status,
+                                          error_code):
+                    break
+
+            attempt += 1
 
         # Raise error in case for HTTP Status code different from 200
         if response.status_code == 200:
+            if self.archive is not None:
+                self.archive.record(host, request_url.split('?', 1)[1],
+                                    response.content)
+
+            if cache_entry is not None and self._is_cacheable(xml_content):
+                self.cache.set(cache_entry[0], response.content,
+                               cache_entry[1])
+
             # Check if response has errors, if it does raise exception.
-            xml_content = self._check_response(xml_content)
+            if check:
+                xml_content = self._check_response(xml_content)
+                if metrics is not None:
+                    metrics.mark('check')
             return xml_content
         else:
-            # TODO: Log response message from the server here.
+            # Amazon sends some errors (i.e: InternalError, RequestThrottled)
+            # with a 4xx/5xx status, raise them typed all the same
+            self._check_response(xml_content, response.status_code)
             response.raise_for_status()
 
-    def _set_host(self, host):
+    def _replay(self, host, request_url, check, metrics, raw=False):
+
+        """
+            Answers a call with its recorded response, without any network
+            access.
+        """
+
+        content = self.archive.get(host, request_url.split('?', 1)[1])
+        if content is None:
+            raise ArchiveMissError("No recorded response for %s" %
+                                   request_url.split('&Signature=')[0])
+
+        xml_content = self._parse(content, raw)
+        if metrics is not None:
+            metrics.mark('parse')
+            metrics.bytes = len(content)
+
+        if check:
+            xml_content = self._check_response(xml_content)
+            if metrics is not None:
+                metrics.mark('check')
+
+        return xml_content
+
+    def _attempt(self, host, request_url, deadline, metrics, raw=False):
+
+        """
+            Makes one attempt of a call through the circuit breaker of
+            host, and parses its response.
+
+            :rType: Tuple, (requests.Response, XML Object)
+        """
+
+        if deadline is not None and deadline <= time():
+            raise DeadlineExceededError("Deadline exceeded before calling %s"
+                                        % host)
+
+        # Wait for a free slot in the request budget of this credential,
+        # unless it only comes after the deadline. Done before the breaker
+        # is asked: running out of budget says nothing about the host
+        if self.rate_limiter is not None:
+            waited = self.rate_limiter.acquire(self.aws_access_key, host,
+                                               deadline)
+            if metrics is not None:
+                metrics.mark('rate_limit')
+            if waited is None:
+                raise DeadlineExceededError("Deadline exceeded waiting for "
+                                            "the budget of %s" % host)
+
+        timeout = self.timeout
+        if deadline is not None:
+            left = deadline - time()
+            if left <= 0:
+                raise DeadlineExceededError("Deadline exceeded before "
+                                            "calling %s" % host)
+            timeout = left if timeout is None else min(timeout, left)
+
+        breaker = None
+        if self.breakers is not None:
+            breaker = self.breakers.breaker(host)
+            if not breaker.allow():
+                raise CircuitOpenError("Circuit open for %s" % host)
+
+        # The breaker hears about every attempt it let through, whatever
+        # ends it, or a trial call could leave it half open for good
+        resolved = False
+
+        try:
+            # Make request to Amazon's API
+            if self.hedger is not None:
+                response = self._hedged_get(host, request_url, timeout,
+                                            metrics)
+            else:
+                response = self._get(host, request_url, timeout)
+
+            if metrics is not None:
+                metrics.mark('http')
+                metrics.attempts += 1
+                metrics.status = response.status_code
+                metrics.bytes = len(response.content)
+
+            xml_content = self._parse(response.content, raw)
+            error_code = self._error_code(xml_content)
+            if metrics is not None:
+                metrics.mark('parse')
+                metrics.error_code = error_code
+
+            throttled = (response.status_code == 503 or
+                         error_code in THROTTLE_ERRORS)
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.feedback(self.aws_access_key, host,
+                                           throttled)
+
+            # Throttling is about the credential, not the health of the host
+            if breaker is not None and (response.status_code < 500 or
+                                        throttled):
+                breaker.succeeded()
+                resolved = True
+        finally:
+            if breaker is not None and not resolved:
+                breaker.failed()
+
+        return response, xml_content
+
+    def _backoff(self, attempt, deadline, metrics, status=None,
+                 error_code=None):
+
+        """
+            Waits before retrying a failed attempt.
+
+            :param attempt: Integer, 0 for the first attempt.
+            :param status: Integer, HTTP status, None for network errors.
+
+            :rType: Boolean, False if the call mustn't be retried.
+        """
+
+        if self.retry is None or attempt + 1 >= self.retry.max_attempts:
+            return False
+
+        if not self.retry.retryable(status, error_code):
+            return False
+
+        delay = self.retry.delay(attempt)
+
+        if deadline is not None and time() + delay >= deadline:
+            return False
+
+        sleep(delay)
+        if metrics is not None:
+            metrics.mark('backoff')
+
+        return True
+
+    def _get(self, host, request_url, timeout):
+
+        if self._session_pool is not None:
+            return self._session_pool.get(host, request_url, timeout=timeout)
+
+        return requests.get(request_url, timeout=timeout)
+
+    def _hedged_get(self, host, request_url, timeout, metrics=None):
+
+        """
+            GET that sends a duplicate request once the first one has been
+            waiting longer than the delay of the hedger, and returns the
+            first response. Raises the error of the last request to fail
+            when both do.
+        """
+
+        hedge_delay = self.hedger.delay()
+        started = time()
+
+        if hedge_delay is None:
+            response = self._get(host, request_url, timeout)
+            self.hedger.observe(time() - started)
+            return response
+
+        results = Queue()
+
+        def get(hedge):
+            try:
+                if hedge and self.rate_limiter is not None:
+                    self.rate_limiter.acquire(self.aws_access_key, host)
+                results.put((hedge, self._get(host, request_url, timeout),
+                             None))
+            except Exception as e:
+                results.put((hedge, None, e))
+
+        def start(hedge):
+            thread = threading.Thread(target=get, args=(hedge,))
+            thread.daemon = True
+            thread.start()
+
+        start(False)
+        requests_left = 1
+
+        try:
+            hedge, response, error = results.get(timeout=hedge_delay)
+        except Empty:
+            # Slower than usual, race a duplicate against it
+            start(True)
+            requests_left = 2
+            hedge, response, error = results.get()
+            self.hedger.hedged(won=hedge and error is None)
+            if metrics is not None:
+                metrics.hedged = True
+
+        if error is not None and requests_left == 2:
+            hedge, response, error = results.get()
+
+        if error is not None:
+            raise error
+
+        self.hedger.observe(time() - started)
+
+        return response
+
+    def _lookup_many(self, host, chunks, params, ordered, workers):
+
+        pool = ThreadPool(workers)
+
+        try:
+            lookup = lambda chunk: self._lookup_chunk(host, chunk, params)
+
+            if ordered:
+                results = pool.imap(lookup, chunks)
+            else:
+                results = pool.imap_unordered(lookup, chunks)
+
+            for chunk_results in results:
+                for result in chunk_results:
+                    yield result
+        finally:
+            pool.terminate()
+
+    def _chunk_ids(self, ids):
+
+        """
+            Drops duplicated ids and groups the rest in lists of at most
+            MAX_ITEM_IDS, keeping the input order.
+        """
+
+        seen = set()
+        chunk = list()
+
+        for item_id in ids:
+            if item_id in seen:
+                continue
+
+            seen.add(item_id)
+            chunk.append(item_id)
+
+            if len(chunk) == MAX_ITEM_IDS:
+                yield chunk
+                chunk = list()
+
+        if chunk:
+            yield chunk
+
+    def _batch(self, host, item_ids, params, keyed=True):
+
+        """
+            Makes one request for item_ids and splits its errors among the
+            ItemIds they name. An error naming none is about the request,
+            it fails the ItemIds left without an Item (keyed, for
+            ItemLookup) or every ItemId when no Item came back at all.
+
+            :rType: BatchResult
+        """
+
+        params = dict(params)
+        params['ItemId'] = ','.join(item_ids)
+
+        try:
+            xml_content = self._call(host, params, check=False)
+        except (AmazonAPIError, AmazonAPIResponseError,
+                requests.RequestException) as e:
+            return BatchResult(item_ids, errors=dict((item_id, e)
+                                                     for item_id in item_ids))
+
+        items = list()
+        if xml_content.Items is not None:
+            items = xml_content.Items.find_all('Item', recursive=False)
+
+        errors = dict()
+        request_error = None
+
+        for error in xml_content.find_all('Error'):
+            code = error.Code.string if error.Code is not None else None
+            message = (error.Message.string if error.Message is not None
+                       else None)
+            words = set(re.findall(r'[\w-]+', message or ''))
+            named_ids = [item_id for item_id in item_ids if item_id in words]
+
+            for item_id in named_ids:
+                errors[item_id] = _batch_error(code, message, item_id)
+
+            if not named_ids:
+                request_error = _batch_error(code, message)
+
+        if keyed:
+            found = set(item.ASIN.string for item in items)
+
+            for item_id in item_ids:
+                if item_id in found:
+                    errors.pop(item_id, None)
+                elif item_id not in errors:
+                    errors[item_id] = request_error or AmazonAPIResponseError(
+                        "No item returned for ItemId %s" % item_id,
+                        item_id=item_id)
+
+        elif request_error is not None and not items:
+            for item_id in item_ids:
+                errors.setdefault(item_id, request_error)
+
+        return BatchResult(item_ids, xml_content, items, errors)
+
+    def _batch_ids(self, host, item_ids):
+
+        self._host_name(host)
+
+        item_ids = list(item_ids)
+        if not 1 <= len(item_ids) <= MAX_ITEM_IDS:
+            raise AmazonAPIError("Between 1 and %d ItemIds can be looked up "
+                                 "at once" % MAX_ITEM_IDS)
+
+        return item_ids
+
+    def _lookup_chunk(self, host, chunk, params):
+
+        """
+            Makes one ItemLookup on host for the ids in chunk and splits the
+            response into a list of (id, item, error) tuples in chunk order.
+        """
+
+        result = self._batch(host, chunk, params)
+        items = dict((item.ASIN.string, item) for item in result.items)
+
+        return [(item_id, items.get(item_id), result.errors.get(item_id))
+                for item_id in chunk]
+
+    def _iter_pages(self, host, params, max_items, prefetch):
+
+        """
+            Yields the Items of every page of an ItemSearch. The first page
+            tells how many pages there are, the following ones are requested
+            up to `prefetch` pages ahead of the one being consumed.
+        """
+
+        first_page = int(params.get('ItemPage', 1))
+
+        response = self._call(host, dict(params, ItemPage=first_page))
+
+        total_pages = 1
+        if response.Items.TotalPages is not None:
+            total_pages = int(response.Items.TotalPages.string)
+
+        if params.get('SearchIndex') == 'All':
+            last_page = min(total_pages, MAX_ALL_INDEX_PAGES)
+        else:
+            last_page = min(total_pages, MAX_ITEM_PAGES)
+
+        if max_items is not None:
+            pages = int(ceil(max_items / float(ITEMS_PER_PAGE)))
+            last_page = min(last_page, first_page + pages - 1)
+
+        pool = ThreadPool(prefetch) if prefetch else None
+        pending = deque()
+        next_page = first_page + 1
+        count = 0
+
+        try:
+            while True:
+                # Keep the next pages coming while this one is consumed
+                while pool and next_page <= last_page and \
+                        len(pending) < prefetch:
+                    page_params = dict(params, ItemPage=next_page)
+                    pending.append(pool.apply_async(self._call,
+                                                    (host, page_params)))
+                    next_page += 1
+
+                for item in response.Items.find_all('Item', recursive=False):
+                    if max_items is not None and count >= max_items:
+                        return
+
+                    yield item
+                    count += 1
+
+                if pending:
+                    response = pending.popleft().get()
+                elif next_page <= last_page:
+                    response = self._call(host, dict(params,
+                                                     ItemPage=next_page))
+                    next_page += 1
+                else:
+                    return
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def close(self):
+
+        """
+            Closes the pooled connections held by this client, if any.
+        """
+
+        if self._session_pool is not None:
+            self._session_pool.close()
+
+    def _host_name(self, host):
 
         """
             Invoked when performing an Operation on the AmazonAPI, raises a
             customized AmazonAPIError, if host isn't none it checks the correct
-            if the host is valid, if not it raises an exception.
+            if the host is valid, if not it raises an exception. Returns the
+            amazon host name of host.
         """
 
         if not host:
             raise AmazonAPIError("Host cannot be null/empty")
 
         elif host in HOSTS:
-            self._host = HOSTS[host]
+            return HOSTS[host]
 
         else:
             err_msg = "Invalid host, host must be: ca, cn, de, es, fr, it, \
@@ -290,11 +1189,163 @@ class AmazonAPI(object):
 
        """
 
-        self._set_host(host)
+        kwargs['Operation'] = 'ItemLookup'
+
+        return self._call(host, kwargs)
+
+    def item_lookup_many(self, host=None, asins=(), ordered=True, workers=4,
+                         **kwargs):
+
+        """
+            Looks up any number of ASINs. Duplicates are dropped, the rest
+            are packed in ItemLookup requests of MAX_ITEM_IDS each which run
+            on a pool of workers. Results are yielded as they come back, one
+            (asin, item, error) tuple per ASIN: item is the BeautifulSoup
+            <Item> of the ASIN or None, error is None or the exception that
+            kept the ASIN from being found. An invalid ASIN or a failed
+            request only fails the ASINs involved, never the whole batch.
+
+            :param host: String, amazon base URL where the call will be made.
+            :param asins: Iterable, ASINs to lookup.
+            :param ordered: Boolean, yield in input order if True, or in
+                            order of completion if False.
+            :param workers: Integer, max requests in flight at once.
+            :param kwargs: dictionary, with extra ItemLookup parameters
+                           (i.e: ResponseGroup), ItemId is set here.
+
+            :rType: generator of (String, BeautifulSoup Tag, Exception)
+        """
+
+        # Checked now rather than when the first result is asked for
+        self._host_name(host)
+
+        kwargs['Operation'] = 'ItemLookup'
+
+        return self._lookup_many(host, self._chunk_ids(asins), kwargs,
+                                 ordered, workers)
+
+    def item_lookup_batch(self, host=None, item_ids=(), **kwargs):
+
+        """
+            ItemLookup of up to MAX_ITEM_IDS ItemIds that keeps the Items
+            found when some of the ItemIds fail, instead of raising for the
+            whole response. Each failed ItemId gets its own error, with its
+            retryable flag, so only the ones worth it are looked up again:
+
+            >>> result = amz.item_lookup_batch('us', asins)
+            >>> retry = result.failed_ids(retryable=True)
+
+            :param host: String, amazon base URL where the call will be made.
+            :param item_ids: Iterable, ItemIds to lookup.
+            :param kwargs: dictionary, with extra ItemLookup parameters
+                           (i.e: ResponseGroup), ItemId is set here.
+
+            :rType: BatchResult
+        """
+
+        return self._batch(host, self._batch_ids(host, item_ids),
+                           dict(kwargs, Operation='ItemLookup'))
+
+    def item_fields(self, host=None, fields=(), operation='ItemLookup',
+                    **kwargs):
+
+        """
+            Calls operation with the smallest ResponseGroup returning fields
+            and extracts only them, skipping the rest of the XML:
+
+            >>> amz.item_fields('us', ['Title', 'LowestNewPrice', 'SalesRank'],
+            ...                 ItemId='B00KC6I06S')
+            [Item(asin='B00KC6I06S', parent_asin=None)]
+
+            :param host: String, amazon base URL where the call will be made.
+            :param fields: Iterable, Item fields (i.e: lowest_new_price) or
+                           element names (i.e: LowestNewPrice).
+            :param operation: String, ItemLookup, ItemSearch or
+                              SimilarityLookup.
+            :param kwargs: dictionary, with request parameters, ResponseGroup
+                           is set here.
+
+            :rType: List, of models.Item with only fields set.
+        """
+
+        try:
+            projection = Projection(fields, operation)
+        except ValueError as e:
+            raise AmazonAPIError(str(e))
+
+        kwargs['Operation'] = operation
+        kwargs['ResponseGroup'] = projection.response_group
+
+        # Only the fields are read, from the raw XML
+        return list(projection.extract(self._call(host, kwargs, raw=True)))
+
+    def lookup_across_markets(self, asins=(), markets=None, timeout=None,
+                              workers=2, **kwargs):
+
+        """
+            Looks up the same ASINs in several marketplaces at once. Every
+            market gets its own workers, and its own rate limiter bucket, so
+            the call takes about as long as the slowest market rather than
+            the sum of them. A market that fails, or is still busy when
+            timeout runs out, only fails its own results.
+
+            :param asins: Iterable, ASINs to lookup.
+            :param markets: Iterable, host keys (i.e: us, uk), every one of
+                            HOSTS if None.
+            :param timeout: Float, seconds to wait for the markets. Lookups
+                            not back by then get a DeadlineExceededError.
+                            None waits for every market.
+            :param workers: Integer, max requests in flight per market.
+            :param kwargs: dictionary, with extra ItemLookup parameters
+                           (i.e: ResponseGroup), ItemId is set here.
+
+            :rType: dictionary, of ASIN to a dictionary of market to
+                    (item, error), as the tuples of item_lookup_many.
+        """
+
+        markets = sorted(HOSTS) if markets is None else list(markets)
+
+        for market in markets:
+            self._host_name(market)
 
         kwargs['Operation'] = 'ItemLookup'
 
-        return self._call(kwargs)
+        chunks = list(self._chunk_ids(asins))
+        results = dict((asin, dict()) for chunk in chunks for asin in chunk)
+
+        if not chunks or not markets:
+            return results
+
+        stop = time() + timeout if timeout is not None else None
+        pools = dict((market, ThreadPool(workers)) for market in markets)
+
+        try:
+            pending = [(market, chunk,
+                        pools[market].apply_async(self._lookup_chunk,
+                                                  (market, chunk, kwargs)))
+                       for market in markets for chunk in chunks]
+
+            for market, chunk, result in pending:
+                try:
+                    if stop is None:
+                        chunk_results = result.get()
+                    else:
+                        chunk_results = result.get(max(0, stop - time()))
+                except TimeoutError:
+                    error = DeadlineExceededError(
+                        "No answer from %s within %s seconds" % (market,
+                                                                 timeout))
+                    chunk_results = [(asin, None, error) for asin in chunk]
+
+                for asin, item, error in chunk_results:
+                    results[asin][market] = (item, error)
+        finally:
+            # terminate() takes a tenth of a second per pool, the lookups
+            # still running past timeout are left to end in the background.
+            for pool in pools.values():
+                pool.close()
+
+        return results
 
     def item_search(self, host=None, **kwargs):
 
@@ -357,11 +1408,39 @@ class AmazonAPI(object):
 
         """
 
-        self._set_host(host)
+        kwargs['Operation'] = 'ItemSearch'
+
+        return self._call(host, kwargs)
+
+    def iter_item_search(self, host=None, max_items=None,
+                         prefetch=MAX_ITEM_PAGES - 1, **kwargs):
+
+        """
+            Same as item_search, but yields the Items of every result page
+            instead of returning the first page. TotalPages is read from the
+            first response, and no page past the cap of the API is
+            requested (10 pages, 5 for the All SearchIndex). While a page is
+            being consumed the next ones are already being fetched, so a
+            whole search takes about as long as its slowest page.
+
+            :param host: String, amazon base URL where the call will be made.
+            :param max_items: Integer, stop after this many items, and never
+                              request pages past them. None for all items.
+            :param prefetch: Integer, pages requested ahead of the one being
+                             consumed, all at once. 0 fetches the pages one
+                             by one as they are needed.
+            :param kwargs: dictionary, with ItemSearch request parameters,
+                           ItemPage sets the first page.
+
+            :rType: generator of BeautifulSoup Tag, one per Item
+        """
+
+        # Checked now rather than when the first item is asked for
+        self._host_name(host)
 
         kwargs['Operation'] = 'ItemSearch'
 
-        return self._call(kwargs)
+        return self._iter_pages(host, kwargs, max_items, prefetch)
 
     def similarity_lookup(self, host=None, **kwargs):
 
@@ -403,11 +1482,28 @@ class AmazonAPI(object):
 
      """
 
-        self._set_host(host)
-
         kwargs['Operation'] = 'SimilarityLookup'
 
-        return self._call(kwargs)
+        return self._call(host, kwargs)
+
+    def similarity_lookup_batch(self, host=None, item_ids=(), **kwargs):
+
+        """
+            SimilarityLookup of up to MAX_ITEM_IDS ItemIds that keeps the
+            similar Items found when some of the ItemIds fail (i.e: have no
+            similar items), instead of raising for the whole response.
+
+            :param host: String, amazon base URL where the call will be made.
+            :param item_ids: Iterable, ItemIds to find similar items of.
+            :param kwargs: dictionary, with extra SimilarityLookup
+                           parameters, ItemId is set here.
+
+            :rType: BatchResult, whose items are the similar Items.
+        """
+
+        return self._batch(host, self._batch_ids(host, item_ids),
+                           dict(kwargs, Operation='SimilarityLookup'),
+                           keyed=False)
 
     def node_browse_lookup(self, host=None, browse_node_id=None,
                            response_group=None):
@@ -451,7 +1547,6 @@ class AmazonAPI(object):
 
         """
 
-        self._set_host(host)
         params = dict()
         params['Operation'] = 'BrowseNodeLookup'
 
@@ -463,4 +1558,4 @@ class AmazonAPI(object):
             if response_group is not None:
                 params['ResponseGroup'] = response_group
 
-        return self._call(params)
+        return self._call(host, params)
@@ -0,0 +1,379 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import sqlite3
+import threading
+import multiprocessing
+from time import time
+from hashlib import sha1
+from urllib import unquote
+
+# Params left out of the archive key and of the archived params: they
+# change on every call, or tell who made it rather than what was asked.
+IGNORED_PARAMS = ('AWSAccessKeyId', 'Signature', 'Timestamp')
+
+MODES = ('record', 'replay')
+
+# Bytes after which a new segment is started
+SEGMENT_SIZE = 256 * 1024 * 1024
+
+# Every record starts with MAGIC and the length of its compressed payload
+MAGIC = 'AMZ1'
+HEADER = struct.Struct('<4sI')
+
+# Index entries handed to a reprocessing worker at once
+REPROCESS_BATCH = 500
+
+
+class ArchivedResponse(object):
+
+    """
+        A response read back from a ResponseArchive.
+    """
+
+    __slots__ = ('host', 'params', 'recorded', 'content')
+
+    def __init__(self, host, params, recorded, content):
+
+        """
+            :param host: String, amazon host name the request went to.
+            :param params: dictionary, request params but IGNORED_PARAMS.
+            :param recorded: Float, timestamp of the response.
+            :param content: String, raw XML of the response.
+        """
+
+        self.host = host
+        self.params = params
+        self.recorded = recorded
+        self.content = content
+
+    def __repr__(self):
+        return 'ArchivedResponse(%s, %s, %d bytes)' % (
+            self.host, self.params.get('Operation'), len(self.content))
+
+
+class ResponseArchive(object):
+
+    """
+        Append-only store of the raw responses of a client, so they can be
+        parsed again later without calling Amazon.
+
+        Responses are zlib compressed one by one and appended to segment
+        files of at most segment_size bytes. An SQLite index maps every
+        request, told apart by host and canonical params, to the position
+        of its latest response. Segments are read through mmap, so
+        reading back a response, or all of them, loads only what is read.
+
+        In 'record' mode AmazonAPI appends every response it gets. In
+        'replay' mode it answers every call from the archive and never goes
+        to the network: a request that was never recorded raises
+        ArchiveMissError.
+    """
+
+    def __init__(self, path, mode='record', segment_size=SEGMENT_SIZE,
+                 compression=6, timeout=30):
+
+        """
+            :param path: String, directory of the segments and index.
+            :param mode: String, 'record' or 'replay'.
+            :param segment_size: Integer, bytes per segment.
+            :param compression: Integer, zlib level from 1 to 9.
+            :param timeout: Integer, seconds to wait on a locked index.
+        """
+
+        if mode not in MODES:
+            raise ValueError("Invalid mode, mode must be: %s" %
+                             ', '.join(MODES))
+
+        self.path = path
+        self.mode = mode
+        self.segment_size = segment_size
+        self.compression = compression
+        self.timeout = timeout
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._segment = None
+        self._output = None
+        # Segment number to its mmap
+        self._maps = dict()
+
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS segments ("
+                       " segment INTEGER PRIMARY KEY AUTOINCREMENT,"
+                       " created REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                       " key TEXT PRIMARY KEY,"
+                       " host TEXT NOT NULL,"
+                       " operation TEXT,"
+                       " segment INTEGER NOT NULL,"
+                       " offset INTEGER NOT NULL,"
+                       " length INTEGER NOT NULL,"
+                       " recorded REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_position"
+                       " ON responses (segment, offset)")
+
+    def _connection(self):
+
+        # sqlite3 connections can't be shared between threads
+        db = getattr(self._local, 'db', None)
+
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.path, 'index.db'),
+                                 timeout=self.timeout)
+            self._local.db = db
+
+        return db
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, '%08d.seg' % segment)
+
+    def key(self, host, query):
+
+        """
+            :param host: String, amazon host name.
+            :param query: String, canonical query string of the request,
+                          signed or not.
+
+            :rType: String
+        """
+
+        return sha1('%s?%s' % (host, '&'.join(_params(query)))).hexdigest()
+
+    def record(self, host, query, content):
+
+        """
+            Appends content as the latest response to the request of query
+            on host. The segment is written before the index, so a crash in
+            between leaves unindexed bytes, never an index entry pointing
+            nowhere.
+
+            :param content: String, raw XML of the response.
+        """
+
+        now = time()
+        params = dict((name, unquote(value)) for name, value in
+                      (param.split('=', 1) for param in _params(query)))
+        meta = json.dumps(dict(host=host, params=params, recorded=now),
+                          sort_keys=True)
+        payload = zlib.compress(meta + '\n' + content, self.compression)
+
+        with self._lock:
+            if (self._output is None or
+                    self._output.tell() + len(payload) > self.segment_size):
+                self._start_segment()
+
+            self._output.write(HEADER.pack(MAGIC, len(payload)))
+            offset = self._output.tell()
+            self._output.write(payload)
+            self._output.flush()
+            segment = self._segment
+
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO responses"
+                       " (key, host, operation, segment, offset, length,"
+                       "  recorded) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (self.key(host, query), host, params.get('Operation'),
+                        segment, offset, len(payload), now))
+
+    def _start_segment(self):
+
+        # Numbered by the index, so processes recording to the same
+        # archive never append to the same segment
+        with self._connection() as db:
+            segment = db.execute("INSERT INTO segments (created) VALUES (?)",
+                                 (time(),)).lastrowid
+
+        if self._output is not None:
+            self._output.close()
+
+        self._output = open(self._segment_path(segment), 'ab')
+        self._segment = segment
+
+    def get(self, host, query):
+
+        """
+            :rType: String, raw XML of the latest response to the request
+                    of query on host, None if it was never recorded.
+        """
+
+        row = self._connection().execute(
+            "SELECT segment, offset, length FROM responses WHERE key = ?",
+            (self.key(host, query),)).fetchone()
+
+        if row is None:
+            return None
+
+        return self.read(*row).content
+
+    def read(self, segment, offset, length):
+
+        """
+            :rType: ArchivedResponse, stored at offset of segment.
+        """
+
+        with self._lock:
+            segment_map = self._maps.get(segment)
+
+            if segment_map is None or offset + length > len(segment_map):
+                # Not mapped yet, or grown since it was
+                if segment_map is not None:
+                    segment_map.close()
+
+                with open(self._segment_path(segment), 'rb') as source:
+                    segment_map = mmap.mmap(source.fileno(), 0,
+                                            access=mmap.ACCESS_READ)
+                self._maps[segment] = segment_map
+
+            payload = segment_map[offset:offset + length]
+
+        meta, content = zlib.decompress(payload).split('\n', 1)
+        meta = json.loads(meta)
+
+        return ArchivedResponse(meta['host'], meta['params'],
+                                meta['recorded'], content)
+
+    def entries(self, operation=None):
+
+        """
+            Positions of the latest responses, in segment order, so reading
+            them goes through every segment once, front to back.
+
+            :param operation: String, only the responses to this Operation.
+
+            :rType: generator of (segment, offset, length)
+        """
+
+        if operation is None:
+            cursor = self._connection().execute(
+                "SELECT segment, offset, length FROM responses"
+                " ORDER BY segment, offset")
+        else:
+            cursor = self._connection().execute(
+                "SELECT segment, offset, length FROM responses"
+                " WHERE operation = ? ORDER BY segment, offset", (operation,))
+
+        for row in cursor:
+            yield row
+
+    def responses(self, operation=None):
+
+        """
+            :rType: generator of ArchivedResponse, the latest of every
+                    request.
+        """
+
+        for entry in self.entries(operation):
+            yield self.read(*entry)
+
+    def reprocess(self, function, operation=None, processes=None,
+                  batch=REPROCESS_BATCH):
+
+        """
+            Runs function over the latest response of every request, in
+            `processes` worker processes that each map the segments on
+            their own. Results come back in archive order.
+
+            >>> def titles(response):
+            ...     items = extract_items(response.content)
+            ...     return [item.title for item in items]
+            >>> for result in archive.reprocess(titles):
+            ...     ...
+
+            :param function: Callable, receives an ArchivedResponse and
+                             returns a picklable result.
+            :param operation: String, only the responses to this Operation.
+            :param processes: Integer, one per CPU by default.
+            :param batch: Integer, responses per task sent to a worker.
+
+            :rType: generator of the results of function.
+        """
+
+        pool = multiprocessing.Pool(processes, _start_worker,
+                                    (self.path, function))
+
+        try:
+            for results in pool.imap(_reprocess_batch,
+                                     _batches(self.entries(operation),
+                                              batch)):
+                for result in results:
+                    yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def counts(self):
+
+        """
+            :rType: dictionary, with the responses indexed, segments and
+                    bytes on disk.
+        """
+
+        db = self._connection()
+        responses = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        segments = [row[0] for row in db.execute("SELECT segment"
+                                                 " FROM segments")]
+        size = sum(os.path.getsize(self._segment_path(segment))
+                   for segment in segments
+                   if os.path.exists(self._segment_path(segment)))
+
+        return dict(responses=responses, segments=len(segments), bytes=size)
+
+    def close(self):
+
+        with self._lock:
+            if self._output is not None:
+                self._output.close()
+                self._output = None
+
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps.clear()
+
+
+def _params(query):
+
+    """
+        :rType: List, of the name=value params of query but IGNORED_PARAMS.
+    """
+
+    return [param for param in query.split('&')
+            if param and param.split('=', 1)[0] not in IGNORED_PARAMS]
+
+
+def _batches(entries, size):
+
+    batch = list()
+
+    for entry in entries:
+        batch.append(entry)
+
+        if len(batch) == size:
+            yield batch
+            batch = list()
+
+    if batch:
+        yield batch
+
+
+# Archive and function of a reprocessing worker process
+_worker = dict()
+
+
+def _start_worker(path, function):
+
+    _worker['archive'] = ResponseArchive(path, mode='replay')
+    _worker['function'] = function
+
+
+def _reprocess_batch(entries):
+
+    archive = _worker['archive']
+    function = _worker['function']
+
+    return [function(archive.read(*entry)) for entry in entries]
@@ -0,0 +1,148 @@
+from multiprocessing.pool import ThreadPool
+
+from amazon.amazon_api import AmazonAPI, AmazonAPIError
+
+
+class AsyncAmazonAPI(object):
+
+    """
+        Non-blocking counterpart of AmazonAPI. Every operation returns at
+        once with an AsyncResult, a future whose get() gives the
+        BeautifulSoup XML Object or raises the error of the call.
+
+        Parameters are built and signed in the calling thread with the
+        AmazonAPI logic. The HTTP round trip, the XML parsing and the
+        response check run on a pool of at most `concurrency` workers. Any
+        number of calls can be submitted, the ones over the limit wait in
+        the pool queue.
+
+        This package targets Python 2.7, where asyncio isn't available;
+        to use it from an event loop, wrap the AsyncResult or pass a
+        callback that hands the result back to the loop.
+    """
+
+    def __init__(self, aws_access_key, secret_key, associate_tag,
+                 concurrency=100, **kwargs):
+
+        """
+            :param aws_access_key: Amazon access key
+            :param secret_key: Amazon secret key, KEEP SECRET!!
+            :param associate_tag: associate amazon tag
+            :param concurrency: Integer, max calls in flight at once.
+            :param kwargs: dictionary, extra AmazonAPI arguments
+                           (i.e: pool_idle_timeout)
+        """
+
+        kwargs.setdefault('pool_size', concurrency)
+
+        self.api = AmazonAPI(aws_access_key, secret_key, associate_tag,
+                             **kwargs)
+
+        self._workers = ThreadPool(concurrency)
+
+    def _submit(self, host, params, callback=None):
+
+        """
+            Signs the request for params in the calling thread and hands
+            the fetch over to the workers.
+
+            :rType: multiprocessing.pool.AsyncResult
+        """
+
+        host_name, request_url, cache_entry, metrics = \
+            self.api._prepare(host, params)
+
+        return self._workers.apply_async(self.api._fetch,
+                                         (host_name, request_url, True,
+                                          cache_entry, metrics),
+                                         callback=callback)
+
+    def close(self):
+
+        """
+            Waits for the calls in flight and releases the workers and the
+            pooled connections.
+        """
+
+        self._workers.close()
+        self._workers.join()
+        self.api.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ===============================================================
+    #                  Amazon API Allowed operations
+    # ===============================================================
+
+    def item_lookup(self, host=None, callback=None, **kwargs):
+
+        """
+            Non-blocking AmazonAPI.item_lookup.
+
+            :param callback: Callable, called with the XML Object when the
+                             call succeeds.
+
+            :rType: multiprocessing.pool.AsyncResult
+        """
+
+        kwargs['Operation'] = 'ItemLookup'
+
+        return self._submit(host, kwargs, callback)
+
+    def item_search(self, host=None, callback=None, **kwargs):
+
+        """
+            Non-blocking AmazonAPI.item_search.
+
+            :param callback: Callable, called with the XML Object when the
+                             call succeeds.
+
+            :rType: multiprocessing.pool.AsyncResult
+        """
+
+        kwargs['Operation'] = 'ItemSearch'
+
+        return self._submit(host, kwargs, callback)
+
+    def similarity_lookup(self, host=None, callback=None, **kwargs):
+
+        """
+            Non-blocking AmazonAPI.similarity_lookup.
+
+            :param callback: Callable, called with the XML Object when the
+                             call succeeds.
+
+            :rType: multiprocessing.pool.AsyncResult
+        """
+
+        kwargs['Operation'] = 'SimilarityLookup'
+
+        return self._submit(host, kwargs, callback)
+
+    def node_browse_lookup(self, host=None, browse_node_id=None,
+                           response_group=None, callback=None):
+
+        """
+            Non-blocking AmazonAPI.node_browse_lookup.
+
+            :param callback: Callable, called with the XML Object when the
+                             call succeeds.
+
+            :rType: multiprocessing.pool.AsyncResult
+        """
+
+        if browse_node_id is None:
+            raise AmazonAPIError('browse_node_id cannot be None/Null')
+
+        params = dict()
+        params['Operation'] = 'BrowseNodeLookup'
+        params['BrowseNodeId'] = browse_node_id
+
+        if response_group is not None:
+            params['ResponseGroup'] = response_group
+
+        return self._submit(host, params, callback)
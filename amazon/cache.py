@@ -0,0 +1,342 @@
+import sqlite3
+import threading
+from time import time
+from hashlib import sha1
+from collections import OrderedDict
+
+
+# Seconds a response stays fresh, per Operation
+DEFAULT_TTLS = {
+    'BrowseNodeLookup': 3 * 24 * 3600,
+    'ItemLookup': 3600,
+    'ItemSearch': 3600,
+    'SimilarityLookup': 3600}
+
+# Response groups carrying prices and availability, which go stale quickly
+OFFER_RESPONSE_GROUPS = ('Large', 'OfferFull', 'OfferListings', 'Offers',
+                         'OfferSummary')
+
+# Params left out of cache keys. Signature and Timestamp change on every
+# call, and every access key gets the same response, so the credentials of
+# a CredentialPool share entries. AssociateTag stays: it's in the URLs.
+VOLATILE_PARAMS = ('AWSAccessKeyId', 'Signature', 'Timestamp')
+
+# Hits whose LRU position is written to a SQLiteBackend at once
+TOUCH_BATCH = 100
+
+
+class MemoryBackend(object):
+
+    """
+        In-process LRU store, bounded by number of entries and by total
+        bytes of the cached responses.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+
+        """
+            :param max_entries: Integer, max responses kept.
+            :param max_bytes: Integer, max total size of kept responses.
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None:
+                return None
+
+            content, expires = entry
+
+            if expires < time():
+                self.size -= len(content)
+                return None
+
+            # Re-insert to mark the entry as most recently used
+            self._entries[key] = entry
+
+            return content
+
+    def set(self, key, content, ttl):
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+
+            self._entries[key] = (content, time() + ttl)
+            self.size += len(content)
+
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     self.size > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class SQLiteBackend(object):
+
+    """
+        LRU store on a local SQLite file. Several threads and worker
+        processes can open the same path to share cached responses.
+
+        Entry count and total bytes are kept up to date by triggers, so
+        checking the bounds on a set doesn't scan the table. Hits only
+        move an entry up the LRU order every `touch_batch` hits, or on the
+        next set, in one write, so reads don't turn into writes.
+    """
+
+    def __init__(self, path, max_entries=100000,
+                 max_bytes=1024 * 1024 * 1024, timeout=30,
+                 touch_batch=TOUCH_BATCH):
+
+        """
+            :param path: String, SQLite database file.
+            :param max_entries: Integer, max responses kept.
+            :param max_bytes: Integer, max total size of kept responses.
+            :param timeout: Integer, seconds to wait on a locked database.
+            :param touch_batch: Integer, hits kept in memory before their
+                                access times are written.
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.touch_batch = touch_batch
+
+        self._local = threading.local()
+        # Key to the time of its last hit, not written yet
+        self._touched = dict()
+        self._lock = threading.Lock()
+
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                       " key TEXT PRIMARY KEY,"
+                       " content BLOB NOT NULL,"
+                       " size INTEGER NOT NULL,"
+                       " expires REAL NOT NULL,"
+                       " accessed REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed"
+                       " ON responses (accessed)")
+
+            db.execute("CREATE TABLE IF NOT EXISTS totals ("
+                       " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                       " entries INTEGER NOT NULL,"
+                       " bytes INTEGER NOT NULL)")
+            # Counted once, for files made before the totals were kept
+            db.execute("INSERT OR IGNORE INTO totals (id, entries, bytes)"
+                       " SELECT 0, COUNT(*), COALESCE(SUM(size), 0)"
+                       " FROM responses")
+            db.execute("CREATE TRIGGER IF NOT EXISTS responses_insert"
+                       " AFTER INSERT ON responses BEGIN"
+                       " UPDATE totals SET entries = entries + 1,"
+                       " bytes = bytes + NEW.size; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS responses_delete"
+                       " AFTER DELETE ON responses BEGIN"
+                       " UPDATE totals SET entries = entries - 1,"
+                       " bytes = bytes - OLD.size; END")
+
+    def _connection(self):
+
+        # sqlite3 connections can't be shared between threads
+        db = getattr(self._local, 'db', None)
+
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            # Rows an INSERT OR REPLACE drops go through the delete trigger
+            db.execute("PRAGMA recursive_triggers = ON")
+            self._local.db = db
+
+        return db
+
+    def get(self, key):
+
+        now = time()
+        db = self._connection()
+
+        row = db.execute("SELECT content, expires FROM responses"
+                         " WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        if row[1] < now:
+            with db:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+
+        with self._lock:
+            self._touched[key] = now
+            flush = len(self._touched) >= self.touch_batch
+
+        if flush:
+            with db:
+                self._flush_touched(db)
+
+        return str(row[0])
+
+    def _flush_touched(self, db):
+
+        with self._lock:
+            touched = self._touched
+            self._touched = dict()
+
+        db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                       [(accessed, key) for key, accessed in touched.items()])
+
+    def set(self, key, content, ttl):
+
+        now = time()
+
+        with self._connection() as db:
+            self._flush_touched(db)
+            db.execute("INSERT OR REPLACE INTO responses"
+                       " (key, content, size, expires, accessed)"
+                       " VALUES (?, ?, ?, ?, ?)",
+                       (key, sqlite3.Binary(content), len(content),
+                        now + ttl, now))
+            self._evict(db)
+
+    def _evict(self, db):
+
+        entries, size = db.execute("SELECT entries, bytes FROM totals"
+                                   ).fetchone()
+
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+
+        cursor = db.execute("SELECT key, size FROM responses"
+                            " ORDER BY accessed")
+        evicted = list()
+
+        for key, entry_size in cursor:
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+
+            evicted.append((key,))
+            entries -= 1
+            size -= entry_size
+
+        db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def counts(self):
+
+        """
+            :rType: dictionary, with the entries kept and their bytes.
+        """
+
+        entries, size = self._connection().execute(
+            "SELECT entries, bytes FROM totals").fetchone()
+
+        return dict(entries=entries, bytes=size)
+
+    def clear(self):
+
+        with self._lock:
+            self._touched.clear()
+
+        with self._connection() as db:
+            db.execute("DELETE FROM responses")
+
+
+class ResponseCache(object):
+
+    """
+        Caches raw response content by request. Requests are told apart by
+        host and canonical sorted parameter string, without VOLATILE_PARAMS
+        (Timestamp, Signature, AWSAccessKeyId). How long a response is kept
+        depends on its Operation, and is shorter when offers are in the
+        ResponseGroup.
+    """
+
+    def __init__(self, backend=None, ttls=None, default_ttl=3600,
+                 offers_ttl=300):
+
+        """
+            :param backend: MemoryBackend, SQLiteBackend or any object with
+                            get(key) and set(key, content, ttl) methods.
+                            Defaults to a MemoryBackend.
+            :param ttls: dictionary, Operation to seconds, overriding
+                         DEFAULT_TTLS.
+            :param default_ttl: Integer, seconds for other operations.
+            :param offers_ttl: Integer, max seconds for responses including
+                               an offer response group.
+        """
+
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or dict())
+        self.default_ttl = default_ttl
+        self.offers_ttl = offers_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, host, canonical_params):
+
+        """
+            :param host: String, amazon host name.
+            :param canonical_params: String, sorted and quoted query string.
+
+            :rType: String
+        """
+
+        params = [param for param in canonical_params.split('&')
+                  if param.split('=', 1)[0] not in VOLATILE_PARAMS]
+
+        return sha1('%s?%s' % (host, '&'.join(params))).hexdigest()
+
+    def ttl(self, params):
+
+        """
+            :param params: dictionary, with request parameters
+
+            :rType: Integer, seconds the response of params stays fresh.
+        """
+
+        ttl = self.ttls.get(params.get('Operation'), self.default_ttl)
+        groups = str(params.get('ResponseGroup', '')).split(',')
+
+        if any(group.strip() in OFFER_RESPONSE_GROUPS for group in groups):
+            ttl = min(ttl, self.offers_ttl)
+
+        return ttl
+
+    def get(self, key):
+
+        content = self.backend.get(key)
+
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return content
+
+    def set(self, key, content, ttl):
+        self.backend.set(key, content, ttl)
+
+    def stats(self):
+
+        """
+            :rType: dictionary, with hits and misses.
+        """
+
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses)
@@ -0,0 +1,299 @@
+import threading
+
+from amazon.amazon_api import AmazonAPIError, MAX_ITEM_IDS
+
+
+# ItemLookup params a batched lookup can carry, the response to any other
+# (i.e: VariationPage) isn't one Item per ItemId.
+BATCHABLE_PARAMS = frozenset(['Condition', 'IdType', 'IncludeReviewsSummary',
+                              'MerchantId', 'ResponseGroup',
+                              'TruncateReviewsAt'])
+
+ITEM_RESPONSE_XML = ('<?xml version="1.0" ?>\n'
+                     '<ItemLookupResponse xmlns="http://webservices.amazon.'
+                     'com/AWSECommerceService/2013-09-01"><Items><Request>'
+                     '<IsValid>True</IsValid></Request>%s</Items>'
+                     '</ItemLookupResponse>')
+
+
+class _Flight(object):
+
+    """
+        A call in flight, waited on by the identical calls made meanwhile.
+    """
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Batch(object):
+
+    """
+        Single ASIN lookups waiting to be sent as one ItemLookup.
+    """
+
+    __slots__ = ('ids', 'full', 'done', 'results')
+
+    def __init__(self):
+
+        self.ids = list()
+        self.full = threading.Event()
+        self.done = threading.Event()
+        # ItemId to (item, error), once the lookup is back
+        self.results = None
+
+
+class CoalescingAPI(object):
+
+    """
+        Wraps an AmazonAPI so concurrent calls spend fewer requests:
+
+          - Identical calls in flight at the same time share one request
+            and its response (singleflight).
+          - ItemLookups of a single ASIN made within `window` seconds of
+            each other, on the same host and with the same other params,
+            are sent as one ItemLookup of up to MAX_ITEM_IDS ASINs. Every
+            caller still gets an ItemLookup response holding just its Item,
+            or the error of its ASIN.
+
+        No thread is started: the first caller of a batch waits out the
+        window and makes the request for the others. Responses are shared
+        between the callers of identical calls, so they must not be
+        modified.
+    """
+
+    def __init__(self, api, window=0.01, max_batch=MAX_ITEM_IDS):
+
+        """
+            :param api: AmazonAPI, making the requests.
+            :param window: Float, seconds a single ASIN lookup waits for
+                           others to join its request.
+            :param max_batch: Integer, ASINs per batched request, the batch
+                              is sent as soon as it is full.
+        """
+
+        if not 1 <= max_batch <= MAX_ITEM_IDS:
+            raise AmazonAPIError('max_batch must be between 1 and %d' %
+                                 MAX_ITEM_IDS)
+
+        self.api = api
+        self.window = window
+        self.max_batch = max_batch
+
+        self.calls = 0
+        self.requests = 0
+        self.shared = 0
+        self.batched = 0
+
+        self._flights = dict()
+        self._batches = dict()
+        self._lock = threading.Lock()
+
+    def _key(self, host, params):
+        return host, tuple(sorted(params.iteritems()))
+
+    def _singleflight(self, key, func, *args):
+
+        """
+            Returns func(*args), or the outcome of the call with the same
+            key already in flight.
+        """
+
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
+
+    def _request(self, host, params):
+
+        with self._lock:
+            self.requests += 1
+
+        return self.api._call(host, dict(params))
+
+    def _batched_lookup(self, host, item_id, params):
+
+        """
+            Looks up item_id along with the other single ASIN lookups of
+            the same batch.
+        """
+
+        key = self._key(host, params)
+
+        with self._lock:
+            batch = self._batches.get(key)
+            leader = batch is None
+
+            if leader:
+                batch = self._batches[key] = _Batch()
+
+            batch.ids.append(item_id)
+
+            if len(batch.ids) >= self.max_batch:
+                del self._batches[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+
+            with self._lock:
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+
+                self.requests += 1
+                self.batched += len(batch.ids)
+
+            try:
+                result = self.api.item_lookup_batch(host, batch.ids,
+                                                    **params)
+                items = dict((item.ASIN.string, item) for item in result)
+                batch.results = dict((result_id,
+                                      (items.get(result_id),
+                                       result.errors.get(result_id)))
+                                     for result_id in batch.ids)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.results is None:
+            raise AmazonAPIError('The batched lookup of %s failed' % item_id)
+
+        item, error = batch.results[item_id]
+
+        if error is not None:
+            raise error
+
+        return self.api._parse(ITEM_RESPONSE_XML % item)
+
+    def stats(self):
+
+        """
+            :rType: dictionary, with calls received, requests made, calls
+                    that shared the request of an identical one, and ASINs
+                    sent in batched lookups.
+        """
+
+        with self._lock:
+            return dict(calls=self.calls, requests=self.requests,
+                        shared=self.shared, batched=self.batched)
+
+    def close(self):
+        self.api.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ===============================================================
+    #                  Amazon API Allowed operations
+    # ===============================================================
+
+    def item_lookup(self, host=None, **kwargs):
+
+        """
+            AmazonAPI.item_lookup, batched with other single ASIN lookups
+            when it is one too.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        kwargs['Operation'] = 'ItemLookup'
+        key = self._key(host, kwargs)
+
+        item_id = kwargs.get('ItemId')
+        batchable = (isinstance(item_id, basestring) and ',' not in item_id
+                     and kwargs.get('IdType', 'ASIN') == 'ASIN' and
+                     all(name in BATCHABLE_PARAMS
+                         for name in kwargs if name not in ('ItemId',
+                                                            'Operation')))
+
+        if not batchable:
+            return self._singleflight(key, self._request, host, kwargs)
+
+        params = dict(kwargs)
+        del params['ItemId']
+
+        return self._singleflight(key, self._batched_lookup, host, item_id,
+                                  params)
+
+    def item_search(self, host=None, **kwargs):
+
+        """
+            AmazonAPI.item_search, shared with identical calls in flight.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        kwargs['Operation'] = 'ItemSearch'
+
+        return self._singleflight(self._key(host, kwargs), self._request,
+                                  host, kwargs)
+
+    def similarity_lookup(self, host=None, **kwargs):
+
+        """
+            AmazonAPI.similarity_lookup, shared with identical calls in
+            flight.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        kwargs['Operation'] = 'SimilarityLookup'
+
+        return self._singleflight(self._key(host, kwargs), self._request,
+                                  host, kwargs)
+
+    def node_browse_lookup(self, host=None, browse_node_id=None,
+                           response_group=None):
+
+        """
+            AmazonAPI.node_browse_lookup, shared with identical calls in
+            flight.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        if browse_node_id is None:
+            raise AmazonAPIError('browse_node_id cannot be None/Null')
+
+        params = dict()
+        params['Operation'] = 'BrowseNodeLookup'
+        params['BrowseNodeId'] = browse_node_id
+
+        if response_group is not None:
+            params['ResponseGroup'] = response_group
+
+        return self._singleflight(self._key(host, params), self._request,
+                                  host, params)
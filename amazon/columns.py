@@ -0,0 +1,402 @@
+"""
+    Column buffers of Item fields, filled straight from the XML of many
+    responses for analytics. Integers (prices in cents, sales rank, offer
+    counts) go to int64 arrays, ASINs to a fixed width bytes buffer, and
+    other strings to dictionary encoded columns. No dictionary nor model is
+    built per item.
+
+    The buffers are stdlib arrays. NumPy, pandas and pyarrow are only
+    needed to convert them, and are imported when a conversion is asked:
+
+        >>> columns = ItemColumns()
+        >>> for response in responses:
+        ...     columns.extend(response)
+        >>> frame = columns.to_pandas()
+        >>> columns.write_parquet('items.parquet')
+"""
+from array import array
+
+from amazon.models import ITEM_FIELDS, _events, _local_name
+
+
+ASIN_WIDTH = 10
+
+# Item fields stored by default, per kind of column
+ASIN_COLUMNS = ('asin', 'parent_asin')
+INT_COLUMNS = ('sales_rank', 'list_price', 'lowest_new_price',
+               'lowest_used_price', 'total_new', 'total_used', 'total_offers')
+STRING_COLUMNS = ('title', 'manufacturer', 'brand', 'binding',
+                  'product_group', 'currency')
+
+COLUMNS = ASIN_COLUMNS + INT_COLUMNS + STRING_COLUMNS
+
+
+def _int64_typecode():
+
+    # 'q' is missing from the array module of Python 2, and 'l' is 32 bit
+    # on some platforms
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+
+    return None
+
+
+# Array typecode of 64 bit integers, None if the platform has none
+INT64 = _int64_typecode()
+
+
+class AsinColumn(object):
+
+    """
+        ASINs as one buffer of ASIN_WIDTH bytes per row, a NumPy 'S10'
+        array once converted, unicode strings in pandas and Arrow. Missing
+        values are empty bytes in NumPy and null in pandas and Arrow.
+    """
+
+    def __init__(self, width=ASIN_WIDTH):
+
+        self.width = width
+        self.buffer = bytearray()
+
+    def append_null(self):
+        self.buffer.extend('\0' * self.width)
+
+    def set(self, row, text):
+
+        # Unicode from BeautifulSoup responses, str from lxml ones
+        value = (text or '').strip().encode('ascii')[:self.width]
+        start = row * self.width
+
+        self.buffer[start:start + len(value)] = value
+
+    def __len__(self):
+        return len(self.buffer) // self.width
+
+    def to_numpy(self):
+
+        import numpy
+
+        return numpy.frombuffer(bytes(self.buffer), dtype='S%d' % self.width)
+
+    def _decoded(self):
+
+        """
+            :rType: Tuple, (numpy.ndarray of unicode, mask of the missing)
+        """
+
+        import numpy
+
+        values = self.to_numpy()
+
+        return numpy.char.decode(values, 'ascii'), values == b''
+
+    def to_pandas(self):
+
+        values, missing = self._decoded()
+        values = values.astype(object)
+        values[missing] = None
+
+        return values
+
+    def to_arrow(self):
+
+        import pyarrow
+
+        values, missing = self._decoded()
+
+        return pyarrow.array(values, mask=missing, type=pyarrow.string())
+
+
+class Int64Column(object):
+
+    """
+        64 bit integers, NULL where the value is missing.
+    """
+
+    NULL = -2 ** 63
+
+    def __init__(self):
+
+        if INT64 is None:
+            raise ValueError("No 64 bit integer array on this platform")
+
+        self.values = array(INT64)
+
+    def append_null(self):
+        self.values.append(self.NULL)
+
+    def set(self, row, text):
+
+        text = (text or '').strip()
+
+        if text:
+            self.values[row] = int(text)
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_numpy(self):
+
+        """
+            :rType: numpy.ma.MaskedArray, of int64, masked where missing.
+        """
+
+        import numpy
+
+        values = numpy.frombuffer(self.values, dtype=self.values.typecode)
+        values = values.astype(numpy.int64)
+
+        return numpy.ma.masked_equal(values, self.NULL)
+
+    def to_pandas(self):
+
+        import pandas
+
+        values = self.to_numpy()
+
+        return pandas.arrays.IntegerArray(values.filled(0),
+                                          numpy_mask(values))
+
+    def to_arrow(self):
+
+        import pyarrow
+
+        values = self.to_numpy()
+
+        return pyarrow.array(values.filled(0), mask=numpy_mask(values),
+                             type=pyarrow.int64())
+
+
+class DictionaryColumn(object):
+
+    """
+        Strings as int32 codes into a dictionary of the distinct values,
+        -1 where the value is missing. Repeated values (brands, bindings,
+        currencies) are stored once.
+    """
+
+    def __init__(self):
+
+        self.codes = array('i')
+        self.dictionary = list()
+        self._index = dict()
+
+    def append_null(self):
+        self.codes.append(-1)
+
+    def set(self, row, text):
+
+        value = (text or '').strip()
+
+        if not value:
+            return
+
+        code = self._index.get(value)
+
+        if code is None:
+            code = self._index[value] = len(self.dictionary)
+            self.dictionary.append(value)
+
+        self.codes[row] = code
+
+    def __len__(self):
+        return len(self.codes)
+
+    def to_numpy(self):
+
+        """
+            :rType: numpy.ndarray, of int32 codes into self.dictionary.
+        """
+
+        import numpy
+
+        return numpy.frombuffer(self.codes, dtype=numpy.int32)
+
+    def to_pandas(self):
+
+        import pandas
+
+        return pandas.Categorical.from_codes(self.to_numpy(),
+                                             self.dictionary)
+
+    def to_arrow(self):
+
+        import pyarrow
+
+        codes = self.to_numpy()
+
+        return pyarrow.DictionaryArray.from_arrays(
+            pyarrow.array(codes, mask=codes < 0, type=pyarrow.int32()),
+            pyarrow.array(self.dictionary, type=pyarrow.string()))
+
+
+def numpy_mask(values):
+
+    """
+        :rType: numpy.ndarray, of bool, the full mask of a masked array.
+    """
+
+    import numpy
+
+    return numpy.ma.getmaskarray(values)
+
+
+def _column(name):
+
+    if name in ASIN_COLUMNS:
+        return AsinColumn()
+
+    if name in INT_COLUMNS:
+        return Int64Column()
+
+    if name in STRING_COLUMNS:
+        return DictionaryColumn()
+
+    raise ValueError("Unknown column: %s" % name)
+
+
+class ItemColumns(object):
+
+    """
+        Column buffers of the Items of any number of ItemLookup, ItemSearch
+        or SimilarityLookup responses, one row per Item.
+    """
+
+    def __init__(self, columns=COLUMNS):
+
+        """
+            :param columns: Tuple, Item fields stored, out of COLUMNS.
+        """
+
+        self.names = tuple(columns)
+        self.columns = dict((name, _column(name)) for name in self.names)
+        self.rows = 0
+
+        # Path relative to an Item to the column its text goes to
+        self._paths = dict((path, self.columns[field])
+                           for path, (field, convert) in ITEM_FIELDS.items()
+                           if field in self.columns)
+
+    def __len__(self):
+        return self.rows
+
+    def extend(self, source):
+
+        """
+            Adds a row per Item of source, in one pass over its XML.
+
+            :param source: String with the raw XML, or a response parsed by
+                           AmazonAPI with either parser.
+
+            :rType: Integer, rows added.
+        """
+
+        columns = self.columns.values()
+        paths = self._paths
+        path = list()
+        row = None
+        added = 0
+
+        for event, element, owned in _events(source):
+            if event == 'start':
+                path.append(_local_name(element.tag))
+
+                if path[-2:] == ['Items', 'Item'] or path == ['Item']:
+                    row = self.rows
+                    depth = len(path)
+                    for column in columns:
+                        column.append_null()
+                    self.rows += 1
+
+                continue
+
+            relative = tuple(path[depth:]) if row is not None else None
+            path.pop()
+
+            if relative is None:
+                continue
+
+            if not relative:
+                row = None
+                added += 1
+
+                if owned:
+                    # Free the consumed Item and the ones before it
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+
+            elif relative in paths:
+                paths[relative].set(row, element.text)
+
+        return added
+
+    def to_numpy(self):
+
+        """
+            :rType: dictionary, of column name to its NumPy array. Strings
+                    come as codes, decoded by self.columns[name].dictionary.
+        """
+
+        return dict((name, self.columns[name].to_numpy())
+                    for name in self.names)
+
+    def to_pandas(self):
+
+        """
+            :rType: pandas.DataFrame, with nullable Int64 integers and
+                    Categorical strings.
+        """
+
+        import pandas
+
+        return pandas.DataFrame(
+            dict((name, self.columns[name].to_pandas())
+                 for name in self.names), columns=list(self.names))
+
+    def to_arrow(self):
+
+        """
+            :rType: pyarrow.Table, strings as dictionary arrays.
+        """
+
+        import pyarrow
+
+        return pyarrow.Table.from_arrays(
+            [self.columns[name].to_arrow() for name in self.names],
+            names=list(self.names))
+
+    def write_parquet(self, path, **kwargs):
+
+        """
+            Writes the columns as a Parquet file, strings dictionary
+            encoded.
+
+            :param kwargs: dictionary, pyarrow.parquet.write_table arguments
+                           (i.e: compression)
+        """
+
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(self.to_arrow(), path, **kwargs)
+
+
+def extract_columns(sources, columns=COLUMNS):
+
+    """
+        :param sources: Iterable, of responses as String or parsed by
+                        AmazonAPI.
+
+        :rType: ItemColumns, of the Items of every source.
+    """
+
+    result = ItemColumns(columns)
+
+    for source in sources:
+        result.extend(source)
+
+    return result
@@ -0,0 +1,333 @@
+import sqlite3
+from time import time
+from multiprocessing.pool import ThreadPool
+
+from requests import RequestException
+
+from amazon.amazon_api import AmazonAPIError, AmazonAPIResponseError
+from amazon.models import extract_browse_nodes
+
+
+# Nodes fetched per round, the index is checkpointed after every node
+CRAWL_BATCH = 100
+
+# Failed lookups after which a node is given up on
+MAX_NODE_ERRORS = 3
+
+
+class BrowseNodeIndex(object):
+
+    """
+        On-disk index of a BrowseNode hierarchy, per host: one row per node
+        and one per parent/child edge, keyed by integers. It is also the
+        checkpoint of the crawl: nodes seen but not crawled yet are the
+        frontier, so a crawl started again on the same file picks up where
+        the last one stopped.
+    """
+
+    def __init__(self, path, timeout=30):
+
+        """
+            :param path: String, SQLite database file.
+            :param timeout: Integer, seconds to wait on a locked database.
+        """
+
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=timeout)
+
+        with self._db as db:
+            db.execute("CREATE TABLE IF NOT EXISTS nodes ("
+                       " host TEXT NOT NULL,"
+                       " node_id INTEGER NOT NULL,"
+                       " name TEXT,"
+                       " is_category_root INTEGER,"
+                       " depth INTEGER NOT NULL,"
+                       " crawled REAL,"
+                       " errors INTEGER NOT NULL DEFAULT 0,"
+                       " PRIMARY KEY (host, node_id)) WITHOUT ROWID")
+            db.execute("CREATE TABLE IF NOT EXISTS edges ("
+                       " host TEXT NOT NULL,"
+                       " parent INTEGER NOT NULL,"
+                       " child INTEGER NOT NULL,"
+                       " PRIMARY KEY (host, parent, child)) WITHOUT ROWID")
+            db.execute("CREATE INDEX IF NOT EXISTS nodes_frontier"
+                       " ON nodes (host, crawled, depth)")
+
+    def close(self):
+        self._db.close()
+
+    def add(self, host, node_ids, depth=0):
+
+        """
+            Queues the nodes not in the index yet.
+        """
+
+        with self._db as db:
+            db.executemany("INSERT OR IGNORE INTO nodes (host, node_id, depth)"
+                           " VALUES (?, ?, ?)",
+                           [(host, int(node_id), depth)
+                            for node_id in node_ids])
+
+    def pending(self, host, limit=CRAWL_BATCH, max_errors=MAX_NODE_ERRORS):
+
+        """
+            Nodes seen but not crawled, shallowest first.
+
+            :rType: List, of (node_id, depth)
+        """
+
+        return self._db.execute("SELECT node_id, depth FROM nodes"
+                                " WHERE host = ? AND crawled IS NULL"
+                                " AND errors < ?"
+                                " ORDER BY depth, node_id LIMIT ?",
+                                (host, max_errors, limit)).fetchall()
+
+    def record(self, host, node, depth):
+
+        """
+            Stores a crawled node with the edges to its children and
+            ancestors, queueing the ones never seen before. Edges to
+            children the node no longer has are dropped.
+
+            :param node: models.BrowseNode
+            :param depth: Integer, of the node in the crawl.
+        """
+
+        now = time()
+        children = [child.node_id for child in node.children or ()]
+
+        with self._db as db:
+            db.execute("INSERT OR REPLACE INTO nodes"
+                       " (host, node_id, name, is_category_root, depth,"
+                       "  crawled, errors)"
+                       " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                       (host, node.node_id, node.name, node.is_category_root,
+                        depth, now))
+
+            db.execute("DELETE FROM edges WHERE host = ? AND parent = ?",
+                       (host, node.node_id))
+            db.executemany("INSERT OR IGNORE INTO edges (host, parent, child)"
+                           " VALUES (?, ?, ?)",
+                           [(host, node.node_id, child)
+                            for child in children])
+
+            # Ancestors come as a chain, each holding its own parent
+            child, ancestors = node, node.ancestors
+            while ancestors:
+                parent = ancestors[0]
+                db.execute("INSERT OR IGNORE INTO edges (host, parent, child)"
+                           " VALUES (?, ?, ?)",
+                           (host, parent.node_id, child.node_id))
+                child, ancestors = parent, parent.ancestors
+
+                db.execute("INSERT OR IGNORE INTO nodes (host, node_id, depth)"
+                           " VALUES (?, ?, ?)",
+                           (host, parent.node_id, depth + 1))
+
+            db.executemany("INSERT OR IGNORE INTO nodes (host, node_id, depth)"
+                           " VALUES (?, ?, ?)",
+                           [(host, child, depth + 1) for child in children])
+
+    def failed(self, host, node_id):
+
+        with self._db as db:
+            db.execute("UPDATE nodes SET errors = errors + 1"
+                       " WHERE host = ? AND node_id = ?", (host, node_id))
+
+    def retry(self, host):
+
+        """
+            Clears the failures of the nodes not crawled yet, so they are
+            looked up again.
+        """
+
+        with self._db as db:
+            db.execute("UPDATE nodes SET errors = 0"
+                       " WHERE host = ? AND crawled IS NULL", (host,))
+
+    def expire(self, host, roots, older_than):
+
+        """
+            Queues again the nodes under roots (roots included) crawled
+            before older_than, so a crawl only revisits stale subtrees.
+
+            :param older_than: Float, timestamp.
+
+            :rType: Integer, nodes queued.
+        """
+
+        roots = [int(root) for root in roots]
+
+        with self._db as db:
+            cursor = db.execute(
+                "WITH RECURSIVE subtree (node_id) AS ("
+                "  SELECT node_id FROM nodes WHERE host = ? AND node_id IN"
+                "  (%s)"
+                "  UNION SELECT child FROM edges, subtree"
+                "  WHERE edges.host = ? AND edges.parent = subtree.node_id)"
+                " UPDATE nodes SET crawled = NULL, errors = 0"
+                " WHERE host = ? AND crawled < ?"
+                " AND node_id IN (SELECT node_id FROM subtree)" %
+                ', '.join('?' * len(roots)),
+                [host] + roots + [host, host, older_than])
+
+        return cursor.rowcount
+
+    def node(self, host, node_id):
+
+        """
+            :rType: dictionary, with node_id, name, is_category_root, depth
+                    and crawled. None if the node isn't in the index.
+        """
+
+        row = self._db.execute("SELECT node_id, name, is_category_root,"
+                               " depth, crawled FROM nodes"
+                               " WHERE host = ? AND node_id = ?",
+                               (host, node_id)).fetchone()
+
+        if row is None:
+            return None
+
+        return dict(node_id=row[0], name=row[1],
+                    is_category_root=(bool(row[2]) if row[2] is not None
+                                      else None),
+                    depth=row[3], crawled=row[4])
+
+    def children(self, host, node_id):
+
+        """
+            :rType: List, of child node ids.
+        """
+
+        return [row[0] for row in
+                self._db.execute("SELECT child FROM edges"
+                                 " WHERE host = ? AND parent = ?"
+                                 " ORDER BY child", (host, node_id))]
+
+    def parents(self, host, node_id):
+
+        """
+            :rType: List, of parent node ids.
+        """
+
+        return [row[0] for row in
+                self._db.execute("SELECT parent FROM edges"
+                                 " WHERE host = ? AND child = ?"
+                                 " ORDER BY parent", (host, node_id))]
+
+    def counts(self, host, max_errors=MAX_NODE_ERRORS):
+
+        """
+            :rType: dictionary, with nodes, crawled, pending (not crawled
+                    and not given up on) and edges.
+        """
+
+        nodes, crawled, pending = self._db.execute(
+            "SELECT COUNT(*), COUNT(crawled),"
+            " SUM(crawled IS NULL AND errors < ?) FROM nodes WHERE host = ?",
+            (max_errors, host)).fetchone()
+        edges = self._db.execute("SELECT COUNT(*) FROM edges WHERE host = ?",
+                                 (host,)).fetchone()[0]
+
+        return dict(nodes=nodes, crawled=crawled, pending=pending or 0,
+                    edges=edges)
+
+
+class BrowseNodeCrawler(object):
+
+    """
+        Mirrors the BrowseNode hierarchy of a host into a BrowseNodeIndex.
+        The crawl goes breadth first from a set of roots, over Children and
+        Ancestors, with up to `workers` lookups in flight. Every node is
+        looked up once: nodes already in the index are not queued again.
+
+        Each crawled node is written to the index as soon as it comes back,
+        so an interrupted crawl resumes with the nodes left. Nodes whose
+        lookups fail stay queued, and are given up on after
+        MAX_NODE_ERRORS failures in a crawl. The next crawl tries them again.
+    """
+
+    def __init__(self, api, index, workers=8, batch=CRAWL_BATCH):
+
+        """
+            :param api: AmazonAPI, or any client with node_browse_lookup
+                        (i.e: CredentialPool).
+            :param index: BrowseNodeIndex, where nodes are stored.
+            :param workers: Integer, max lookups in flight at once.
+            :param batch: Integer, nodes taken off the frontier per round.
+        """
+
+        self.api = api
+        self.index = index
+        self.workers = workers
+        self.batch = batch
+
+    def _lookup(self, host, node_id):
+
+        # Whatever fails one node (open circuits, deadlines, XML lxml
+        # can't parse) fails only that node, not the crawl
+        try:
+            response = self.api.node_browse_lookup(
+                host=host, browse_node_id=node_id,
+                response_group='BrowseNodeInfo')
+            nodes = extract_browse_nodes(response)
+        except (AmazonAPIError, AmazonAPIResponseError, RequestException,
+                SyntaxError) as e:
+            return node_id, None, e
+
+        return node_id, (nodes[0] if nodes else None), None
+
+    def crawl(self, host, roots, max_age=None, max_nodes=None):
+
+        """
+            Crawls the nodes reachable from roots that aren't in the index
+            yet, and resumes any crawl left unfinished on host.
+
+            :param host: String, host key (i.e: us)
+            :param roots: Iterable, of BrowseNodeIds to start from.
+            :param max_age: Integer, seconds. Nodes under roots crawled
+                            longer ago than this are crawled again, along
+                            with the new nodes found. None crawls only the
+                            nodes never crawled.
+            :param max_nodes: Integer, stop after this many lookups.
+
+            :rType: dictionary, with the crawled and failed lookups of this
+                    crawl, and the nodes still pending.
+        """
+
+        roots = list(roots)
+        self.index.add(host, roots)
+        self.index.retry(host)
+
+        if max_age is not None:
+            self.index.expire(host, roots, time() - max_age)
+
+        crawled = failed = 0
+        workers = ThreadPool(self.workers)
+
+        try:
+            while max_nodes is None or crawled + failed < max_nodes:
+                limit = self.batch
+                if max_nodes is not None:
+                    limit = min(limit, max_nodes - crawled - failed)
+
+                frontier = dict(self.index.pending(host, limit))
+                if not frontier:
+                    break
+
+                results = workers.imap_unordered(
+                    lambda node_id: self._lookup(host, node_id), frontier)
+
+                for node_id, node, error in results:
+                    if node is None:
+                        self.index.failed(host, node_id)
+                        failed += 1
+                    else:
+                        self.index.record(host, node, frontier[node_id])
+                        crawled += 1
+        finally:
+            workers.close()
+            workers.join()
+
+        return dict(crawled=crawled, failed=failed,
+                    pending=self.index.counts(host)['pending'])
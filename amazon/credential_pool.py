@@ -0,0 +1,258 @@
+import threading
+from time import time
+
+from amazon.amazon_api import (AmazonAPI, AmazonAPIError,
+                               AmazonAPIResponseError)
+from amazon.rate_limit import RateLimiter
+
+
+# Error codes that mean a credential can't be used for a while
+BENCH_ERRORS = ('InvalidClientTokenId', 'AccountLimitExceeded')
+
+
+class Credential(object):
+
+    """
+        A set of credentials of a CredentialPool, with its client and its
+        counters.
+    """
+
+    def __init__(self, client):
+
+        self.client = client
+
+        self.calls = 0
+        self.errors = 0
+        self.error_codes = dict()
+        self.benched = 0
+        self.benched_until = 0.0
+
+    @property
+    def access_key(self):
+        return self.client.aws_access_key
+
+    def stats(self, elapsed):
+
+        """
+            :param elapsed: Float, seconds the pool has been running.
+
+            :rType: dictionary, with calls, errors, error_codes, error_rate,
+                    throughput (calls per second), benched (times taken out
+                    of rotation) and benched_until.
+        """
+
+        return dict(
+            calls=self.calls,
+            errors=self.errors,
+            error_codes=dict(self.error_codes),
+            error_rate=float(self.errors) / self.calls if self.calls else 0.0,
+            throughput=self.calls / elapsed if elapsed > 0 else 0.0,
+            benched=self.benched,
+            benched_until=self.benched_until)
+
+
+class CredentialPool(object):
+
+    """
+        Spreads calls over several access key/associate tag pairs. Amazon
+        grants each credential its own request budget, so the pool keeps an
+        AmazonAPI per credential, all paced by a single RateLimiter, and
+        sends every call through the credential with the most spare budget
+        on the host of the call.
+
+        A credential answered with InvalidClientTokenId or
+        AccountLimitExceeded is taken out of rotation for `cooldown` seconds
+        and the call is tried again with the next best credential.
+    """
+
+    def __init__(self, credentials, rate_limiter=None, cooldown=300,
+                 **kwargs):
+
+        """
+            :param credentials: Iterable, of (aws_access_key, secret_key,
+                                associate_tag) tuples.
+            :param rate_limiter: RateLimiter, shared by the credentials, a
+                                 new one with its defaults if None.
+            :param cooldown: Integer, seconds a failing credential is kept
+                             out of rotation.
+            :param kwargs: dictionary, extra AmazonAPI arguments
+                           (i.e: cache, parser)
+        """
+
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.cooldown = cooldown
+
+        self.credentials = [
+            Credential(AmazonAPI(access_key, secret_key, associate_tag,
+                                 rate_limiter=self.rate_limiter, **kwargs))
+            for access_key, secret_key, associate_tag in credentials]
+
+        if not self.credentials:
+            raise AmazonAPIError('At least one credential is needed')
+
+        self._started = time()
+        self._lock = threading.Lock()
+
+    def _candidates(self, host):
+
+        """
+            Credentials in rotation, the one with the most spare budget on
+            host first.
+
+            :rType: List, of Credential
+        """
+
+        now = time()
+        host_name = self.credentials[0].client._host_name(host)
+
+        with self._lock:
+            available = [credential for credential in self.credentials
+                         if credential.benched_until <= now]
+
+        def budget(credential):
+            bucket = self.rate_limiter.bucket(credential.access_key,
+                                              host_name)
+            return bucket.expected_wait(), -bucket.available()
+
+        return sorted(available, key=budget)
+
+    def _record(self, credential, error_code=None):
+
+        with self._lock:
+            credential.calls += 1
+
+            if error_code is not None:
+                credential.errors += 1
+                credential.error_codes[error_code] = \
+                    credential.error_codes.get(error_code, 0) + 1
+
+                if error_code in BENCH_ERRORS:
+                    credential.benched += 1
+                    credential.benched_until = time() + self.cooldown
+
+    def _call(self, host, params):
+
+        candidates = self._candidates(host)
+
+        if not candidates:
+            raise AmazonAPIError('Every credential is out of rotation')
+
+        for credential in candidates:
+            client = credential.client
+            # _request_parameters fills in the credential, sign a copy
+            host_name, request_url, cache_entry, metrics = \
+                client._prepare(host, dict(params))
+
+            # Every call counts, network errors and timeouts included
+            error_code = None
+            try:
+                return client._fetch(host_name, request_url, True,
+                                     cache_entry, metrics)
+            except Exception as e:
+                if isinstance(e, AmazonAPIResponseError) and e.code:
+                    error_code = e.code
+                else:
+                    error_code = e.__class__.__name__
+
+                if error_code not in BENCH_ERRORS:
+                    raise
+                error = e
+            finally:
+                self._record(credential, error_code)
+
+        # Every candidate was benched by this call
+        raise error
+
+    def stats(self):
+
+        """
+            Per credential throughput and error rates.
+
+            :rType: dictionary, of access key to Credential.stats
+        """
+
+        elapsed = time() - self._started
+
+        with self._lock:
+            return dict((credential.access_key, credential.stats(elapsed))
+                        for credential in self.credentials)
+
+    def close(self):
+
+        """
+            Releases the pooled connections of every credential.
+        """
+
+        for credential in self.credentials:
+            credential.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ===============================================================
+    #                  Amazon API Allowed operations
+    # ===============================================================
+
+    def item_lookup(self, host=None, **kwargs):
+
+        """
+            AmazonAPI.item_lookup, through the credential with the most
+            spare budget.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        kwargs['Operation'] = 'ItemLookup'
+
+        return self._call(host, kwargs)
+
+    def item_search(self, host=None, **kwargs):
+
+        """
+            AmazonAPI.item_search, through the credential with the most
+            spare budget.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        kwargs['Operation'] = 'ItemSearch'
+
+        return self._call(host, kwargs)
+
+    def similarity_lookup(self, host=None, **kwargs):
+
+        """
+            AmazonAPI.similarity_lookup, through the credential with the
+            most spare budget.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        kwargs['Operation'] = 'SimilarityLookup'
+
+        return self._call(host, kwargs)
+
+    def node_browse_lookup(self, host=None, browse_node_id=None,
+                           response_group=None):
+
+        """
+            AmazonAPI.node_browse_lookup, through the credential with the
+            most spare budget.
+
+            :rType: BeautifulSoup XML Object
+        """
+
+        if browse_node_id is None:
+            raise AmazonAPIError('browse_node_id cannot be None/Null')
+
+        params = dict()
+        params['Operation'] = 'BrowseNodeLookup'
+        params['BrowseNodeId'] = browse_node_id
+
+        if response_group is not None:
+            params['ResponseGroup'] = response_group
+
+        return self._call(host, params)
@@ -0,0 +1,356 @@
+"""
+    Looks up the ASINs read from files or stdin, one per line, and writes
+    an Item per ASIN as JSON lines or CSV, in input order. ASINs are looked
+    up 10 at a time, by several workers, and results are written as they
+    come, so memory use doesn't grow with the input.
+
+    Rerun with --resume and the same input to go on from where an
+    interrupted export stopped: the rows already in the output are skipped.
+
+        amazon-export asins.txt --host us --output items.jsonl --resume
+        cat asins.txt | amazon-export --format csv --fields title,sales_rank
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+from textwrap import dedent
+from itertools import islice
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from amazon.amazon_api import (HOSTS, PARSERS, MAX_ITEM_IDS, AmazonAPI,
+                               AmazonAPIResponseError)
+from amazon.models import Item, extract_items
+from amazon.projection import Projection
+from amazon.rate_limit import RateLimiter
+
+
+FORMATS = ('jsonl', 'csv')
+
+# Item fields exported when --fields isn't given
+FIELDS = tuple(name for name in Item.__slots__ if name != 'asin')
+
+# Credentials are read from these when not given as options
+ENV_ACCESS_KEY = 'AMAZON_ACCESS_KEY'
+ENV_SECRET_KEY = 'AMAZON_SECRET_KEY'
+ENV_ASSOCIATE_TAG = 'AMAZON_ASSOCIATE_TAG'
+
+
+def read_ids(paths):
+
+    """
+        ASINs of the files in paths ('-' for stdin), one per line. Blank
+        lines and lines starting with # are skipped.
+
+        :rType: generator of String
+    """
+
+    for path in paths:
+        source = sys.stdin if path == '-' else open(path)
+
+        try:
+            for line in source:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+
+def chunks(ids, size=MAX_ITEM_IDS):
+
+    """
+        :rType: generator of Lists of at most size ids.
+    """
+
+    chunk = list()
+
+    for item_id in ids:
+        chunk.append(item_id)
+
+        if len(chunk) == size:
+            yield chunk
+            chunk = list()
+
+    if chunk:
+        yield chunk
+
+
+def error_text(error):
+
+    if isinstance(error, AmazonAPIResponseError) and error.code:
+        return '%s: %s' % (error.code, error)
+
+    return '%s: %s' % (type(error).__name__, error)
+
+
+def lookup_rows(api, host, chunk, params, fields):
+
+    """
+        Looks up the ids of chunk on host, in a single ItemLookup.
+
+        :rType: List, of dictionaries with the asin and the fields of its
+                Item, or the asin and an error, in chunk order.
+    """
+
+    batch = api.item_lookup_batch(host, chunk, **params)
+    items = dict((item.ASIN.string, item) for item in batch)
+
+    rows = list()
+
+    for item_id in chunk:
+        row = dict(asin=item_id)
+        item = items.get(item_id)
+
+        if item is None:
+            row['error'] = error_text(batch.errors[item_id])
+        else:
+            values = next(extract_items(item)).to_dict()
+            for field in fields:
+                row[field] = values[field]
+
+        rows.append(row)
+
+    return rows
+
+
+class JSONLinesWriter(object):
+
+    def __init__(self, output, fields):
+        self.output = output
+
+    def write(self, row):
+        self.output.write(json.dumps(row, sort_keys=True) + '\n')
+
+
+class CSVWriter(object):
+
+    """
+        One column per field, plus asin first and error last. Nested fields
+        (offers, images) are written as JSON. Line breaks inside values are
+        replaced by spaces so every row is a single line.
+    """
+
+    def __init__(self, output, fields):
+
+        self.columns = ('asin',) + tuple(fields) + ('error',)
+        self._writer = csv.writer(output, lineterminator='\n')
+
+    def header(self):
+        self._writer.writerow(self.columns)
+
+    def _cell(self, value):
+
+        if value is None:
+            return ''
+
+        if isinstance(value, (list, tuple)):
+            value = json.dumps(value, sort_keys=True)
+
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+
+        return str(value).replace('\r', ' ').replace('\n', ' ')
+
+    def write(self, row):
+        self._writer.writerow([self._cell(row.get(column))
+                               for column in self.columns])
+
+
+WRITERS = dict(jsonl=JSONLinesWriter, csv=CSVWriter)
+
+
+def checkpoint(path):
+
+    """
+        Counts the complete lines of a previous output and cuts off a last
+        line left half written.
+
+        :rType: Integer, lines in path, 0 if it doesn't exist.
+    """
+
+    if not os.path.exists(path):
+        return 0
+
+    lines = 0
+    end = position = 0
+
+    with open(path, 'rb+') as output:
+        for block in iter(lambda: output.read(1024 * 1024), ''):
+            lines += block.count('\n')
+
+            last = block.rfind('\n')
+            if last >= 0:
+                end = position + last + 1
+            position += len(block)
+
+        output.truncate(end)
+
+    return lines
+
+
+def export(api, host, ids, writer, output, params=None, fields=FIELDS,
+           concurrency=4):
+
+    """
+        Looks up ids and writes a row per id with writer, in input order.
+        At most 2 * concurrency lookups are queued at any time.
+
+        :param api: AmazonAPI
+        :param host: String, host key (i.e: us)
+        :param ids: Iterable, ASINs.
+        :param writer: JSONLinesWriter or CSVWriter.
+        :param output: File, flushed after every lookup.
+        :param params: dictionary, extra ItemLookup params.
+        :param fields: Tuple, Item fields written.
+        :param concurrency: Integer, lookups in flight at once.
+
+        :rType: dictionary, with ids, items and errors written.
+    """
+
+    params = dict(params or ())
+
+    counts = dict(ids=0, items=0, errors=0)
+    pending = deque()
+    workers = ThreadPool(concurrency)
+
+    def write(result):
+        for row in result.get():
+            writer.write(row)
+            counts['ids'] += 1
+            counts['errors' if 'error' in row else 'items'] += 1
+        output.flush()
+
+    try:
+        for chunk in chunks(ids):
+            pending.append(workers.apply_async(lookup_rows,
+                                               (api, host, chunk, params,
+                                                fields)))
+
+            if len(pending) >= 2 * concurrency:
+                write(pending.popleft())
+
+        while pending:
+            write(pending.popleft())
+    finally:
+        workers.terminate()
+
+    return counts
+
+
+def parse_args(argv):
+
+    parser = argparse.ArgumentParser(
+        description=dedent(__doc__.split('\n\n')[0]).strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=dedent(__doc__.split('\n\n', 1)[1]))
+    parser.add_argument('inputs', nargs='*', default=['-'], metavar='INPUT',
+                        help="files with one ASIN per line, - for stdin "
+                             "(default)")
+    parser.add_argument('--host', default='us', choices=sorted(HOSTS),
+                        help="marketplace (default us)")
+    parser.add_argument('--output', '-o',
+                        help="file to write, stdout if not given")
+    parser.add_argument('--format', choices=FORMATS,
+                        help="output format, guessed from the --output "
+                             "extension, jsonl by default")
+    parser.add_argument('--fields',
+                        help="comma separated Item fields to write "
+                             "(default all): %s" % ', '.join(FIELDS))
+    parser.add_argument('--response-group',
+                        help="ResponseGroup of the lookups (default the "
+                             "smallest one returning --fields)")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="lookups in flight at once (default 4)")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="max requests per second (default 1)")
+    parser.add_argument('--parser', choices=PARSERS, default='lxml',
+                        help="XML parser (default lxml)")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip the ASINs already in --output and append "
+                             "to it")
+    parser.add_argument('--access-key', default=os.environ.get(ENV_ACCESS_KEY),
+                        help="defaults to $%s" % ENV_ACCESS_KEY)
+    parser.add_argument('--secret-key', default=os.environ.get(ENV_SECRET_KEY),
+                        help="defaults to $%s" % ENV_SECRET_KEY)
+    parser.add_argument('--associate-tag',
+                        default=os.environ.get(ENV_ASSOCIATE_TAG),
+                        help="defaults to $%s" % ENV_ASSOCIATE_TAG)
+
+    args = parser.parse_args(argv)
+
+    if not (args.access_key and args.secret_key and args.associate_tag):
+        parser.error("credentials missing, use --access-key, --secret-key "
+                     "and --associate-tag or their environment variables")
+
+    if args.fields:
+        args.fields = tuple(field.strip() for field in args.fields.split(',')
+                            if field.strip() and field.strip() != 'asin')
+        unknown = [field for field in args.fields if field not in FIELDS]
+        if unknown:
+            parser.error("unknown fields: %s" % ', '.join(unknown))
+    else:
+        args.fields = FIELDS
+
+    if args.response_group is None:
+        args.response_group = Projection(args.fields).response_group
+
+    if args.format is None:
+        extension = os.path.splitext(args.output or '')[1].lstrip('.')
+        args.format = extension if extension in FORMATS else 'jsonl'
+
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    return args
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+
+    done = checkpoint(args.output) if args.resume else 0
+
+    api = AmazonAPI(args.access_key, args.secret_key, args.associate_tag,
+                    pool_size=args.concurrency, parser=args.parser,
+                    rate_limiter=RateLimiter(rate=args.rate))
+
+    if args.output:
+        output = open(args.output, 'ab' if args.resume else 'wb')
+    else:
+        output = sys.stdout
+
+    writer = WRITERS[args.format](output, args.fields)
+
+    ids = read_ids(args.inputs)
+
+    if args.format == 'csv':
+        if done:
+            # The header is the first line of the output
+            done -= 1
+        else:
+            writer.header()
+
+    try:
+        counts = export(api, args.host, islice(ids, done, None), writer,
+                        output, dict(ResponseGroup=args.response_group),
+                        args.fields, args.concurrency)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        api.close()
+
+    sys.stderr.write('%d ASINs skipped, %d exported: %d items, %d errors\n' %
+                     (done, counts['ids'], counts['items'], counts['errors']))
+
+    return 1 if counts['ids'] and not counts['items'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import threading
+
+from lxml import etree
+
+
+# lxml parsers must not be shared between threads
+_local = threading.local()
+
+
+def _parser():
+
+    parser = getattr(_local, 'parser', None)
+
+    if parser is None:
+        # Blank text between tags is never read and only costs memory
+        parser = etree.XMLParser(remove_blank_text=True,
+                                 resolve_entities=False)
+        _local.parser = parser
+
+    return parser
+
+
+def _any_ns(name):
+
+    # Amazon responses use a namespace per API version and response type,
+    # match the local name of tags whatever their namespace.
+    return '{*}%s' % name
+
+
+class XMLNode(object):
+
+    """
+        Lightweight wrapper over an lxml element offering the parts of the
+        BeautifulSoup Tag API used on Amazon responses, so code like
+        response.Items.Item.ASIN.string works with either parser.
+    """
+
+    __slots__ = ('element',)
+
+    def __init__(self, element):
+        self.element = element
+
+    def _descendants(self, name):
+        return self.element.iterdescendants(_any_ns(name))
+
+    def __getattr__(self, name):
+
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        return self.find(name)
+
+    def __nonzero__(self):
+        return True
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __getitem__(self, attribute):
+        return self.element.attrib[attribute]
+
+    def __str__(self):
+        return etree.tostring(self.element, encoding='utf-8')
+
+    @property
+    def name(self):
+        return etree.QName(self.element).localname
+
+    @property
+    def attrs(self):
+        return dict(self.element.attrib)
+
+    @property
+    def children(self):
+        return [XMLNode(child) for child in self.element
+                if isinstance(child.tag, basestring)]
+
+    @property
+    def parent(self):
+
+        parent = self.element.getparent()
+
+        return XMLNode(parent) if parent is not None else None
+
+    @property
+    def string(self):
+
+        """
+            Text of the tag if it has no child tags, the string of its only
+            child tag if it has one, None otherwise (as Tag.string does).
+        """
+
+        element = self.element
+
+        while len(element) == 1 and not element.text:
+            element = element[0]
+
+        if len(element):
+            return None
+
+        return element.text
+
+    @property
+    def text(self):
+        return self.get_text()
+
+    def get(self, attribute, default=None):
+        return self.element.get(attribute, default)
+
+    def get_text(self):
+        return ''.join(self.element.itertext())
+
+    def find(self, name, recursive=True):
+
+        """
+            :rType: XMLNode, first tag named name, None if there isn't any.
+        """
+
+        if recursive:
+            elements = self._descendants(name)
+        else:
+            elements = self.element.iterchildren(_any_ns(name))
+
+        for element in elements:
+            return XMLNode(element)
+
+        return None
+
+    def find_all(self, name, recursive=True):
+
+        """
+            :rType: List, of XMLNode for every tag named name.
+        """
+
+        if recursive:
+            elements = self._descendants(name)
+        else:
+            elements = self.element.iterchildren(_any_ns(name))
+
+        return [XMLNode(element) for element in elements]
+
+    findAll = find_all
+
+
+class XMLDocument(XMLNode):
+
+    """
+        Root of a parsed response. Like a BeautifulSoup object, lookups
+        include the root tag itself (response.ItemLookupResponse).
+    """
+
+    __slots__ = ()
+
+    def _descendants(self, name):
+        return self.element.iter(_any_ns(name))
+
+
+def parse(content):
+
+    """
+        Parses the XML content of an Amazon response.
+
+        :param content: String, raw XML.
+
+        :rType: XMLDocument
+    """
+
+    return XMLDocument(etree.fromstring(content, _parser()))
@@ -0,0 +1,388 @@
+import socket
+import threading
+from bisect import bisect_left
+from time import time
+
+
+# Phases of a call, in the order they run
+PHASES = ('params', 'sign', 'cache', 'rate_limit', 'http', 'parse',
+          'backoff', 'check')
+
+# Upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class CallMetrics(object):
+
+    """
+        What a call did and how long each of its phases took. AmazonAPI
+        fills one per call when hooks are registered, and hands it to every
+        hook once the call is over.
+    """
+
+    __slots__ = ('host', 'operation', 'phases', 'bytes', 'status',
+                 'error_code', 'error', 'cached', 'attempts', 'hedged',
+                 'started', 'duration', '_last')
+
+    def __init__(self, host, operation):
+
+        """
+            :param host: String, amazon host name of the call.
+            :param operation: String, Operation param (i.e: ItemLookup)
+        """
+
+        self.host = host
+        self.operation = operation
+        # Phase name to seconds
+        self.phases = dict()
+        self.bytes = None
+        self.status = None
+        self.error_code = None
+        self.error = None
+        self.cached = False
+        # HTTP requests made, more than 1 when the call was retried
+        self.attempts = 0
+        self.hedged = False
+        self.started = self._last = time()
+        self.duration = None
+
+    def mark(self, phase):
+
+        """
+            Ends phase, which started when the previous one ended.
+        """
+
+        now = time()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def finish(self):
+        self.duration = time() - self.started
+
+    def __repr__(self):
+        return 'CallMetrics(%s, %s, %.6fs)' % (self.host, self.operation,
+                                               self.duration or 0.0)
+
+
+class Histogram(object):
+
+    """
+        Counts of observed values per bucket of BUCKETS, plus their count,
+        sum and max. Not thread safe on its own, MetricsRecorder locks it.
+    """
+
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def observe(self, value):
+
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+
+        """
+            Adds the values observed by other Histogram.
+        """
+
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max,
+                                                              other.max)
+
+    def percentile(self, q):
+
+        """
+            :param q: Float, between 0 and 1.
+
+            :rType: Float, upper bound of the bucket holding the q-th value,
+                    or the max when it's lower: values past the last bucket
+                    report the max rather than infinity. None when nothing
+                    was observed.
+        """
+
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if i < len(BUCKETS):
+                    return min(BUCKETS[i], self.max)
+                return self.max
+
+    def cumulative(self):
+
+        """
+            :rType: List, of (upper bound, values up to it), ending with
+                    +Inf.
+        """
+
+        bounds = list(BUCKETS) + [float('inf')]
+        total = 0
+        result = list()
+
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class MetricsRecorder(object):
+
+    """
+        Hook keeping in memory a Histogram of the duration of every phase
+        and of whole calls, along with call, error and response byte
+        counters, per operation, host and HTTP status. Its numbers can be
+        read with stats() or exported in the Prometheus text format with
+        prometheus().
+
+        >>> recorder = MetricsRecorder()
+        >>> amz = AmazonAPI(key, secret, tag, hooks=[recorder])
+    """
+
+    def __init__(self):
+
+        # (operation, host, status, phase) to Histogram, phase 'total' for
+        # whole calls
+        self.histograms = dict()
+        # (operation, host, status, error code) to count
+        self.errors = dict()
+        # (operation, host, status) to count
+        self.calls = dict()
+        self.bytes = dict()
+        self.cache_hits = dict()
+        self.retries = dict()
+        self.hedges = dict()
+
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics):
+
+        labels = (metrics.operation, metrics.host, metrics.status)
+
+        with self._lock:
+            for phase, seconds in metrics.phases.iteritems():
+                self._histogram(labels + (phase,)).observe(seconds)
+            self._histogram(labels + ('total',)).observe(metrics.duration)
+
+            self._count(self.calls, labels)
+
+            if metrics.bytes:
+                self._count(self.bytes, labels, metrics.bytes)
+
+            if metrics.cached:
+                self._count(self.cache_hits, labels)
+
+            if metrics.attempts > 1:
+                self._count(self.retries, labels, metrics.attempts - 1)
+
+            if metrics.hedged:
+                self._count(self.hedges, labels)
+
+            error = metrics.error_code or (metrics.error and
+                                           type(metrics.error).__name__)
+            if error:
+                self._count(self.errors, labels + (error,))
+
+    def _count(self, counter, key, value=1):
+        counter[key] = counter.get(key, 0) + value
+
+    def _histogram(self, key):
+
+        histogram = self.histograms.get(key)
+
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+
+        return histogram
+
+    def stats(self):
+
+        """
+            :rType: dictionary, of operation to a dictionary with calls,
+                    bytes, cache_hits, retries, hedges, errors (per code),
+                    hosts (host to HTTP status to calls), and count, mean,
+                    p50 and p99 seconds per phase.
+        """
+
+        with self._lock:
+            result = dict()
+
+            for (operation, host, status), calls in self.calls.iteritems():
+                stats = result.get(operation)
+                if stats is None:
+                    stats = result[operation] = dict(
+                        calls=0, bytes=0, cache_hits=0, retries=0, hedges=0,
+                        errors=dict(), hosts=dict(), phases=dict())
+
+                stats['calls'] += calls
+                self._count(stats['hosts'].setdefault(host, dict()), status,
+                            calls)
+
+            for name in ('bytes', 'cache_hits', 'retries', 'hedges'):
+                for (operation, host, status), value in \
+                        getattr(self, name).iteritems():
+                    result[operation][name] += value
+
+            for (operation, host, status, code), count in \
+                    self.errors.iteritems():
+                self._count(result[operation]['errors'], code, count)
+
+            # Phases of an operation, whatever the host and status
+            phases = dict()
+            for (operation, host, status, phase), histogram in \
+                    self.histograms.iteritems():
+                phases.setdefault((operation, phase), Histogram()).merge(
+                    histogram)
+
+            for (operation, phase), histogram in phases.iteritems():
+                result[operation]['phases'][phase] = dict(
+                    count=histogram.count,
+                    mean=histogram.sum / histogram.count,
+                    p50=histogram.percentile(0.5),
+                    p99=histogram.percentile(0.99))
+
+            return result
+
+    def prometheus(self, prefix='amazon_api'):
+
+        """
+            :rType: String, every metric in the Prometheus text exposition
+                    format, to be served on a /metrics endpoint. Every
+                    sample has operation, host and status labels, status is
+                    empty for calls that got no response.
+        """
+
+        def labels(operation, host, status):
+            return 'operation="%s",host="%s",status="%s"' % (
+                operation, host, '' if status is None else status)
+
+        lines = list()
+
+        with self._lock:
+            lines.append('# TYPE %s_phase_seconds histogram' % prefix)
+            for (operation, host, status, phase), histogram in \
+                    sorted(self.histograms.iteritems()):
+                names = '%s,phase="%s"' % (labels(operation, host, status),
+                                           phase)
+
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_phase_seconds_bucket{%s,le="%s"} %d' %
+                                 (prefix, names, le, count))
+
+                lines.append('%s_phase_seconds_sum{%s} %r' %
+                             (prefix, names, histogram.sum))
+                lines.append('%s_phase_seconds_count{%s} %d' %
+                             (prefix, names, histogram.count))
+
+            for name, counter in (('calls', self.calls),
+                                  ('response_bytes', self.bytes),
+                                  ('cache_hits', self.cache_hits),
+                                  ('retries', self.retries),
+                                  ('hedges', self.hedges)):
+                lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+                for key, value in sorted(counter.iteritems()):
+                    lines.append('%s_%s_total{%s} %d' %
+                                 (prefix, name, labels(*key), value))
+
+            lines.append('# TYPE %s_errors_total counter' % prefix)
+            for (operation, host, status, code), count in \
+                    sorted(self.errors.iteritems()):
+                lines.append('%s_errors_total{%s,code="%s"} %d' %
+                             (prefix, labels(operation, host, status), code,
+                              count))
+
+        return '\n'.join(lines) + '\n'
+
+
+class StatsDExporter(object):
+
+    """
+        Hook sending the metrics of every call to a StatsD server over UDP,
+        as one packet per call:
+
+            <prefix>.<operation>.<phase>:<milliseconds>|ms|#<tags>
+            <prefix>.<operation>.calls:1|c|#<tags>
+            <prefix>.<operation>.bytes:<bytes>|c|#<tags>
+            <prefix>.<operation>.errors.<code>:1|c|#<tags>
+
+        Tags, in the DogStatsD format, are the host and the HTTP status
+        (i.e: #host:webservices.amazon.com,status:200), the status left out
+        for calls that got no response. Sending never fails the call, UDP
+        errors are dropped.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='amazon_api',
+                 tags=True):
+
+        """
+            :param host: String, StatsD server.
+            :param port: Integer, StatsD UDP port.
+            :param prefix: String, put before every metric name.
+            :param tags: Boolean, False to send plain StatsD lines, with no
+                         host and status, for servers without tags.
+        """
+
+        self.address = (host, port)
+        self.prefix = prefix
+        self.tags = tags
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def lines(self, metrics):
+
+        """
+            :rType: List, of StatsD lines for metrics.
+        """
+
+        name = '%s.%s' % (self.prefix, metrics.operation)
+
+        lines = ['%s.%s:%.3f|ms' % (name, phase, seconds * 1000)
+                 for phase, seconds in sorted(metrics.phases.iteritems())]
+        lines.append('%s.total:%.3f|ms' % (name, metrics.duration * 1000))
+        lines.append('%s.calls:1|c' % name)
+
+        if metrics.bytes:
+            lines.append('%s.bytes:%d|c' % (name, metrics.bytes))
+
+        error = metrics.error_code or (metrics.error and
+                                       type(metrics.error).__name__)
+        if error:
+            lines.append('%s.errors.%s:1|c' % (name, error.replace('.', '_')))
+
+        if self.tags:
+            tags = '|#host:%s' % metrics.host
+            if metrics.status is not None:
+                tags += ',status:%d' % metrics.status
+            lines = [line + tags for line in lines]
+
+        return lines
+
+    def __call__(self, metrics):
+
+        try:
+            self._socket.sendto('\n'.join(self.lines(metrics)), self.address)
+        except socket.error:
+            pass
+
+    def close(self):
+        self._socket.close()
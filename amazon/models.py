@@ -0,0 +1,437 @@
+import json
+from io import BytesIO
+
+from bs4.element import Tag, NavigableString, CData
+from lxml import etree
+
+from amazon.lxml_parser import XMLNode
+
+
+class Model(object):
+
+    """
+        Base of the typed results. Fields live in __slots__ so a model
+        costs a fraction of the XML tree it was extracted from. Models
+        round trip through to_dict/from_dict and to_json/from_json.
+    """
+
+    __slots__ = ()
+
+    # Field name to Model class, for fields holding tuples of models
+    _nested = dict()
+
+    def __init__(self, **fields):
+
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+
+        fields = ', '.join('%s=%r' % (name, getattr(self, name))
+                           for name in self.__slots__[:2])
+
+        return '%s(%s)' % (type(self).__name__, fields)
+
+    def to_dict(self):
+
+        """
+            :rType: dictionary, with nested models as lists of dicts.
+        """
+
+        fields = dict()
+
+        for name in self.__slots__:
+            value = getattr(self, name)
+
+            if name in self._nested and value is not None:
+                value = [model.to_dict() for model in value]
+
+            fields[name] = value
+
+        return fields
+
+    @classmethod
+    def from_dict(cls, fields):
+
+        fields = dict(fields)
+
+        for name, model in cls._nested.items():
+            if fields.get(name) is not None:
+                fields[name] = tuple(model.from_dict(value)
+                                     for value in fields[name])
+
+        return cls(**fields)
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, content):
+        return cls.from_dict(json.loads(content))
+
+
+class Image(Model):
+
+    __slots__ = ('kind', 'url', 'height', 'width')
+
+
+class Offer(Model):
+
+    """
+        An offer listing. Prices are integer amounts in the smallest unit
+        of the currency (i.e: cents), as Amazon sends them.
+    """
+
+    __slots__ = ('listing_id', 'condition', 'merchant', 'price',
+                 'currency', 'formatted_price', 'availability')
+
+
+class Item(Model):
+
+    """
+        An Item of an ItemLookup, ItemSearch or SimilarityLookup response.
+        Prices are integer amounts in the smallest unit of the currency.
+    """
+
+    __slots__ = ('asin', 'parent_asin', 'title', 'manufacturer', 'brand',
+                 'binding', 'product_group', 'detail_page_url', 'sales_rank',
+                 'list_price', 'lowest_new_price', 'lowest_used_price',
+                 'currency', 'total_new', 'total_used', 'total_offers',
+                 'offers', 'images')
+
+    _nested = dict(offers=Offer, images=Image)
+
+
+class BrowseNode(Model):
+
+    """
+        A node of a BrowseNodeLookup response, with its children and its
+        ancestors (each ancestor holding its own ancestors, up to the root).
+    """
+
+    __slots__ = ('node_id', 'name', 'is_category_root', 'children',
+                 'ancestors')
+
+
+BrowseNode._nested = dict(children=BrowseNode, ancestors=BrowseNode)
+
+
+# Text of these paths, relative to an Item, set these Item fields
+ITEM_FIELDS = {
+    ('ASIN',): ('asin', str),
+    ('ParentASIN',): ('parent_asin', str),
+    ('DetailPageURL',): ('detail_page_url', unicode),
+    ('SalesRank',): ('sales_rank', int),
+    ('ItemAttributes', 'Title'): ('title', unicode),
+    ('ItemAttributes', 'Manufacturer'): ('manufacturer', unicode),
+    ('ItemAttributes', 'Brand'): ('brand', unicode),
+    ('ItemAttributes', 'Binding'): ('binding', unicode),
+    ('ItemAttributes', 'ProductGroup'): ('product_group', unicode),
+    ('ItemAttributes', 'ListPrice', 'Amount'): ('list_price', int),
+    ('ItemAttributes', 'ListPrice', 'CurrencyCode'): ('currency', str),
+    ('OfferSummary', 'LowestNewPrice', 'Amount'): ('lowest_new_price', int),
+    ('OfferSummary', 'LowestNewPrice', 'CurrencyCode'): ('currency', str),
+    ('OfferSummary', 'LowestUsedPrice', 'Amount'): ('lowest_used_price', int),
+    ('OfferSummary', 'TotalNew'): ('total_new', int),
+    ('OfferSummary', 'TotalUsed'): ('total_used', int),
+    ('Offers', 'TotalOffers'): ('total_offers', int)}
+
+# Same for an Offer, relative to Item/Offers/Offer
+OFFER_FIELDS = {
+    ('Merchant', 'Name'): ('merchant', unicode),
+    ('OfferAttributes', 'Condition'): ('condition', str),
+    ('OfferListing', 'OfferListingId'): ('listing_id', str),
+    ('OfferListing', 'Price', 'Amount'): ('price', int),
+    ('OfferListing', 'Price', 'CurrencyCode'): ('currency', str),
+    ('OfferListing', 'Price', 'FormattedPrice'): ('formatted_price', unicode),
+    ('OfferListing', 'Availability'): ('availability', unicode)}
+
+IMAGE_KINDS = ('SmallImage', 'MediumImage', 'LargeImage')
+
+IMAGE_FIELDS = {
+    'URL': ('url', str),
+    'Height': ('height', int),
+    'Width': ('width', int)}
+
+BROWSE_NODE_FIELDS = {
+    'BrowseNodeId': ('node_id', int),
+    'Name': ('name', unicode),
+    'IsCategoryRoot': ('is_category_root', bool)}
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class _SoupElement(object):
+
+    """
+        Name and leading text of a BeautifulSoup Tag, as the tag and text of
+        an lxml element.
+    """
+
+    __slots__ = ('tag', 'text')
+
+    def __init__(self, tag):
+
+        self.tag = tag.name.rsplit(':', 1)[-1]
+
+        texts = list()
+        for child in tag.children:
+            if isinstance(child, Tag):
+                break
+            if type(child) in (NavigableString, CData):
+                texts.append(child)
+
+        self.text = u''.join(texts) or None
+
+
+def _soup_events(tag):
+
+    """
+        Start and end events of tag and the Tags below it, walking the soup
+        as it is, without serializing it back to XML.
+    """
+
+    # Tag and the iterator of its children, per open Tag
+    stack = list()
+
+    if tag.parent is None:
+        # The BeautifulSoup document itself, only its elements are events
+        stack.append((None, iter(tag.children)))
+    else:
+        element = _SoupElement(tag)
+        yield 'start', element
+        stack.append((element, iter(tag.children)))
+
+    while stack:
+        element, children = stack[-1]
+
+        for child in children:
+            if isinstance(child, Tag):
+                started = _SoupElement(child)
+                yield 'start', started
+                stack.append((started, iter(child.children)))
+                break
+        else:
+            stack.pop()
+            if element is not None:
+                yield 'end', element
+
+
+def _events(source):
+
+    """
+        Start and end events of every element of source, in a single pass.
+        Yields (event, element, owned): owned is True when the elements
+        were parsed here, so they can be freed once consumed.
+    """
+
+    if isinstance(source, XMLNode):
+        events = etree.iterwalk(source.element, events=('start', 'end'))
+        owned = False
+    elif isinstance(source, Tag):
+        events = _soup_events(source)
+        owned = False
+    else:
+        events = etree.iterparse(BytesIO(source), events=('start', 'end'),
+                                 remove_blank_text=True,
+                                 resolve_entities=False)
+        owned = True
+
+    for event, element in events:
+        if isinstance(element.tag, basestring):
+            yield event, element, owned
+
+
+def _value(convert, text):
+
+    text = (text or '').strip()
+
+    if not text:
+        return None
+
+    if convert is bool:
+        return text.lower() in ('1', 'true')
+
+    return convert(text)
+
+
+def extract_items(source, fields=None):
+
+    """
+        Extracts the Items of an ItemLookup, ItemSearch or SimilarityLookup
+        response in one pass over its XML.
+
+        :param source: String with the raw XML, or a response parsed by
+                       AmazonAPI with either parser. A lone <Item> (i.e:
+                       from item_lookup_many) is extracted as well.
+        :param fields: Tuple, Item fields to read, the others are left None
+                       and the subtrees holding only them are skipped. None
+                       reads every field.
+
+        :rType: generator of Item
+    """
+
+    item_fields = ITEM_FIELDS
+    wanted = None
+
+    if fields is not None:
+        item_fields = dict((path, field) for path, field
+                           in ITEM_FIELDS.iteritems() if field[0] in fields)
+        # Paths relative to an Item leading to a field, and the ones below
+        # which everything is read
+        wanted = set(path[:depth] for path in item_fields
+                     for depth in range(1, len(path) + 1))
+        wanted_below = set()
+        if 'offers' in fields:
+            wanted.update([('Offers',), ('Offers', 'Offer')])
+            wanted_below.add(('Offers', 'Offer'))
+        if 'images' in fields:
+            wanted.update((kind,) for kind in IMAGE_KINDS)
+            wanted_below.update((kind,) for kind in IMAGE_KINDS)
+
+    read_offers = fields is None or 'offers' in fields
+    read_images = fields is None or 'images' in fields
+
+    path = list()
+    item = offer = image = None
+    # Depth inside a skipped subtree, 0 when not in one
+    skipped = 0
+
+    for event, element, owned in _events(source):
+        if skipped:
+            if event == 'start':
+                skipped += 1
+            else:
+                skipped -= 1
+                if not skipped and owned:
+                    element.clear()
+            continue
+
+        name = _local_name(element.tag)
+
+        if event == 'start':
+            path.append(name)
+
+            if path[-2:] == ['Items', 'Item'] or path == ['Item']:
+                item = dict(offers=list() if read_offers else None,
+                            images=list() if read_images else None)
+                item_depth = len(path)
+
+            elif item is not None:
+                relative = tuple(path[item_depth:])
+
+                if (wanted is not None and relative not in wanted and
+                        relative[:2] not in wanted_below and
+                        relative[:1] not in wanted_below):
+                    path.pop()
+                    skipped = 1
+                elif relative == ('Offers', 'Offer') and read_offers:
+                    offer = dict()
+                elif (len(relative) == 1 and name in IMAGE_KINDS and
+                      read_images):
+                    image = dict(kind=name)
+
+            continue
+
+        relative = tuple(path[item_depth:]) if item is not None else None
+        path.pop()
+
+        if relative is None:
+            continue
+
+        if not relative:
+            if read_offers:
+                item['offers'] = tuple(item['offers'])
+            if read_images:
+                item['images'] = tuple(item['images'])
+            yield Item(**item)
+            item = None
+
+            if owned:
+                # Free the consumed Item and the ones before it
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+        elif offer is not None and relative == ('Offers', 'Offer'):
+            item['offers'].append(Offer(**offer))
+            offer = None
+
+        elif offer is not None and relative[:2] == ('Offers', 'Offer'):
+            if relative[2:] in OFFER_FIELDS:
+                field, convert = OFFER_FIELDS[relative[2:]]
+                offer[field] = _value(convert, element.text)
+
+        elif image is not None and len(relative) == 1:
+            item['images'].append(Image(**image))
+            image = None
+
+        elif image is not None and len(relative) == 2:
+            if relative[1] in IMAGE_FIELDS:
+                field, convert = IMAGE_FIELDS[relative[1]]
+                image[field] = _value(convert, element.text)
+
+        elif relative in item_fields:
+            field, convert = item_fields[relative]
+            item[field] = _value(convert, element.text)
+
+
+def extract_browse_nodes(source):
+
+    """
+        Extracts the BrowseNodes of a BrowseNodeLookup response in one pass
+        over its XML.
+
+        :param source: String with the raw XML, or a response parsed by
+                       AmazonAPI with either parser.
+
+        :rType: List, of BrowseNode
+    """
+
+    path = list()
+    nodes = list()
+    # Nodes being built, innermost last
+    stack = list()
+
+    for event, element, owned in _events(source):
+        name = _local_name(element.tag)
+
+        if event == 'start':
+            path.append(name)
+
+            if name == 'BrowseNode':
+                stack.append(dict(children=list(), ancestors=list()))
+
+            continue
+
+        path.pop()
+
+        if name == 'BrowseNode':
+            fields = stack.pop()
+            fields['children'] = tuple(fields['children'])
+            fields['ancestors'] = tuple(fields['ancestors'])
+            node = BrowseNode(**fields)
+
+            container = path[-1] if path else None
+
+            if container == 'Children' and stack:
+                stack[-1]['children'].append(node)
+            elif container == 'Ancestors' and stack:
+                stack[-1]['ancestors'].append(node)
+            elif container == 'BrowseNodes':
+                nodes.append(node)
+
+        elif stack and path and path[-1] == 'BrowseNode':
+            if name in BROWSE_NODE_FIELDS:
+                field, convert = BROWSE_NODE_FIELDS[name]
+                stack[-1][field] = _value(convert, element.text)
+
+    return nodes
@@ -0,0 +1,163 @@
+from itertools import combinations
+
+from amazon.models import Item, ITEM_FIELDS, IMAGE_KINDS, extract_items
+
+
+# Operations returning Items, which all take the same ResponseGroups
+OPERATIONS = ('ItemLookup', 'ItemSearch', 'SimilarityLookup')
+
+# Item children every ResponseGroup returns
+_IDS = (('ASIN',), ('ParentASIN',))
+
+_SMALL = _IDS + (('DetailPageURL',), ('ItemLinks',),
+                 ('ItemAttributes', 'Title'),
+                 ('ItemAttributes', 'Manufacturer'),
+                 ('ItemAttributes', 'ProductGroup'),
+                 ('ItemAttributes', 'Author'), ('ItemAttributes', 'Artist'),
+                 ('ItemAttributes', 'Actor'), ('ItemAttributes', 'Creator'))
+_ITEM_ATTRIBUTES = _IDS + (('DetailPageURL',), ('ItemLinks',),
+                           ('ItemAttributes',))
+_SALES_RANK = _IDS + (('SalesRank',),)
+_IMAGES = _IDS + tuple((kind,) for kind in IMAGE_KINDS) + (('ImageSets',),)
+_OFFER_SUMMARY = _IDS + (('OfferSummary',),)
+_OFFERS = _OFFER_SUMMARY + (('Offers',),)
+_MEDIUM = (_SMALL + _ITEM_ATTRIBUTES + _SALES_RANK + _IMAGES +
+           _OFFER_SUMMARY + (('EditorialReviews',),))
+_LARGE = _MEDIUM + _OFFERS + (('BrowseNodes',), ('SimilarProducts',),
+                              ('Accessories',), ('Tracks',))
+
+# ResponseGroup to (rough KB per Item, paths relative to an Item it returns)
+RESPONSE_GROUPS = {
+    'Small': (1.0, _SMALL),
+    'ItemAttributes': (2.5, _ITEM_ATTRIBUTES),
+    'SalesRank': (0.2, _SALES_RANK),
+    'Images': (3.0, _IMAGES),
+    'OfferSummary': (0.5, _OFFER_SUMMARY),
+    'Offers': (1.5, _OFFERS),
+    'Medium': (9.0, _MEDIUM),
+    'Large': (14.0, _LARGE)}
+
+# Paths relative to an Item each field is read from
+FIELD_PATHS = dict((field, list()) for field in Item.__slots__)
+for _path, (_field, _convert) in ITEM_FIELDS.items():
+    FIELD_PATHS[_field].append(_path)
+FIELD_PATHS['offers'] = [('Offers', 'Offer')]
+FIELD_PATHS['images'] = [(kind,) for kind in IMAGE_KINDS]
+
+# Element names callers may use instead of Item fields (i.e: LowestNewPrice)
+FIELD_NAMES = dict(Offers='offers', Images='images')
+for _path, (_field, _convert) in ITEM_FIELDS.items():
+    FIELD_NAMES[_path[-2] if _path[-1] == 'Amount' else _path[-1]] = _field
+
+
+def item_field(name):
+
+    """
+        :param name: String, Item field (i.e: lowest_new_price) or element
+                     name (i.e: LowestNewPrice).
+
+        :rType: String, Item field.
+    """
+
+    if name in FIELD_PATHS:
+        return name
+
+    if name in FIELD_NAMES:
+        return FIELD_NAMES[name]
+
+    raise ValueError("Unknown field: %s" % name)
+
+
+def _covers(group_paths, path):
+
+    return any(path[:len(group_path)] == group_path
+               for group_path in group_paths)
+
+
+def response_groups(fields):
+
+    """
+        Cheapest combination of ResponseGroups returning every field, by the
+        rough size of the Items each group returns. Ties go to the fewest
+        groups.
+
+        :param fields: Iterable, Item fields.
+
+        :rType: Tuple, of ResponseGroup names, sorted.
+    """
+
+    needed = list()
+    for field in fields:
+        paths = FIELD_PATHS[field]
+        # ASIN comes with every group
+        if not any(_covers(_IDS, path) for path in paths):
+            needed.append(paths)
+
+    groups = sorted(RESPONSE_GROUPS)
+    best = None
+
+    for count in range(1, len(groups) + 1):
+        for combination in combinations(groups, count):
+            group_paths = sum((RESPONSE_GROUPS[group][1]
+                               for group in combination), ())
+
+            if not all(any(_covers(group_paths, path) for path in paths)
+                       for paths in needed):
+                continue
+
+            cost = sum(RESPONSE_GROUPS[group][0] for group in combination)
+            if best is None or cost < best[0]:
+                best = (cost, combination)
+
+    return best[1]
+
+
+class Projection(object):
+
+    """
+        The Item fields a caller needs, with the smallest ResponseGroup that
+        returns them and an extractor reading only them:
+
+        >>> projection = Projection(['ASIN', 'Title', 'LowestNewPrice'])
+        >>> projection.response_group
+        'OfferSummary,Small'
+        >>> response = amz.item_lookup('us', ItemId=asin,
+        ...                            ResponseGroup=projection.response_group)
+        >>> items = list(projection.extract(response))
+    """
+
+    def __init__(self, fields, operation='ItemLookup'):
+
+        """
+            :param fields: Iterable, Item fields or element names, asin is
+                           always included.
+            :param operation: String, one of OPERATIONS.
+        """
+
+        if operation not in OPERATIONS:
+            raise ValueError("Fields can only be projected for: %s" %
+                             ', '.join(OPERATIONS))
+
+        fields = set(item_field(name) for name in fields)
+        fields.add('asin')
+
+        self.operation = operation
+        self.fields = tuple(field for field in Item.__slots__
+                            if field in fields)
+        self.groups = response_groups(self.fields)
+
+    @property
+    def response_group(self):
+        return ','.join(self.groups)
+
+    def extract(self, source):
+
+        """
+            :rType: generator of Item, with only self.fields set.
+        """
+
+        return extract_items(source, self.fields)
+
+    def __repr__(self):
+        return 'Projection(%s, %s)' % (', '.join(self.fields),
+                                       self.response_group)
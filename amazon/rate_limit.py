@@ -0,0 +1,239 @@
+import threading
+from time import time, sleep
+
+
+# Error codes Amazon sends when a credential goes over its request budget
+THROTTLE_ERRORS = ('RequestThrottled', 'AccountLimitExceeded')
+
+
+class TokenBucket(object):
+
+    """
+        Token bucket pacing calls to `rate` requests per second, with bursts
+        of up to `burst` calls. The rate adapts AIMD style: it's multiplied
+        by `decrease` on a throttle error and grows back by `increase` on
+        every successful call, never above max_rate nor below min_rate.
+        Calls in flight together are throttled together, so throttles
+        within `cooldown` seconds of a decrease don't decrease it again.
+        Safe to share between threads.
+    """
+
+    def __init__(self, rate=1.0, burst=1, min_rate=0.1, max_rate=None,
+                 increase=0.01, decrease=0.5, cooldown=None):
+
+        """
+            :param rate: Float, starting requests per second.
+            :param burst: Integer, calls allowed back to back after idling.
+            :param min_rate: Float, lowest rate throttling can lead to.
+            :param max_rate: Float, highest rate successes can lead to,
+                             defaults to rate.
+            :param increase: Float, requests per second added per success.
+            :param decrease: Float, factor applied to rate per throttle.
+            :param cooldown: Float, seconds after a decrease during which
+                             throttles are only counted, one refill
+                             interval (1 / rate) by default.
+        """
+
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else self.rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self.calls = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.throttles = 0
+
+        self._tokens = float(burst)
+        self._updated = time()
+        self._decreased = None
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+
+        """
+            Takes a token, sleeping until one is available. Tokens are
+            reserved before sleeping, so concurrent callers queue up one
+            1/rate slot after the other.
+
+            :param deadline: Float, timestamp. When the token would only
+                             come after it, none is taken.
+
+            :rType: Float, seconds waited, None when the deadline came
+                    first.
+        """
+
+        with self._lock:
+            now = time()
+            tokens = min(self.burst,
+                         self._tokens + (now - self._updated) * self.rate)
+            wait = max(0.0, (1 - tokens) / self.rate)
+
+            self._tokens = tokens
+            self._updated = now
+
+            if deadline is not None and now + wait > deadline:
+                return None
+
+            self._tokens -= 1
+            if wait:
+                self.waits += 1
+                self.wait_time += wait
+
+            self.calls += 1
+
+        if wait:
+            sleep(wait)
+
+        return wait
+
+    def available(self):
+
+        """
+            Tokens that could be taken right now without waiting, negative
+            when callers are already queued for the next ones.
+
+            :rType: Float
+        """
+
+        with self._lock:
+            refill = (time() - self._updated) * self.rate
+            return min(self.burst, self._tokens + refill)
+
+    def expected_wait(self):
+
+        """
+            :rType: Float, seconds an acquire made now would wait.
+        """
+
+        return max(0.0, (1 - self.available()) / self.rate)
+
+    def throttled(self):
+
+        """
+            Multiplicative decrease, called when Amazon throttles a call.
+            At most one per cooldown.
+        """
+
+        with self._lock:
+            now = time()
+            self.throttles += 1
+
+            cooldown = self.cooldown
+            if cooldown is None:
+                cooldown = 1.0 / self.rate
+
+            if self._decreased is not None and \
+                    now - self._decreased < cooldown:
+                return
+
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._decreased = now
+
+    def succeeded(self):
+
+        """
+            Additive increase, called when a call goes through.
+        """
+
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def stats(self):
+
+        """
+            :rType: dictionary, with rate, calls, waits, wait_time and
+                    throttles.
+        """
+
+        with self._lock:
+            return dict(rate=self.rate, calls=self.calls, waits=self.waits,
+                        wait_time=self.wait_time, throttles=self.throttles)
+
+
+class RateLimiter(object):
+
+    """
+        Keeps a TokenBucket per (access key, host), since Amazon grants each
+        credential its own request budget. A single RateLimiter can be given
+        to several AmazonAPI clients, in any number of threads, to pace them
+        together.
+    """
+
+    def __init__(self, rates=None, **bucket_kwargs):
+
+        """
+            :param rates: dictionary, access key to starting rate, for
+                          credentials with a budget of their own.
+            :param bucket_kwargs: dictionary, TokenBucket arguments used for
+                                  every bucket (i.e: rate, burst)
+        """
+
+        self.rates = rates or dict()
+        self.bucket_kwargs = bucket_kwargs
+
+        self._buckets = dict()
+        self._lock = threading.Lock()
+
+    def bucket(self, access_key, host):
+
+        """
+            :rType: TokenBucket, for access_key on host.
+        """
+
+        key = (access_key, host)
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+
+            if bucket is None:
+                kwargs = dict(self.bucket_kwargs)
+                if access_key in self.rates:
+                    kwargs['rate'] = self.rates[access_key]
+
+                bucket = TokenBucket(**kwargs)
+                self._buckets[key] = bucket
+
+        return bucket
+
+    def acquire(self, access_key, host, deadline=None):
+
+        """
+            TokenBucket.acquire of access_key on host.
+
+            :rType: Float, seconds waited, None when the deadline came
+                    first.
+        """
+
+        return self.bucket(access_key, host).acquire(deadline)
+
+    def feedback(self, access_key, host, throttled):
+
+        """
+            Adapts the rate of access_key on host to the outcome of a call.
+
+            :param throttled: Boolean, whether Amazon throttled the call.
+        """
+
+        bucket = self.bucket(access_key, host)
+
+        if throttled:
+            bucket.throttled()
+        else:
+            bucket.succeeded()
+
+    def stats(self):
+
+        """
+            Per bucket metrics, including the total time calls waited.
+
+            :rType: dictionary, of (access key, host) to TokenBucket.stats
+        """
+
+        with self._lock:
+            buckets = self._buckets.items()
+
+        return dict((key, bucket.stats()) for key, bucket in buckets)
@@ -0,0 +1,360 @@
+import json
+import sqlite3
+import struct
+from hashlib import md5
+from time import time
+from multiprocessing.pool import ThreadPool
+
+from amazon.amazon_api import MAX_ITEM_IDS
+from amazon.models import extract_items
+from amazon.rate_limit import TokenBucket
+
+
+# Item fields a change of is reported by default: price and availability
+PRICE_FIELDS = ('list_price', 'lowest_new_price', 'lowest_used_price',
+                'currency', 'total_new', 'total_used', 'total_offers',
+                'offers')
+
+# ASINs taken off the schedule per round, the store is updated after every
+# lookup
+REFRESH_BATCH = 100
+
+
+def fingerprint(item, fields=PRICE_FIELDS):
+
+    """
+        64 bit hash of the fields of item. Items whose fields are equal
+        have the same fingerprint, so comparing fingerprints tells whether
+        an item changed without keeping the item itself.
+
+        :param item: models.Item
+        :param fields: Tuple, Item fields hashed.
+
+        :rType: Integer, signed so it fits an SQLite INTEGER.
+    """
+
+    values = item.to_dict()
+    content = json.dumps([values[field] for field in fields], sort_keys=True)
+
+    return struct.unpack('<q', md5(content).digest()[:8])[0]
+
+
+class TrackedItems(object):
+
+    """
+        On-disk refresh schedule of tracked ASINs, per host: one row per
+        ASIN with the fingerprint of its last poll, its poll interval and
+        the time of its next poll. Rows are a few dozen bytes, so millions
+        of ASINs fit in a small file.
+    """
+
+    def __init__(self, path, timeout=30):
+
+        """
+            :param path: String, SQLite database file.
+            :param timeout: Integer, seconds to wait on a locked database.
+        """
+
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=timeout)
+
+        with self._db as db:
+            db.execute("CREATE TABLE IF NOT EXISTS tracked ("
+                       " host TEXT NOT NULL,"
+                       " asin TEXT NOT NULL,"
+                       " fingerprint INTEGER,"
+                       " interval REAL NOT NULL,"
+                       " next_poll REAL NOT NULL,"
+                       " polled REAL,"
+                       " changed REAL,"
+                       " polls INTEGER NOT NULL DEFAULT 0,"
+                       " changes INTEGER NOT NULL DEFAULT 0,"
+                       " errors INTEGER NOT NULL DEFAULT 0,"
+                       " PRIMARY KEY (host, asin)) WITHOUT ROWID")
+            db.execute("CREATE INDEX IF NOT EXISTS tracked_schedule"
+                       " ON tracked (host, next_poll)")
+
+    def close(self):
+        self._db.close()
+
+    def track(self, host, asins, interval, now=None):
+
+        """
+            Adds the ASINs not tracked yet, due for a poll right away.
+
+            :param interval: Float, seconds between their first polls.
+        """
+
+        now = time() if now is None else now
+
+        with self._db as db:
+            db.executemany("INSERT OR IGNORE INTO tracked"
+                           " (host, asin, interval, next_poll)"
+                           " VALUES (?, ?, ?, ?)",
+                           [(host, asin, interval, now) for asin in asins])
+
+    def untrack(self, host, asins):
+
+        with self._db as db:
+            db.executemany("DELETE FROM tracked WHERE host = ? AND asin = ?",
+                           [(host, asin) for asin in asins])
+
+    def due(self, host, limit=REFRESH_BATCH, now=None):
+
+        """
+            ASINs whose next poll is past, most overdue first.
+
+            :rType: List, of (asin, fingerprint, interval), fingerprint is
+                    None for ASINs never polled.
+        """
+
+        now = time() if now is None else now
+
+        return self._db.execute("SELECT asin, fingerprint, interval"
+                                " FROM tracked"
+                                " WHERE host = ? AND next_poll <= ?"
+                                " ORDER BY next_poll LIMIT ?",
+                                (host, now, limit)).fetchall()
+
+    def next_due(self, host):
+
+        """
+            :rType: Float, time of the next poll, None if nothing is
+                    tracked on host.
+        """
+
+        return self._db.execute("SELECT MIN(next_poll) FROM tracked"
+                                " WHERE host = ?", (host,)).fetchone()[0]
+
+    def record(self, host, polls, now=None):
+
+        """
+            Stores the outcome of polls.
+
+            :param polls: List, of (asin, fingerprint, interval, changed),
+                          fingerprint None for a failed poll, which keeps
+                          the previous one. The next poll is interval
+                          seconds away.
+        """
+
+        now = time() if now is None else now
+
+        with self._db as db:
+            db.executemany("UPDATE tracked SET"
+                           " fingerprint = ?, interval = ?, next_poll = ?,"
+                           " polled = ?, polls = polls + 1,"
+                           " changed = CASE WHEN ? THEN ? ELSE changed END,"
+                           " changes = changes + ?"
+                           " WHERE host = ? AND asin = ?",
+                           [(fingerprint, interval, now + interval, now,
+                             changed, now, int(changed), host, asin)
+                            for asin, fingerprint, interval, changed in polls
+                            if fingerprint is not None])
+            db.executemany("UPDATE tracked SET"
+                           " interval = ?, next_poll = ?, errors = errors + 1"
+                           " WHERE host = ? AND asin = ?",
+                           [(interval, now + interval, host, asin)
+                            for asin, fingerprint, interval, changed in polls
+                            if fingerprint is None])
+
+    def item(self, host, asin):
+
+        """
+            :rType: dictionary, with the fingerprint, interval, next_poll,
+                    polled, changed, polls, changes and errors of asin.
+                    None if it isn't tracked.
+        """
+
+        row = self._db.execute("SELECT fingerprint, interval, next_poll,"
+                               " polled, changed, polls, changes, errors"
+                               " FROM tracked WHERE host = ? AND asin = ?",
+                               (host, asin)).fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip(('fingerprint', 'interval', 'next_poll', 'polled',
+                         'changed', 'polls', 'changes', 'errors'), row))
+
+    def counts(self, host, now=None):
+
+        """
+            :rType: dictionary, with the ASINs tracked and due, and demand,
+                    the lookups per second polling every ASIN on time
+                    takes, MAX_ITEM_IDS ASINs per lookup.
+        """
+
+        now = time() if now is None else now
+
+        tracked, due, polls_per_second = self._db.execute(
+            "SELECT COUNT(*), SUM(next_poll <= ?), SUM(1.0 / interval)"
+            " FROM tracked WHERE host = ?", (now, host)).fetchone()
+
+        return dict(tracked=tracked, due=due or 0,
+                    demand=(polls_per_second or 0.0) / MAX_ITEM_IDS)
+
+
+class RefreshScheduler(object):
+
+    """
+        Polls tracked ASINs with item_lookup, MAX_ITEM_IDS per lookup, and
+        reports only the Items that changed. A change is a new fingerprint
+        of `fields`, so unchanged items are never handed downstream.
+
+        Every ASIN has its own poll interval, adapted to how often it
+        changes: it is multiplied by `speedup` when the ASIN changed and by
+        `slowdown` when it didn't, between min_interval and max_interval.
+        Volatile ASINs end up polled often, stable ones rarely.
+
+        Lookups never go over `rate` per second. When the schedule asks for
+        more than that (see TrackedItems.counts) the most overdue ASINs go
+        first, so every ASIN is polled late rather than some never.
+    """
+
+    def __init__(self, api, store, rate=1.0, workers=4, fields=PRICE_FIELDS,
+                 interval=3600, min_interval=300, max_interval=7 * 24 * 3600,
+                 speedup=0.5, slowdown=1.5, response_group='Offers',
+                 batch=REFRESH_BATCH):
+
+        """
+            :param api: AmazonAPI, making the lookups.
+            :param store: TrackedItems, schedule of the tracked ASINs.
+            :param rate: Float, max lookups per second.
+            :param workers: Integer, max lookups in flight at once.
+            :param fields: Tuple, Item fields whose changes are reported.
+            :param interval: Float, seconds between the first polls of an
+                             ASIN.
+            :param min_interval: Float, seconds, shortest poll interval.
+            :param max_interval: Float, seconds, longest poll interval.
+            :param speedup: Float, interval factor after a change.
+            :param slowdown: Float, interval factor after no change.
+            :param response_group: String, ResponseGroup of the lookups,
+                                   it must hold the fields.
+            :param batch: Integer, ASINs taken off the schedule per round.
+        """
+
+        self.api = api
+        self.store = store
+        self.rate = rate
+        self.workers = workers
+        self.fields = fields
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.params = dict(ResponseGroup=response_group)
+        self.batch = batch
+
+        self._bucket = TokenBucket(rate=rate, burst=1)
+        self._workers = ThreadPool(workers)
+
+    def close(self):
+
+        """
+            Stops the workers once the lookups in flight are done.
+        """
+
+        self._workers.close()
+        self._workers.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def track(self, host, asins):
+        self.store.track(host, asins, self.interval)
+
+    def next_interval(self, interval, changed):
+
+        """
+            :rType: Float, seconds until the next poll of an ASIN polled
+                    every interval seconds.
+        """
+
+        interval *= self.speedup if changed else self.slowdown
+
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _lookup(self, host, chunk):
+
+        """
+            :rType: List, of (ASIN, <Item> or None when it wasn't found) in
+                    chunk order.
+        """
+
+        self._bucket.acquire()
+
+        batch = self.api.item_lookup_batch(host, chunk, **self.params)
+        items = dict((item.ASIN.string, item) for item in batch)
+
+        return [(asin, items.get(asin)) for asin in chunk]
+
+    def refresh(self, host, max_lookups=None):
+
+        """
+            Polls the ASINs of host that are due, and yields the Items that
+            changed since their last poll, or were polled for the first
+            time. Returns once the ASINs due when it was called are polled,
+            or after max_lookups.
+
+            :param host: String, host key (i.e: us)
+            :param max_lookups: Integer, stop after this many lookups.
+
+            :rType: generator of models.Item
+        """
+
+        started = time()
+        lookups = 0
+
+        while max_lookups is None or lookups < max_lookups:
+            limit = self.batch
+            if max_lookups is not None:
+                limit = min(limit, (max_lookups - lookups) * MAX_ITEM_IDS)
+
+            due = dict((asin, (fingerprint, interval))
+                       for asin, fingerprint, interval
+                       in self.store.due(host, limit, started))
+            if not due:
+                break
+
+            asins = sorted(due)
+            chunks = [asins[i:i + MAX_ITEM_IDS]
+                      for i in range(0, len(asins), MAX_ITEM_IDS)]
+            lookups += len(chunks)
+
+            results = self._workers.imap_unordered(
+                lambda chunk: self._lookup(host, chunk), chunks)
+
+            for chunk_results in results:
+                polls = list()
+                changed_items = list()
+
+                for asin, item in chunk_results:
+                    previous, interval = due[asin]
+
+                    if item is None:
+                        # Tried again after the same interval
+                        polls.append((asin, None, interval, False))
+                        continue
+
+                    item = next(extract_items(item))
+                    current = fingerprint(item, self.fields)
+                    changed = current != previous
+
+                    if previous is None:
+                        next_interval = interval
+                    else:
+                        next_interval = self.next_interval(interval, changed)
+
+                    polls.append((asin, current, next_interval,
+                                  changed and previous is not None))
+                    if changed:
+                        changed_items.append(item)
+
+                self.store.record(host, polls)
+
+                for item in changed_items:
+                    yield item
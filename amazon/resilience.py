@@ -0,0 +1,261 @@
+import random
+import threading
+from time import time
+from collections import deque
+
+from amazon.amazon_api import RESPONSE_ERRORS
+
+
+# Error codes worth trying the same request again for
+RETRYABLE_ERRORS = tuple(sorted(code for code, (error_class, retryable)
+                                in RESPONSE_ERRORS.iteritems() if retryable))
+
+# HTTP statuses worth trying the same request again for
+RETRYABLE_STATUSES = (500, 502, 503, 504)
+
+
+class RetryPolicy(object):
+
+    """
+        Exponential backoff with full jitter: the n-th retry waits a random
+        time between 0 and min(max_delay, base_delay * 2 ** n), so clients
+        failing together don't retry together. Only retryable errors are
+        tried again: network errors, timeouts, RETRYABLE_STATUSES and
+        RETRYABLE_ERRORS.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=5.0,
+                 retry_codes=RETRYABLE_ERRORS,
+                 retry_statuses=RETRYABLE_STATUSES):
+
+        """
+            :param max_attempts: Integer, attempts per call, the first one
+                                 included.
+            :param base_delay: Float, seconds, cap of the first backoff.
+            :param max_delay: Float, seconds, cap of any backoff.
+            :param retry_codes: Tuple, Amazon error codes to retry.
+            :param retry_statuses: Tuple, HTTP statuses to retry.
+        """
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_codes = retry_codes
+        self.retry_statuses = retry_statuses
+
+    def retryable(self, status=None, error_code=None):
+
+        """
+            The error code decides when the response has one, since Amazon
+            sends both retryable and permanent errors with the same status
+            (i.e: RequestThrottled and AccountLimitExceeded with a 503).
+
+            :param status: Integer, HTTP status, None for network errors.
+            :param error_code: String, Amazon error code of the response.
+
+            :rType: Boolean
+        """
+
+        if error_code is not None:
+            return error_code in self.retry_codes
+
+        if status is None:
+            return True
+
+        return status in self.retry_statuses
+
+    def delay(self, attempt):
+
+        """
+            :param attempt: Integer, 0 for the first retry.
+
+            :rType: Float, seconds to wait before the retry.
+        """
+
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+
+    """
+        Stops calls to an unhealthy endpoint. After `failure_threshold`
+        failures in a row the circuit opens and calls fail fast. After
+        `reset_timeout` seconds one trial call is let through: the circuit
+        closes if it succeeds and opens again if it fails.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+
+        """
+            :param failure_threshold: Integer, failures in a row opening
+                                      the circuit.
+            :param reset_timeout: Float, seconds before a trial call.
+        """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+
+        self._lock = threading.Lock()
+
+    def allow(self):
+
+        """
+            :rType: Boolean, False when the call must fail fast.
+        """
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if (self.state == self.OPEN and
+                    time() - self.opened_at >= self.reset_timeout):
+                # Let this call through as the trial
+                self.state = self.HALF_OPEN
+                return True
+
+            self.rejected += 1
+            return False
+
+    def succeeded(self):
+
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failed(self):
+
+        with self._lock:
+            self.failures += 1
+
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time()
+
+    def stats(self):
+
+        with self._lock:
+            return dict(state=self.state, failures=self.failures,
+                        rejected=self.rejected)
+
+
+class CircuitBreakers(object):
+
+    """
+        A CircuitBreaker per Amazon host, so one unhealthy marketplace
+        doesn't stop calls to the others.
+    """
+
+    def __init__(self, **breaker_kwargs):
+
+        """
+            :param breaker_kwargs: dictionary, CircuitBreaker arguments
+                                   (i.e: failure_threshold)
+        """
+
+        self.breaker_kwargs = breaker_kwargs
+
+        self._breakers = dict()
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+
+        """
+            :rType: CircuitBreaker, of host.
+        """
+
+        with self._lock:
+            breaker = self._breakers.get(host)
+
+            if breaker is None:
+                breaker = CircuitBreaker(**self.breaker_kwargs)
+                self._breakers[host] = breaker
+
+        return breaker
+
+    def stats(self):
+
+        """
+            :rType: dictionary, of host to CircuitBreaker.stats
+        """
+
+        with self._lock:
+            breakers = self._breakers.items()
+
+        return dict((host, breaker.stats()) for host, breaker in breakers)
+
+
+class Hedger(object):
+
+    """
+        Decides when to hedge a request: once a request has been waiting
+        longer than the `percentile` latency of the last `window` requests,
+        a duplicate is sent and the first response wins. Hedging starts
+        after `min_samples` latencies are known.
+    """
+
+    def __init__(self, percentile=0.95, min_samples=20, window=1000):
+
+        """
+            :param percentile: Float, between 0 and 1.
+            :param min_samples: Integer, latencies needed to hedge.
+            :param window: Integer, latencies kept.
+        """
+
+        self.percentile = percentile
+        self.min_samples = min_samples
+
+        self.hedges = 0
+        self.wins = 0
+
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+
+        """
+            :rType: Float, seconds to wait before hedging, None while there
+                    are too few latencies to tell.
+        """
+
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+
+            latencies = sorted(self._latencies)
+
+        index = min(len(latencies) - 1, int(self.percentile * len(latencies)))
+
+        return latencies[index]
+
+    def hedged(self, won):
+
+        """
+            Records a hedge, and whether the duplicate answered first.
+        """
+
+        with self._lock:
+            self.hedges += 1
+            if won:
+                self.wins += 1
+
+    def stats(self):
+
+        with self._lock:
+            return dict(hedges=self.hedges, wins=self.wins,
+                        samples=len(self._latencies))
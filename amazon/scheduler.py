@@ -0,0 +1,321 @@
+import threading
+from time import time
+from collections import deque
+
+from amazon.amazon_api import AmazonAPIError, DeadlineExceededError
+from amazon.metrics import Histogram
+from amazon.rate_limit import RateLimiter
+
+
+# Default priority classes and their share of a budget when all are busy
+CLASSES = {'interactive': 10, 'background': 1}
+
+
+class _Waiter(object):
+
+    __slots__ = ('name', 'deadline', 'enqueued', 'event', 'queued',
+                 'granted')
+
+    def __init__(self, name, deadline):
+
+        self.name = name
+        self.deadline = deadline
+        self.enqueued = time()
+        self.event = threading.Event()
+        self.queued = True
+        self.granted = False
+
+
+class PriorityScheduler(object):
+
+    """
+        Shares the request budget of every (access key, host) between
+        priority classes, so background crawls can't hold back the calls a
+        user is waiting on.
+
+        Calls queue up per class and are let through one token at a time,
+        weighted fair: while several classes are waiting, each gets tokens
+        in proportion to its weight, and a class that was idle doesn't get
+        to catch up on the tokens it didn't use. A call still waiting when
+        its deadline passes is dropped before it's sent, with
+        DeadlineExceededError.
+
+        The budget itself is a RateLimiter, adapting to throttling as
+        usual. Clients take a per class limiter as their rate_limiter:
+
+        >>> scheduler = PriorityScheduler(rate=1.0)
+        >>> web = AmazonAPI(key, secret, tag,
+        ...                 rate_limiter=scheduler.limiter('interactive'))
+        >>> crawler = AmazonAPI(key, secret, tag,
+        ...                     rate_limiter=scheduler.limiter('background',
+        ...                                                    deadline=60))
+    """
+
+    def __init__(self, classes=None, rate_limiter=None, **bucket_kwargs):
+
+        """
+            :param classes: dictionary, class name to weight, defaults to
+                            CLASSES.
+            :param rate_limiter: RateLimiter, budget to share, one built
+                                 from bucket_kwargs by default.
+            :param bucket_kwargs: dictionary, TokenBucket arguments (i.e:
+                                  rate, burst).
+        """
+
+        self.classes = dict(classes or CLASSES)
+        self.rate_limiter = rate_limiter or RateLimiter(**bucket_kwargs)
+
+        # (access key, host) to class name to deque of _Waiter
+        self._lanes = dict()
+        # (access key, host) to class name to virtual time
+        self._vtimes = dict()
+
+        self.granted = dict((name, 0) for name in self.classes)
+        self.dropped = dict((name, 0) for name in self.classes)
+        self.queued = dict((name, 0) for name in self.classes)
+        self.waits = dict((name, Histogram()) for name in self.classes)
+
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        self._closed = False
+
+    def limiter(self, name, deadline=None):
+
+        """
+            :param name: String, priority class of the calls.
+            :param deadline: Float, seconds a call can wait for its turn
+                             before it's dropped, no limit by default.
+
+            :rType: ClassLimiter, to pass to AmazonAPI as rate_limiter.
+        """
+
+        if name not in self.classes:
+            raise ValueError("Unknown priority class: %s" % name)
+
+        return ClassLimiter(self, name, deadline)
+
+    def acquire(self, name, access_key, host, deadline=None):
+
+        """
+            Waits for the turn of a call of class name on the budget of
+            access_key on host.
+
+            :param deadline: Float, timestamp after which the call is
+                             dropped instead of sent.
+
+            :rType: Float, seconds waited.
+        """
+
+        key = (access_key, host)
+        waiter = _Waiter(name, deadline)
+
+        with self._condition:
+            if self._closed:
+                raise AmazonAPIError("Scheduler is closed")
+
+            lanes = self._lanes.setdefault(
+                key, dict((lane, deque()) for lane in self.classes))
+            vtimes = self._vtimes.setdefault(
+                key, dict((lane, 0.0) for lane in self.classes))
+
+            if not lanes[name]:
+                busy = [vtimes[lane] for lane in lanes if lanes[lane]]
+                if busy:
+                    # Starts level with the busy classes, not behind them
+                    vtimes[name] = max(vtimes[name], min(busy))
+                else:
+                    # Nobody waiting, what each class used so far is no
+                    # debt: it would starve whoever ran alone last
+                    for lane in vtimes:
+                        vtimes[lane] = 0.0
+
+            lanes[name].append(waiter)
+            self.queued[name] += 1
+
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch)
+                self._dispatcher.daemon = True
+                self._dispatcher.start()
+
+            self._condition.notify()
+
+        if deadline is None:
+            waiter.event.wait()
+        else:
+            waiter.event.wait(max(0.0, deadline - time()))
+
+        with self._condition:
+            if waiter.queued:
+                lanes[name].remove(waiter)
+                waiter.queued = False
+                self.queued[name] -= 1
+
+            if not waiter.granted:
+                if self._closed:
+                    raise AmazonAPIError("Scheduler is closed")
+
+                self.dropped[name] += 1
+                raise DeadlineExceededError(
+                    "Deadline exceeded waiting for the %s budget of %s" %
+                    (name, host))
+
+            wait = time() - waiter.enqueued
+            self.waits[name].observe(wait)
+
+        return wait
+
+    def _dispatch(self):
+
+        with self._condition:
+            while not self._closed:
+                timeout = None
+
+                for key, lanes in self._lanes.items():
+                    wait = self._grant(key, lanes)
+                    if wait is not None and (timeout is None or
+                                             wait < timeout):
+                        timeout = wait
+
+                self._condition.wait(timeout)
+
+    def _grant(self, key, lanes):
+
+        """
+            Lets through waiters of key for as long as its bucket has
+            tokens. Called holding the condition.
+
+            :rType: Float, seconds until the next token, None when nobody
+                    is waiting.
+        """
+
+        bucket = self.rate_limiter.bucket(*key)
+        vtimes = self._vtimes[key]
+
+        while True:
+            now = time()
+
+            # Expired waiters are dropped, never granted
+            for name, lane in lanes.items():
+                while lane and lane[0].deadline is not None and \
+                        lane[0].deadline <= now:
+                    waiter = lane.popleft()
+                    waiter.queued = False
+                    self.queued[name] -= 1
+                    waiter.event.set()
+
+            busy = [name for name in lanes if lanes[name]]
+            if not busy:
+                return None
+
+            wait = bucket.expected_wait()
+            if wait > 0:
+                return wait
+
+            # Lowest virtual time first, ties to the heaviest class
+            name = min(busy, key=lambda lane: (vtimes[lane],
+                                               -self.classes[lane]))
+            vtimes[name] += 1.0 / self.classes[name]
+
+            bucket.acquire()
+            waiter = lanes[name].popleft()
+            waiter.queued = False
+            waiter.granted = True
+            self.queued[name] -= 1
+            self.granted[name] += 1
+            waiter.event.set()
+
+    def feedback(self, access_key, host, throttled):
+        self.rate_limiter.feedback(access_key, host, throttled)
+
+    def stats(self):
+
+        """
+            Per class metrics: weight, calls queued right now, granted and
+            dropped so far, and mean, median, 99th percentile and max
+            seconds granted calls waited.
+
+            :rType: dictionary, of class name to dictionary.
+        """
+
+        with self._condition:
+            result = dict()
+
+            for name, weight in self.classes.items():
+                waits = self.waits[name]
+                result[name] = dict(
+                    weight=weight, queued=self.queued[name],
+                    granted=self.granted[name], dropped=self.dropped[name],
+                    wait_mean=waits.sum / waits.count if waits.count else None,
+                    wait_p50=waits.percentile(0.5),
+                    wait_p99=waits.percentile(0.99), wait_max=waits.max)
+
+            return result
+
+    def close(self):
+
+        """
+            Stops the dispatcher. Calls still queued raise AmazonAPIError.
+        """
+
+        with self._condition:
+            self._closed = True
+
+            for lanes in self._lanes.values():
+                for lane in lanes.values():
+                    for waiter in lane:
+                        waiter.event.set()
+
+            self._condition.notify()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ClassLimiter(object):
+
+    """
+        Rate limiter of one priority class of a PriorityScheduler. It can be
+        shared by any number of clients, threads and credentials.
+    """
+
+    def __init__(self, scheduler, name, deadline=None):
+
+        """
+            :param scheduler: PriorityScheduler
+            :param name: String, priority class.
+            :param deadline: Float, seconds a call can wait for its turn.
+        """
+
+        self.scheduler = scheduler
+        self.name = name
+        self.deadline = deadline
+
+    def acquire(self, access_key, host, deadline=None):
+
+        """
+            :param deadline: Float, timestamp of the call, the sooner of it
+                             and the deadline of the class applies.
+        """
+
+        if self.deadline is not None:
+            own = time() + self.deadline
+            deadline = own if deadline is None else min(deadline, own)
+
+        return self.scheduler.acquire(self.name, access_key, host, deadline)
+
+    def feedback(self, access_key, host, throttled):
+        self.scheduler.feedback(access_key, host, throttled)
+
+    def bucket(self, access_key, host):
+        return self.scheduler.rate_limiter.bucket(access_key, host)
+
+    def stats(self):
+
+        """
+            :rType: dictionary, PriorityScheduler.stats of this class.
+        """
+
+        return self.scheduler.stats()[self.name]
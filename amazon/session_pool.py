@@ -0,0 +1,98 @@
+import threading
+from time import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool(object):
+
+    """
+        Keeps one keep-alive requests.Session per Amazon host, so calls to
+        the same marketplace reuse already open TCP connections instead of
+        paying for a new handshake on every operation.
+    """
+
+    def __init__(self, pool_size=10, idle_timeout=60, max_retries=1):
+
+        """
+            :param pool_size: Integer, max connections kept open per host.
+            :param idle_timeout: Integer, seconds a host's connections can
+                                 sit unused before they are dropped and
+                                 reopened. None keeps them open forever.
+            :param max_retries: Integer, times a request is retried when the
+                                pooled connection turns out to be stale
+                                (closed by the server while idle).
+        """
+
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+
+        self._sessions = dict()
+        self._last_used = dict()
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self.pool_size,
+                              max_retries=self.max_retries)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def get_session(self, host):
+
+        """
+            Returns the session bound to host, creating it on first use or
+            when its connections have been idle longer than idle_timeout.
+
+            :param host: String, amazon host name (i.e: ecs.amazonaws.com)
+
+            :rType: requests.Session
+        """
+
+        now = time()
+
+        with self._lock:
+            session = self._sessions.get(host)
+
+            if session is not None and self.idle_timeout is not None:
+                if now - self._last_used[host] > self.idle_timeout:
+                    session.close()
+                    session = None
+
+            if session is None:
+                session = self._new_session()
+                self._sessions[host] = session
+
+            self._last_used[host] = now
+
+        return session
+
+    def get(self, host, url, **kwargs):
+
+        """
+            Makes a GET request to url through the pooled session of host.
+
+            :rType: requests.Response
+        """
+
+        return self.get_session(host).get(url, **kwargs)
+
+    def close(self):
+
+        """
+            Closes every pooled session and its open connections.
+        """
+
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
+            self._last_used.clear()
@@ -0,0 +1,489 @@
+import sys
+import json
+import zlib
+import logging
+import sqlite3
+import threading
+import multiprocessing
+from time import time, sleep
+from itertools import count
+
+from amazon.amazon_api import MAX_ITEM_IDS, AmazonAPI, is_retryable
+from amazon.export import FIELDS, error_text
+from amazon.models import extract_items
+from amazon.rate_limit import RateLimiter
+
+
+# Failed lookups of an ItemId after which it is given up on
+MAX_ATTEMPTS = 3
+
+# Times a worker that died is started again in a run
+MAX_RESTARTS = 3
+
+# Seconds before a failed ItemId is claimed again, doubled per attempt
+RETRY_DELAY = 5.0
+
+# ItemIds queued per INSERT batch
+ADD_BATCH = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(item_id, shards):
+
+    """
+        :rType: Integer, shard of item_id, the same in every process.
+    """
+
+    return (zlib.crc32(item_id) & 0xffffffff) % shards
+
+
+class WorkQueue(object):
+
+    """
+        Durable queue of ItemIds to look up, per host, in an SQLite file
+        that several processes share. Workers claim a few ItemIds at a
+        time and ack them with their result once looked up. ItemIds claimed
+        by a worker that died without acking are released and claimed
+        again, so nothing is lost when a worker is killed. ItemIds whose
+        lookup failed are claimed again after a backoff.
+
+        Every ItemId belongs to a shard, which is the one its worker claims
+        from first. A worker whose shard ran dry claims from the others.
+    """
+
+    def __init__(self, path, timeout=60):
+
+        """
+            :param path: String, SQLite database file.
+            :param timeout: Integer, seconds to wait on a locked database.
+        """
+
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=timeout)
+        # Readers don't block the writers of other processes
+        self._db.execute("PRAGMA journal_mode=WAL")
+
+        with self._db as db:
+            db.execute("CREATE TABLE IF NOT EXISTS work ("
+                       " host TEXT NOT NULL,"
+                       " item_id TEXT NOT NULL,"
+                       " shard INTEGER NOT NULL,"
+                       " worker TEXT,"
+                       " claim TEXT,"
+                       " attempts INTEGER NOT NULL DEFAULT 0,"
+                       " done REAL,"
+                       " result TEXT,"
+                       " not_before REAL,"
+                       " PRIMARY KEY (host, item_id)) WITHOUT ROWID")
+            columns = [row[1] for row in
+                       db.execute("PRAGMA table_info(work)")]
+            # Queue files of older versions
+            if 'not_before' not in columns:
+                db.execute("ALTER TABLE work ADD COLUMN not_before REAL")
+            db.execute("CREATE INDEX IF NOT EXISTS work_pending"
+                       " ON work (host, done, worker, shard)")
+            db.execute("CREATE INDEX IF NOT EXISTS work_claims"
+                       " ON work (worker, claim)")
+
+    def close(self):
+        self._db.close()
+
+    def add(self, host, item_ids, shards=1):
+
+        """
+            Queues the ItemIds not queued yet on host.
+
+            :param item_ids: Iterable, read ADD_BATCH at a time.
+            :param shards: Integer, ItemIds are spread over this many shards.
+        """
+
+        rows = list()
+
+        for item_id in item_ids:
+            rows.append((host, item_id, shard_of(item_id, shards)))
+
+            if len(rows) == ADD_BATCH:
+                self._insert(rows)
+                rows = list()
+
+        if rows:
+            self._insert(rows)
+
+    def _insert(self, rows):
+
+        with self._db as db:
+            db.executemany("INSERT OR IGNORE INTO work (host, item_id, shard)"
+                           " VALUES (?, ?, ?)", rows)
+
+    def claim(self, host, worker, claim, shard=None, limit=MAX_ITEM_IDS,
+              max_attempts=MAX_ATTEMPTS):
+
+        """
+            Claims up to limit pending ItemIds, the ones of shard first,
+            topped up from any shard. ItemIds backing off after a failed
+            lookup aren't claimed before their time. Claiming is a single
+            UPDATE, so two workers never claim the same ItemId.
+
+            :param worker: String, name of the worker, unique in the run.
+            :param claim: String, unique among the claims of worker.
+            :param shard: Integer, shard claimed from first.
+
+            :rType: List, of ItemIds, empty when nothing is pending.
+        """
+
+        shards = [None] if shard is None else [shard, None]
+        left = limit
+        now = time()
+
+        for shard in shards:
+            with self._db as db:
+                cursor = db.execute(
+                    "UPDATE work SET worker = ?, claim = ?"
+                    " WHERE host = ? AND item_id IN ("
+                    "  SELECT item_id FROM work"
+                    "  WHERE host = ? AND done IS NULL"
+                    "  AND worker IS NULL AND attempts < ?"
+                    "  AND (not_before IS NULL OR not_before <= ?)%s"
+                    "  LIMIT ?)" % ('' if shard is None else ' AND shard = ?'),
+                    [worker, claim, host, host, max_attempts, now] +
+                    ([] if shard is None else [shard]) + [left])
+
+            left -= cursor.rowcount
+            if not left:
+                break
+
+        return [row[0] for row in
+                self._db.execute("SELECT item_id FROM work"
+                                 " WHERE worker = ? AND claim = ?"
+                                 " AND host = ? ORDER BY item_id",
+                                 (worker, claim, host))]
+
+    def ack(self, host, results):
+
+        """
+            Stores the result of claimed ItemIds, which are done.
+
+            :param results: dictionary, of ItemId to a JSON serializable
+                            result.
+        """
+
+        now = time()
+
+        with self._db as db:
+            db.executemany("UPDATE work SET done = ?, result = ?,"
+                           " worker = NULL, claim = NULL,"
+                           " attempts = attempts + 1"
+                           " WHERE host = ? AND item_id = ?",
+                           [(now, json.dumps(result, sort_keys=True), host,
+                             item_id)
+                            for item_id, result in results.iteritems()])
+
+    def retry(self, host, item_ids, delay=RETRY_DELAY):
+
+        """
+            Releases claimed ItemIds whose lookup failed, to be claimed
+            again until they fail max_attempts times. They back off first,
+            so a throttling episode doesn't use up their attempts.
+
+            :param delay: Float, seconds before the first retry, doubled
+                          per attempt.
+        """
+
+        now = time()
+
+        with self._db as db:
+            db.executemany("UPDATE work SET worker = NULL, claim = NULL,"
+                           " not_before = ? + ? * (1 << attempts),"
+                           " attempts = attempts + 1"
+                           " WHERE host = ? AND item_id = ?",
+                           [(now, delay, host, item_id)
+                            for item_id in item_ids])
+
+    def next_retry(self, host, max_attempts=MAX_ATTEMPTS):
+
+        """
+            :rType: Float, timestamp at which the next pending ItemId that
+                    failed before is claimable, None when there is none.
+        """
+
+        return self._db.execute("SELECT MIN(not_before) FROM work"
+                                " WHERE host = ? AND done IS NULL"
+                                " AND worker IS NULL AND attempts < ?"
+                                " AND not_before IS NOT NULL",
+                                (host, max_attempts)).fetchone()[0]
+
+    def release(self, host, worker=None):
+
+        """
+            Releases the ItemIds claimed by worker, or by any worker, and
+            not acked. Their attempts don't count.
+
+            :rType: Integer, ItemIds released.
+        """
+
+        with self._db as db:
+            if worker is None:
+                cursor = db.execute("UPDATE work SET worker = NULL,"
+                                    " claim = NULL WHERE host = ?"
+                                    " AND worker IS NOT NULL", (host,))
+            else:
+                cursor = db.execute("UPDATE work SET worker = NULL,"
+                                    " claim = NULL WHERE host = ?"
+                                    " AND worker = ?", (host, worker))
+
+        return cursor.rowcount
+
+    def reset(self, host):
+
+        """
+            Gives ItemIds that failed MAX_ATTEMPTS times new attempts.
+        """
+
+        with self._db as db:
+            db.execute("UPDATE work SET attempts = 0, not_before = NULL"
+                       " WHERE host = ? AND done IS NULL", (host,))
+
+    def results(self, host):
+
+        """
+            :rType: generator of (ItemId, result) of the done ItemIds, in
+                    ItemId order.
+        """
+
+        cursor = self._db.execute("SELECT item_id, result FROM work"
+                                  " WHERE host = ? AND done IS NOT NULL"
+                                  " ORDER BY item_id", (host,))
+
+        for item_id, result in cursor:
+            yield item_id, json.loads(result)
+
+    def counts(self, host, max_attempts=MAX_ATTEMPTS):
+
+        """
+            :rType: dictionary, with the ItemIds queued, pending, claimed,
+                    done and failed (given up on after max_attempts).
+        """
+
+        queued, pending, claimed, done, failed = self._db.execute(
+            "SELECT COUNT(*),"
+            " SUM(done IS NULL AND worker IS NULL AND attempts < ?),"
+            " COUNT(worker), COUNT(done),"
+            " SUM(done IS NULL AND worker IS NULL AND attempts >= ?)"
+            " FROM work WHERE host = ?",
+            (max_attempts, max_attempts, host)).fetchone()
+
+        return dict(queued=queued, pending=pending or 0, claimed=claimed,
+                    done=done, failed=failed or 0)
+
+
+class ShardedLookup(object):
+
+    """
+        Looks up the ItemIds of a WorkQueue with a process per shard, for
+        inputs too large for one process: parsing responses takes more CPU
+        than one core has long before the network or the rate limit is the
+        bottleneck.
+
+        Every process has its own AmazonAPI client, connection pool and
+        threads, and gets an equal share of `rate`, so the processes
+        together stay within the API budget. A process that dies is started
+        again, and the ItemIds it had claimed are looked up by the others;
+        so is one whose thread died, which exits with an error. A run
+        killed as a whole resumes from the queue.
+    """
+
+    def __init__(self, aws_access_key, secret_key, associate_tag, queue_path,
+                 processes=None, threads=4, rate=1.0, fields=FIELDS,
+                 max_attempts=MAX_ATTEMPTS, max_restarts=MAX_RESTARTS,
+                 retry_delay=RETRY_DELAY, **api_kwargs):
+
+        """
+            :param queue_path: String, SQLite file of the WorkQueue.
+            :param processes: Integer, shards and worker processes, one per
+                              CPU by default.
+            :param threads: Integer, lookups in flight per process.
+            :param rate: Float, max lookups per second, of all the
+                         processes together.
+            :param fields: Tuple, Item fields stored per ItemId.
+            :param max_attempts: Integer, failed lookups of an ItemId after
+                                 which it is given up on.
+            :param max_restarts: Integer, times a dead worker is started
+                                 again.
+            :param retry_delay: Float, seconds before a failed ItemId is
+                                looked up again, doubled per attempt.
+            :param api_kwargs: dictionary, AmazonAPI arguments of the
+                               workers (i.e: parser)
+        """
+
+        self.credentials = (aws_access_key, secret_key, associate_tag)
+        self.queue_path = queue_path
+        self.processes = processes or multiprocessing.cpu_count()
+        self.threads = threads
+        self.rate = rate
+        self.fields = fields
+        self.max_attempts = max_attempts
+        self.max_restarts = max_restarts
+        self.retry_delay = retry_delay
+        self.api_kwargs = api_kwargs
+
+    def add(self, host, item_ids):
+
+        """
+            Queues item_ids on host, spread over the shards.
+        """
+
+        queue = WorkQueue(self.queue_path)
+
+        try:
+            queue.add(host, item_ids, self.processes)
+        finally:
+            queue.close()
+
+    def run(self, host, item_ids=(), **params):
+
+        """
+            Queues item_ids and looks up every pending ItemId of host.
+            Results are read back with WorkQueue.results: a dictionary with
+            the fields of the Item, or an error.
+
+            :param host: String, host key (i.e: us)
+            :param item_ids: Iterable, ItemIds to queue first.
+            :param params: dictionary, extra ItemLookup parameters
+                           (i.e: ResponseGroup)
+
+            :rType: dictionary, WorkQueue.counts after the run, with the
+                    restarts of dead workers.
+        """
+
+        queue = WorkQueue(self.queue_path)
+
+        try:
+            queue.add(host, item_ids, self.processes)
+            # Left claimed by a run that was killed
+            queue.release(host)
+
+            restarts = 0
+            workers = dict()
+
+            for shard in range(self.processes):
+                workers[shard] = self._start(host, shard, 0, params)
+
+            while workers:
+                for shard, (worker, process) in workers.items():
+                    process.join(0.05)
+                    if process.is_alive():
+                        continue
+
+                    del workers[shard]
+                    queue.release(host, worker)
+
+                    if process.exitcode and restarts < self.max_restarts:
+                        restarts += 1
+                        workers[shard] = self._start(host, shard, restarts,
+                                                     params)
+
+            counts = queue.counts(host, self.max_attempts)
+            counts['restarts'] = restarts
+
+            return counts
+        finally:
+            queue.close()
+
+    def _start(self, host, shard, generation, params):
+
+        worker = '%d.%d' % (shard, generation)
+        process = multiprocessing.Process(target=self.work,
+                                          args=(host, shard, worker, params))
+        process.daemon = True
+        process.start()
+
+        return worker, process
+
+    def work(self, host, shard, worker, params):
+
+        """
+            Body of a worker process: `threads` threads claiming and looking
+            up ItemIds until none are pending. Exits with status 1 when a
+            thread failed, leaving its claims to be released by run.
+        """
+
+        rate_limiter = RateLimiter(rate=float(self.rate) / self.processes)
+        api = AmazonAPI(*self.credentials, pool_size=self.threads,
+                        rate_limiter=rate_limiter, **self.api_kwargs)
+
+        failed = list()
+        threads = [threading.Thread(target=self._thread,
+                                    args=(api, host, shard, worker, thread,
+                                          params, failed))
+                   for thread in range(self.threads)]
+
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            api.close()
+
+        if failed:
+            sys.exit(1)
+
+    def _thread(self, api, host, shard, worker, thread, params, failed):
+
+        try:
+            self._drain(api, host, shard, worker, thread, params)
+        except Exception:
+            logger.exception("Thread %d of worker %s failed", thread, worker)
+            failed.append(thread)
+
+    def _drain(self, api, host, shard, worker, thread, params):
+
+        # SQLite connections can't be shared by threads
+        queue = WorkQueue(self.queue_path)
+
+        try:
+            for claim in count():
+                item_ids = queue.claim(host, worker,
+                                       '%d.%d' % (thread, claim), shard,
+                                       max_attempts=self.max_attempts)
+                if not item_ids:
+                    retry = queue.next_retry(host, self.max_attempts)
+                    if retry is None:
+                        break
+
+                    # Only ItemIds backing off are left
+                    sleep(max(0.0, retry - time()))
+                    continue
+
+                results, failed = self.lookup(api, host, item_ids, params)
+
+                queue.ack(host, results)
+                queue.retry(host, failed, self.retry_delay)
+        finally:
+            queue.close()
+
+    def lookup(self, api, host, item_ids, params):
+
+        """
+            :rType: tuple, of a dictionary of ItemId to its result, and a
+                    List of the ItemIds worth another lookup.
+        """
+
+        batch = api.item_lookup_batch(host, item_ids, **params)
+
+        results = dict()
+
+        for element in batch:
+            item = next(extract_items(element))
+            values = item.to_dict()
+            results[item.asin] = dict((field, values[field])
+                                      for field in self.fields)
+
+        for item_id, error in batch.errors.iteritems():
+            if not is_retryable(error):
+                results[item_id] = dict(error=error_text(error))
+
+        failed = [item_id for item_id in item_ids if item_id not in results]
+
+        return results, failed
@@ -0,0 +1,139 @@
+import re
+from urllib import quote
+from hashlib import sha256
+from base64 import b64encode
+
+
+# Params with few distinct values, worth keeping encoded between calls
+LOW_CARDINALITY_PARAMS = frozenset(['Condition', 'IdType', 'Operation',
+                                    'ResponseGroup', 'SearchIndex',
+                                    'SimilarityType', 'Sort'])
+
+MAX_ENCODED_VALUES = 512
+
+# Values made only of these characters are left as they are by quote
+UNRESERVED = re.compile(r'^[A-Za-z0-9_.~-]*$')
+
+# HMAC pads, see RFC 2104
+IPAD = ''.join(chr(x ^ 0x36) for x in xrange(256))
+OPAD = ''.join(chr(x ^ 0x5C) for x in xrange(256))
+
+
+def encode_param(key, value):
+
+    """
+        :rType: String, key=value with value quoted as Amazon expects.
+    """
+
+    if type(value) is str and UNRESERVED.match(value):
+        return '%s=%s' % (key, value)
+
+    return '%s=%s' % (key, quote(unicode(value).encode('utf-8'), safe='~'))
+
+
+class RequestSigner(object):
+
+    """
+        Builds the canonical query string and signature of requests with
+        the work common to every call done once: the params that are the
+        same for every call of a client are encoded up front, and the
+        HMAC-SHA256 hash states are keyed once, and once more per host with
+        the start of the string to sign, so signing only hashes the query.
+        Produces the same bytes as encoding and signing from scratch.
+    """
+
+    def __init__(self, secret_key, resource, static_params):
+
+        """
+            :param secret_key: String, Amazon secret key.
+            :param resource: String, path of the API (i.e: onca/xml)
+            :param static_params: dictionary, params sent with every call
+                                  (i.e: AWSAccessKeyId, Service)
+        """
+
+        self.resource = resource
+
+        self._static = dict((key, (value, encode_param(key, value)))
+                            for key, value in static_params.iteritems())
+        self._encoded = dict()
+
+        # HMAC-SHA256 is sha256(key ^ opad + sha256(key ^ ipad + message)),
+        # both hashes are fed their key pad here, once.
+        if isinstance(secret_key, unicode):
+            secret_key = secret_key.encode('utf-8')
+
+        block_size = sha256().block_size
+        if len(secret_key) > block_size:
+            secret_key = sha256(secret_key).digest()
+        secret_key = secret_key.ljust(block_size, chr(0))
+
+        self._inner = sha256(secret_key.translate(IPAD))
+        self._outer = sha256(secret_key.translate(OPAD))
+        self._host_states = dict()
+
+    def _encode(self, key, value):
+
+        if key not in LOW_CARDINALITY_PARAMS:
+            return encode_param(key, value)
+
+        encoded = self._encoded.get((key, value))
+
+        if encoded is None:
+            if len(self._encoded) >= MAX_ENCODED_VALUES:
+                self._encoded.clear()
+
+            encoded = encode_param(key, value)
+            self._encoded[(key, value)] = encoded
+
+        return encoded
+
+    def canonical_query(self, params):
+
+        """
+            :param params: dictionary, with request parameters
+
+            :rType: String, params quoted and sorted.
+        """
+
+        static = self._static
+        encoded = list()
+
+        for key, value in params.iteritems():
+            entry = static.get(key)
+
+            if entry is not None and entry[0] == value:
+                encoded.append(entry[1])
+            else:
+                encoded.append(self._encode(key, value))
+
+        encoded.sort()
+
+        return '&'.join(encoded)
+
+    def _host_state(self, host):
+
+        state = self._host_states.get(host)
+
+        if state is None:
+            state = self._inner.copy()
+            state.update('GET\n%s\n/%s\n' % (host, self.resource))
+            self._host_states[host] = state
+
+        return state
+
+    def sign(self, host, canonical_query):
+
+        """
+            :param host: String, amazon host name the request goes to.
+            :param canonical_query: String, from canonical_query.
+
+            :rType: String, quoted signature.
+        """
+
+        inner = self._host_state(host).copy()
+        inner.update(canonical_query)
+
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+
+        return quote(b64encode(outer.digest()))
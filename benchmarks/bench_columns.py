@@ -0,0 +1,106 @@
+"""
+    Time to turn ItemSearch/Offers payloads into a table: Items converted
+    to dictionaries and then to a pandas DataFrame, against column buffers
+    filled straight from the XML. Without pandas only the time to get the
+    dictionaries and the buffers is measured.
+
+    Usage: python benchmarks/bench_columns.py [pages] [rounds]
+"""
+import os
+import sys
+from time import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup  # noqa
+from amazon.columns import COLUMNS, extract_columns  # noqa
+from amazon.models import extract_items  # noqa
+from bench_parser import search_payload  # noqa
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+ITEMS_PER_PAGE = 10
+
+
+def soup_dicts(pages):
+
+    # The usual path: a soup per response, a dict per item
+    rows = list()
+
+    for content in pages:
+        soup = BeautifulSoup(content, "xml")
+        for item in extract_items(soup):
+            fields = item.to_dict()
+            rows.append(dict((name, fields[name]) for name in COLUMNS))
+
+    return rows
+
+
+def model_dicts(pages):
+
+    rows = list()
+
+    for content in pages:
+        for item in extract_items(content):
+            fields = item.to_dict()
+            rows.append(dict((name, fields[name]) for name in COLUMNS))
+
+    return rows
+
+
+def columns(pages):
+    return extract_columns(pages)
+
+
+PATHS = (
+    ('soup -> dicts', soup_dicts, lambda rows: pandas.DataFrame(rows)),
+    ('models -> dicts', model_dicts, lambda rows: pandas.DataFrame(rows)),
+    ('columns', columns, lambda result: result.to_pandas()))
+
+
+def best(func, rounds):
+
+    times = list()
+
+    for _ in xrange(rounds):
+        start = time()
+        result = func()
+        times.append(time() - start)
+
+    return min(times), result
+
+
+def main():
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    # Each page is its own copy of the content, as with real responses
+    content = search_payload(ITEMS_PER_PAGE)
+    pages = [content.replace('B0', 'B%d' % page) for page in xrange(count)]
+    items = count * ITEMS_PER_PAGE
+
+    print '%d items in %d pages%s' % (items, count,
+                                      '' if pandas else ', pandas missing')
+
+    for name, extract, to_frame in PATHS:
+        seconds, result = best(lambda: extract(pages), rounds)
+        line = '%-16s %8.2f us/item extract' % (name,
+                                                seconds * 1e6 / items)
+
+        if pandas is not None:
+            frame_seconds, _ = best(lambda: to_frame(result), rounds)
+            line += ' %8.2f us/item to DataFrame %8.2f us/item total' % (
+                frame_seconds * 1e6 / items,
+                (seconds + frame_seconds) * 1e6 / items)
+
+        print line
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+    Memory per item kept as a BeautifulSoup tree, an lxml tree, or a
+    typed Item model, for ItemSearch/Offers payloads.
+
+    Usage: python benchmarks/bench_models.py [pages]
+"""
+import os
+import sys
+import resource
+from multiprocessing import Process, Queue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup  # noqa
+from amazon.lxml_parser import parse  # noqa
+from amazon.models import extract_items  # noqa
+from bench_parser import search_payload  # noqa
+
+
+ITEMS_PER_PAGE = 10
+
+REPRESENTATIONS = {
+    'soup': lambda content: BeautifulSoup(content, "xml"),
+    'lxml': parse,
+    'models': lambda content: list(extract_items(content))}
+
+
+def measure(name, pages, results):
+
+    content = search_payload(ITEMS_PER_PAGE)
+    build = REPRESENTATIONS[name]
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Each page is its own copy of the content, as with real responses
+    kept = [build(content.replace('B0', 'B%d' % page))
+            for page in xrange(pages)]
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((peak_rss - base_rss) * 1024.0 / (pages * ITEMS_PER_PAGE))
+
+    del kept
+
+
+def main():
+
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    print '%d items kept' % (pages * ITEMS_PER_PAGE)
+
+    for name in ('soup', 'lxml', 'models'):
+        results = Queue()
+        process = Process(target=measure, args=(name, pages, results))
+        process.start()
+        bytes_per_item = results.get()
+        process.join()
+
+        print '%-7s %9.0f bytes/item' % (name, bytes_per_item)
+
+
+if __name__ == '__main__':
+    main()
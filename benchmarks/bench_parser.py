@@ -0,0 +1,134 @@
+"""
+    Parse time and peak memory of the BeautifulSoup and lxml parsers on
+    large ItemSearch/Offers payloads, including the usual attribute
+    traversal done on a response.
+
+    Usage: python benchmarks/bench_parser.py [items] [rounds]
+"""
+import os
+import sys
+import resource
+from time import time
+from multiprocessing import Process, Queue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from amazon import AmazonAPI  # noqa
+
+
+OFFER_XML = """
+        <Offer>
+          <OfferAttributes><Condition>New</Condition></OfferAttributes>
+          <OfferListing>
+            <OfferListingId>%(asin)s-%(offer)d</OfferListingId>
+            <Price>
+              <Amount>%(amount)d</Amount>
+              <CurrencyCode>USD</CurrencyCode>
+              <FormattedPrice>$%(price).2f</FormattedPrice>
+            </Price>
+            <Availability>Usually ships in 24 hours</Availability>
+            <IsEligibleForSuperSaverShipping>1</IsEligibleForSuperSaverShipping>
+          </OfferListing>
+        </Offer>"""
+
+ITEM_XML = """
+    <Item>
+      <ASIN>%(asin)s</ASIN>
+      <DetailPageURL>http://www.amazon.com/dp/%(asin)s</DetailPageURL>
+      <SalesRank>%(rank)d</SalesRank>
+      <ItemAttributes>
+        <Binding>Paperback</Binding>
+        <Manufacturer>Acme Publishing</Manufacturer>
+        <ProductGroup>Book</ProductGroup>
+        <Title>Benchmark Item %(asin)s</Title>
+      </ItemAttributes>
+      <OfferSummary>
+        <LowestNewPrice>
+          <Amount>%(amount)d</Amount>
+          <CurrencyCode>USD</CurrencyCode>
+          <FormattedPrice>$%(price).2f</FormattedPrice>
+        </LowestNewPrice>
+        <TotalNew>%(offers)d</TotalNew>
+      </OfferSummary>
+      <Offers>
+        <TotalOffers>%(offers)d</TotalOffers>%(offer_xml)s
+      </Offers>
+    </Item>"""
+
+
+def search_payload(items, offers=5):
+
+    """
+        ItemSearch response with Offers for `items` items.
+    """
+
+    body = list()
+
+    for i in xrange(items):
+        values = dict(asin='B%09d' % i, rank=i + 1, amount=1000 + i,
+                      price=(1000 + i) / 100.0, offers=offers)
+        values['offer_xml'] = ''.join(OFFER_XML % dict(values, offer=offer)
+                                      for offer in xrange(offers))
+        body.append(ITEM_XML % values)
+
+    return ('<?xml version="1.0" ?>\n'
+            '<ItemSearchResponse xmlns="http://webservices.amazon.com/'
+            'AWSECommerceService/2013-09-01">\n'
+            '  <Items>\n'
+            '    <Request><IsValid>True</IsValid></Request>\n'
+            '    <TotalResults>%d</TotalResults>\n'
+            '    <TotalPages>%d</TotalPages>%s\n'
+            '  </Items>\n'
+            '</ItemSearchResponse>\n') % (items, items / 10, ''.join(body))
+
+
+def traverse(response):
+
+    # What a typical consumer reads from every item
+    for item in response.Items.find_all('Item', recursive=False):
+        item.ASIN.string
+        item.ItemAttributes.Title.string
+        item.OfferSummary.LowestNewPrice.Amount.string
+
+
+def measure(parser, content, rounds, results):
+
+    amz = AmazonAPI('key', 'secret', 'tag', parser=parser)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time()
+    for _ in xrange(rounds):
+        response = amz._parse(content)
+        amz._check_response(response)
+        traverse(response)
+    elapsed = time() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    results.put((parser, elapsed / rounds, peak_rss - base_rss))
+
+
+def main():
+
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    content = search_payload(items)
+    print '%d items, %.1f KB payload' % (items, len(content) / 1024.0)
+
+    for parser in ('bs4', 'lxml'):
+        # One process per parser so peak memory isn't shared between them
+        results = Queue()
+        process = Process(target=measure,
+                          args=(parser, content, rounds, results))
+        process.start()
+        name, seconds, peak_kb = results.get()
+        process.join()
+
+        print '%-5s %9.2f ms/parse %9d KB peak' % (name, seconds * 1000,
+                                                   peak_kb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+    Requests/sec of AmazonAPI against a local stand-in server with the
+    keep-alive connection pool on and off.
+
+    Usage: python benchmarks/bench_pool.py [requests]
+"""
+import os
+import sys
+from time import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from amazon import AmazonAPI  # noqa
+from fake_server import FakeAmazonServer  # noqa
+
+
+def run(pool, total):
+
+    amz = AmazonAPI('key', 'secret', 'tag', pool=pool)
+
+    start = time()
+    for _ in xrange(total):
+        amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+    elapsed = time() - start
+
+    amz.close()
+
+    return total / elapsed
+
+
+def main():
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with FakeAmazonServer() as server:
+        server.register('fake')
+
+        for pool in (False, True):
+            print 'pool=%-5s %8.1f req/s' % (pool, run(pool, total))
+
+
+if __name__ == '__main__':
+    main()
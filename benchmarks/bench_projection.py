@@ -0,0 +1,70 @@
+"""
+    Response bytes and extraction time of a broad ResponseGroup against the
+    one derived from the fields actually read. The narrow response is the
+    broad one with the elements its ResponseGroup doesn't return dropped,
+    as Amazon would send it.
+
+    Usage: python benchmarks/bench_projection.py [items] [rounds] [fields]
+
+        python benchmarks/bench_projection.py 1000 5 ASIN,Title,LowestNewPrice
+"""
+import os
+import sys
+from time import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from amazon.models import extract_items  # noqa
+from amazon.projection import Projection  # noqa
+from bench_parser import search_payload  # noqa
+from fake_server import prune  # noqa
+
+
+BROAD_RESPONSE_GROUP = 'ItemAttributes,Images,Offers,Large'
+
+FIELDS = 'ASIN,Title,LowestNewPrice,SalesRank'
+
+
+def best(func, rounds):
+
+    times = list()
+
+    for _ in xrange(rounds):
+        start = time()
+        func()
+        times.append(time() - start)
+
+    return min(times)
+
+
+def main():
+
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    fields = (sys.argv[3] if len(sys.argv) > 3 else FIELDS).split(',')
+
+    projection = Projection(fields)
+    broad = search_payload(items)
+    narrow = prune(broad, projection.response_group)
+
+    print '%d items, fields %s' % (items, ', '.join(projection.fields))
+
+    cases = (
+        (BROAD_RESPONSE_GROUP, 'all fields', broad,
+         lambda: list(extract_items(broad))),
+        (BROAD_RESPONSE_GROUP, 'projected', broad,
+         lambda: list(projection.extract(broad))),
+        (projection.response_group, 'projected', narrow,
+         lambda: list(projection.extract(narrow))))
+
+    for response_group, extraction, content, extract in cases:
+        seconds = best(extract, rounds)
+        print '%-36s %-10s %9.1f KB %9.2f ms' % (
+            response_group, extraction, len(content) / 1024.0,
+            seconds * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+    URLs built and signed per second by AmazonAPI, against the original
+    encode-and-sign-from-scratch implementation.
+
+    Usage: python benchmarks/bench_signing.py [urls]
+"""
+import os
+import sys
+from time import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from amazon import AmazonAPI  # noqa
+from amazon.amazon_api import HOSTS  # noqa
+from test_signing import reference_url  # noqa
+
+
+def main():
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    amz = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20')
+
+    params = [amz._request_parameters(dict(Operation='ItemLookup',
+                                           IdType='ASIN',
+                                           ItemId='B%09d' % i,
+                                           ResponseGroup='Large'))
+              for i in xrange(1000)]
+
+    runs = (('reference', lambda p: reference_url(amz, HOSTS['us'], p)),
+            ('signer', lambda p: amz._build_url(HOSTS['us'], p)))
+
+    for name, build in runs:
+        start = time()
+        for i in xrange(total):
+            build(params[i % 1000])
+        elapsed = time() - start
+
+        print '%-10s %10.0f urls/s' % (name, total / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+    Offline benchmark suite of the request/response pipeline. Times every
+    stage on its own (_request_parameters, _canonical_query, _sign,
+    _build_url, parsing, _check_response) and end to end, over the
+    recorded responses of tests/fixtures, for both parsers. Nothing goes
+    to the network; --loopback adds full calls against a local stand-in
+    server.
+
+    Results are written as JSON, and can be compared with an earlier run:
+
+        python benchmarks/run.py --output before.json
+        python benchmarks/run.py --compare before.json
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import platform
+from time import time, strftime, gmtime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from amazon import AmazonAPI, AmazonAPIResponseError  # noqa
+from amazon.amazon_api import HOSTS, PARSERS  # noqa
+from amazon.metrics import MetricsRecorder  # noqa
+from fake_server import (FakeAmazonServer, ERROR_STATUS, OPERATIONS,  # noqa
+                         load_fixture, fixture_responder)
+
+
+PARAMS = {
+    'ItemLookup': dict(IdType='ASIN', ItemId='B0041OSCBU,B000NK8EWI',
+                       ResponseGroup='Images,ItemAttributes,Offers,SalesRank'),
+    'ItemSearch': dict(Keywords='Harry Potter', SearchIndex='Books',
+                       ResponseGroup='ItemAttributes,Images'),
+    'SimilarityLookup': dict(ItemId='B0011ZK6PC,B000NK8EWI',
+                             SimilarityType='Intersection',
+                             ResponseGroup='ItemAttributes'),
+    'BrowseNodeLookup': dict(BrowseNodeId='17')}
+
+
+def measure(func, min_time, repeat):
+
+    """
+        Best time per call of func, over `repeat` rounds lasting at least
+        min_time seconds each.
+
+        :rType: dictionary, with us_per_call and calls per round.
+    """
+
+    timer = timeit.Timer(func)
+
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+
+    best = min(timer.repeat(repeat=repeat, number=number))
+
+    return dict(us_per_call=best / number * 1e6, calls=number)
+
+
+def request_params(operation):
+
+    params = dict(PARAMS[operation])
+    params['Operation'] = operation
+
+    return params
+
+
+def check(amz, response):
+
+    try:
+        amz._check_response(response)
+    except AmazonAPIResponseError:
+        pass
+
+
+def pipeline(amz, operation, content):
+
+    """
+        What _call does for operation, minus the HTTP round trip.
+    """
+
+    params = amz._request_parameters(request_params(operation))
+    amz._build_url(HOSTS['us'], params)
+
+    check(amz, amz._parse(content))
+
+
+def benchmarks(loopback):
+
+    """
+        :rType: generator of (name, callable)
+    """
+
+    amz = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20')
+    host = HOSTS['us']
+
+    for operation in OPERATIONS:
+        params = amz._request_parameters(request_params(operation))
+        query = amz._canonical_query(params)
+
+        yield ('request_parameters.%s' % operation,
+               lambda o=operation: amz._request_parameters(request_params(o)))
+        yield ('canonical_query.%s' % operation,
+               lambda p=params: amz._canonical_query(p))
+        yield 'sign.%s' % operation, lambda q=query: amz._sign(host, q)
+        yield ('build_url.%s' % operation,
+               lambda p=params: amz._build_url(host, p))
+
+    fixtures = [(operation, load_fixture(operation))
+                for operation in OPERATIONS]
+    fixtures += [('error.%s' % code, load_fixture(error_code=code))
+                 for code in sorted(ERROR_STATUS)]
+
+    for parser in PARSERS:
+        client = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20', parser=parser)
+
+        for name, content in fixtures:
+            response = client._parse(content)
+
+            yield ('parse.%s.%s' % (parser, name),
+                   lambda c=client, x=content: c._parse(x))
+            yield ('check_response.%s.%s' % (parser, name),
+                   lambda c=client, r=response: check(c, r))
+
+        for operation, content in fixtures[:len(OPERATIONS)]:
+            yield ('pipeline.%s.%s' % (parser, operation),
+                   lambda c=client, o=operation, x=content:
+                   pipeline(c, o, x))
+
+    if loopback:
+        server = FakeAmazonServer(responder=fixture_responder()).start()
+        server.register('bench')
+
+        try:
+            for parser in PARSERS:
+                client = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20',
+                                   parser=parser)
+
+                for operation in OPERATIONS:
+                    yield ('loopback.%s.%s' % (parser, operation),
+                           lambda c=client, o=operation:
+                           c._call('bench', request_params(o)))
+
+            # Same calls timed phase by phase, for the cost of the hooks
+            client = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20',
+                               hooks=[MetricsRecorder()])
+
+            for operation in OPERATIONS:
+                yield ('loopback.hooks.%s' % operation,
+                       lambda c=client, o=operation:
+                       c._call('bench', request_params(o)))
+        finally:
+            server.stop()
+
+
+def compare(results, baseline_path):
+
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)['results']
+
+    print '%-60s %12s %12s %8s' % ('benchmark', 'before us', 'after us',
+                                   'ratio')
+
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+
+        before = baseline[name]['us_per_call']
+        after = results[name]['us_per_call']
+
+        print '%-60s %12.2f %12.2f %7.2fx' % (name, before, after,
+                                              before / after)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help="write the JSON results here "
+                                         "instead of stdout")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="print speedups against an earlier JSON run")
+    parser.add_argument('--filter', default='',
+                        help="only run benchmarks containing this text")
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help="seconds per timing round (default 0.1)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="timing rounds, the best is kept (default 3)")
+    parser.add_argument('--loopback', action='store_true',
+                        help="add full calls against a local stand-in server")
+    args = parser.parse_args()
+
+    results = dict()
+    started = time()
+
+    for name, func in benchmarks(args.loopback):
+        if args.filter in name:
+            results[name] = measure(func, args.min_time, args.repeat)
+
+    report = dict(
+        date=strftime("%Y-%m-%dT%H:%M:%SZ", gmtime()),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        seconds=time() - started,
+        results=results)
+
+    if args.compare:
+        compare(results, args.compare)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    elif not args.compare:
+        print json.dumps(report, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
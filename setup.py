@@ -21,4 +21,12 @@ setup(
         "wsgiref==0.1.2",
         "lxml==3.4.4",
     ],
+    extras_require={
+        "columns": ["numpy", "pandas", "pyarrow"],
+    },
+    entry_points={
+        "console_scripts": [
+            "amazon-export = amazon.export:main",
+        ],
+    },
 )
@@ -0,0 +1,489 @@
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from time import sleep
+from urlparse import urlparse, parse_qsl
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from xml.etree import ElementTree
+
+from amazon.amazon_api import HOSTS
+from amazon.projection import RESPONSE_GROUPS
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures')
+
+OPERATIONS = ('ItemLookup', 'ItemSearch', 'SimilarityLookup',
+              'BrowseNodeLookup')
+
+# HTTP status Amazon answers each recorded error with
+ERROR_STATUS = {
+    'AWS.ECommerceService.NoExactMatches': 200,
+    'AWS.ECommerceService.NoSimilarities': 200,
+    'AWS.InvalidEnumeratedParameter': 200,
+    'AWS.InvalidParameterValue': 200,
+    'AWS.MissingParameters': 200,
+    'AWS.RestrictedParameterValueCombination': 200,
+    'AccountLimitExceeded': 503,
+    'Deprecated': 200,
+    'InternalError': 500,
+    'InvalidClientTokenId': 403,
+    'MissingClientTokenId': 400,
+    'RequestThrottled': 503}
+
+
+def load_fixture(operation=None, error_code=None):
+
+    """
+        Recorded response of an operation, or of an error, from
+        tests/fixtures.
+
+        :rType: String, raw XML
+    """
+
+    if error_code is not None:
+        path = os.path.join(FIXTURES_DIR, 'errors', '%s.xml' % error_code)
+    else:
+        path = os.path.join(FIXTURES_DIR, '%s.xml' % operation)
+
+    with open(path, 'rb') as fixture:
+        return fixture.read()
+
+
+def fixture_responder(error_code=None):
+
+    """
+        Responder answering every request with the recorded response of its
+        Operation, or with the recorded error_code response.
+    """
+
+    if error_code is not None:
+        content = load_fixture(error_code=error_code)
+        return lambda params: (ERROR_STATUS[error_code], content)
+
+    contents = dict((operation, load_fixture(operation))
+                    for operation in OPERATIONS)
+
+    return lambda params: (200, contents[params.get('Operation')])
+
+
+ITEM_LOOKUP_XML = """<?xml version="1.0" ?>
+<ItemLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2013-09-01">
+  <Items>
+    <Request>
+      <IsValid>True</IsValid>
+    </Request>
+    <Item>
+      <ASIN>B0041OSCBU</ASIN>
+      <ItemAttributes>
+        <Manufacturer>Acme</Manufacturer>
+        <ProductGroup>Book</ProductGroup>
+        <Title>Stand-in Item</Title>
+      </ItemAttributes>
+    </Item>
+  </Items>
+</ItemLookupResponse>
+"""
+
+
+ITEM_XML = """
+    <Item>
+      <ASIN>%s</ASIN>
+      <ItemAttributes>
+        <Manufacturer>Acme</Manufacturer>
+        <ProductGroup>Book</ProductGroup>
+        <Title>Stand-in Item %s</Title>
+      </ItemAttributes>
+    </Item>"""
+
+PRICED_ITEM_XML = """
+    <Item>
+      <ASIN>%s</ASIN>
+      <ItemAttributes>
+        <Title>Stand-in Item %s</Title>
+      </ItemAttributes>
+      <OfferSummary>
+        <LowestNewPrice>
+          <Amount>%d</Amount>
+          <CurrencyCode>USD</CurrencyCode>
+        </LowestNewPrice>
+      </OfferSummary>
+    </Item>"""
+
+ERROR_XML = """
+        <Error>
+          <Code>%s</Code>
+          <Message>%s</Message>
+        </Error>"""
+
+INVALID_ID_MESSAGE = ("%s is not a valid value for ItemId. Please change this "
+                      "value and retry your request.")
+
+
+def items_xml(asins, invalid=(), operation='ItemLookup', prices=None):
+
+    """
+        Builds an <Operation>Response with one Item per valid ASIN and an
+        AWS.InvalidParameterValue error for every ASIN in invalid, the way
+        Amazon answers a batched lookup where some IDs are bad. With prices,
+        a dictionary of ASIN to price, Items have a LowestNewPrice.
+    """
+
+    errors = ''.join(ERROR_XML % ('AWS.InvalidParameterValue',
+                                  INVALID_ID_MESSAGE % asin)
+                     for asin in asins if asin in invalid)
+    if prices is None:
+        items = ''.join(ITEM_XML % (asin, asin)
+                        for asin in asins if asin not in invalid)
+    else:
+        items = ''.join(PRICED_ITEM_XML % (asin, asin, prices[asin])
+                        for asin in asins if asin not in invalid)
+
+    if errors:
+        errors = '\n      <Errors>%s\n      </Errors>' % errors
+
+    return ('<?xml version="1.0" ?>\n'
+            '<%sResponse xmlns="http://webservices.amazon.com/'
+            'AWSECommerceService/2013-09-01">\n'
+            '  <Items>\n'
+            '    <Request>\n'
+            '      <IsValid>True</IsValid>%s\n'
+            '    </Request>%s\n'
+            '  </Items>\n'
+            '</%sResponse>\n') % (operation, errors, items, operation)
+
+
+def item_lookup_responder(invalid=(), delay=0, prices=None):
+
+    """
+        Responder answering ItemLookup requests for whatever ItemId list is
+        requested, flagging the IDs in invalid as bad values. Every response
+        takes delay seconds to be served. Items are priced from prices, a
+        dictionary of ASIN to price the test can change between requests.
+    """
+
+    def responder(params):
+        asins = params.get('ItemId', '').split(',')
+        sleep(delay)
+        return 200, items_xml(asins, invalid, params.get('Operation'),
+                              prices)
+
+    return responder
+
+
+def prune(content, response_group):
+
+    """
+        Drops from every Item of content the elements response_group doesn't
+        return, the way Amazon answers a narrower ResponseGroup.
+
+        :param response_group: String, comma separated ResponseGroups.
+
+        :rType: String, raw XML
+    """
+
+    group_paths = sum((RESPONSE_GROUPS[group.strip()][1]
+                       for group in response_group.split(',')), ())
+
+    def prune_element(element, relative):
+        for child in list(element):
+            path = relative + (child.tag.rsplit('}', 1)[-1],)
+
+            if any(path[:len(kept)] == kept for kept in group_paths):
+                continue
+            if any(kept[:len(path)] == path for kept in group_paths):
+                prune_element(child, path)
+            else:
+                element.remove(child)
+
+    root = ElementTree.fromstring(content)
+    for items in root.iter():
+        if items.tag.rsplit('}', 1)[-1] == 'Items':
+            for item in items:
+                if item.tag.rsplit('}', 1)[-1] == 'Item':
+                    prune_element(item, ())
+
+    return ElementTree.tostring(root)
+
+
+def projecting_responder(content):
+
+    """
+        Responder answering with content pruned to the ResponseGroup of
+        every request.
+    """
+
+    return lambda params: (200, prune(content,
+                                      params.get('ResponseGroup', 'Large')))
+
+
+@contextmanager
+def registered(name, host):
+
+    """
+        Adds host to HOSTS as name for the duration of the block, for hosts
+        no FakeAmazonServer is running on.
+    """
+
+    previous = HOSTS.get(name)
+    HOSTS[name] = host
+
+    try:
+        yield
+    finally:
+        if previous is None:
+            HOSTS.pop(name, None)
+        else:
+            HOSTS[name] = previous
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    # The default backlog of 5 drops bursts of concurrent connects, which
+    # then wait out a 1s SYN retransmit
+    request_queue_size = 64
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    # HTTP/1.1 so clients can keep the connection alive between requests.
+    protocol_version = 'HTTP/1.1'
+
+    # Send headers and body in one write, small separate writes on a
+    # kept-alive socket stall on Nagle + delayed ACK.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.fake._sockets.add(self.connection)
+
+    def finish(self):
+        self.server.fake._sockets.discard(self.connection)
+        BaseHTTPRequestHandler.finish(self)
+
+    def do_GET(self):
+
+        params = dict(parse_qsl(urlparse(self.path).query))
+        self.server.fake.received.append(params)
+        self.server.fake.connections.add(self.client_address)
+
+        with self.server.fake.tracking():
+            status, body = self.server.fake.responder(params)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAmazonServer(object):
+
+    """
+        Local stand-in for the Product Advertising API endpoint. Serves
+        canned XML over keep-alive HTTP so tests and benchmarks can drive
+        AmazonAPI with no network access or credentials. Register it as a
+        host with server.register('fake'), until the server is stopped.
+    """
+
+    def __init__(self, body=ITEM_LOOKUP_XML, responder=None):
+
+        """
+            :param body: String, XML served for every request.
+            :param responder: Callable, receives the request params and
+                              returns a (status, body) tuple. Overrides body.
+        """
+
+        self.body = body
+        self.received = list()
+        self.connections = set()
+        # Requests being answered right now, and the most at once
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.responder = responder or (lambda params: (200, self.body))
+
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        self._thread = None
+        self._sockets = set()
+        self._lock = threading.Lock()
+        # (name, host it replaced) per name registered in HOSTS
+        self._registered = list()
+
+    @property
+    def host(self):
+        return '127.0.0.1:%d' % self._server.server_address[1]
+
+    def register(self, name='fake'):
+
+        """
+            Adds the server to HOSTS as name until it's stopped, so the
+            hosts of one test don't leak into the next.
+
+            :rType: FakeAmazonServer, self
+        """
+
+        self._registered.append((name, HOSTS.get(name)))
+        HOSTS[name] = self.host
+
+        return self
+
+    @contextmanager
+    def tracking(self):
+
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def start(self):
+
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+
+        self._server.shutdown()
+        self._server.server_close()
+
+        # Latest first, so a name registered twice gets its first host back
+        while self._registered:
+            name, previous = self._registered.pop()
+            if previous is None:
+                HOSTS.pop(name, None)
+            else:
+                HOSTS[name] = previous
+
+        # Drop the keep-alive connections clients still hold open
+        for sock in list(self._sockets):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def item_search_responder(total_pages, delay=0):
+
+    """
+        Responder answering ItemSearch requests with 10 items per page and
+        TotalPages set to total_pages. ASINs encode their page, and every
+        page takes delay seconds to be served.
+    """
+
+    def responder(params):
+        page = int(params.get('ItemPage', 1))
+        asins = ['P%02dI%02d' % (page, i) for i in range(10)]
+        content = items_xml(asins, operation='ItemSearch')
+        content = content.replace(
+            '</Request>',
+            '</Request>\n    <TotalResults>%d</TotalResults>'
+            '\n    <TotalPages>%d</TotalPages>' % (total_pages * 10,
+                                                  total_pages), 1)
+        sleep(delay)
+        return 200, content
+
+    return responder
+
+
+BROWSE_NODE_XML = """
+      <BrowseNode>
+        <BrowseNodeId>%s</BrowseNodeId>
+        <Name>Node %s</Name>%s
+      </BrowseNode>"""
+
+
+def browse_node_responder(levels, fanout=3, fail=()):
+
+    """
+        Responder answering BrowseNodeLookup requests over a tree where
+        node n has children n * 10 + 1 ... n * 10 + fanout, down to ids of
+        `levels` digits: the children of 1 are 11, 12, 13, and the parent
+        of 12 is 1. Lookups of the nodes in fail get an InternalError.
+    """
+
+    error = load_fixture(error_code='InternalError')
+
+    def ancestors_xml(node_id):
+        parent = node_id // 10
+        if not parent:
+            return ''
+        return '\n<Ancestors>%s</Ancestors>' % (
+            BROWSE_NODE_XML % (parent, parent, ancestors_xml(parent)))
+
+    def responder(params):
+        node_id = int(params['BrowseNodeId'])
+
+        if node_id in fail:
+            return ERROR_STATUS['InternalError'], error
+
+        children = ''
+        if len(str(node_id)) < levels:
+            children = '\n<Children>%s</Children>' % ''.join(
+                BROWSE_NODE_XML % (child, child, '')
+                for child in range(node_id * 10 + 1,
+                                   node_id * 10 + fanout + 1))
+
+        node = BROWSE_NODE_XML % (node_id, node_id,
+                                  children + ancestors_xml(node_id))
+
+        return 200, ('<?xml version="1.0" ?>\n'
+                     '<BrowseNodeLookupResponse xmlns="http://webservices.'
+                     'amazon.com/AWSECommerceService/2013-09-01">\n'
+                     '  <BrowseNodes>\n'
+                     '    <Request><IsValid>True</IsValid></Request>%s\n'
+                     '  </BrowseNodes>\n'
+                     '</BrowseNodeLookupResponse>\n') % node
+
+    return responder
+
+
+def scripted_responder(script, responder=None):
+
+    """
+        Responder answering the first requests as script says and the rest
+        with responder, the fixtures by default. Each entry of script is an
+        error code, answered with its fixture, a number of seconds to wait
+        before answering normally, or None to answer normally.
+    """
+
+    responder = responder or fixture_responder()
+    script = list(script)
+    lock = threading.Lock()
+
+    errors = dict((code, load_fixture(error_code=code))
+                  for code in script if isinstance(code, basestring))
+
+    def respond(params):
+        with lock:
+            action = script.pop(0) if script else None
+
+        if isinstance(action, basestring):
+            return ERROR_STATUS[action], errors[action]
+
+        if action:
+            sleep(action)
+
+        return responder(params)
+
+    return respond
@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AmazonAPI
+from amazon.amazon_api import ArchiveMissError
+from amazon.archive import ResponseArchive
+from amazon.models import extract_items
+from fake_server import FakeAmazonServer, item_lookup_responder, registered
+
+
+ASINS = ['B%09d' % i for i in range(30)]
+
+
+@contextmanager
+def archive_path():
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        yield os.path.join(tmp_dir, 'archive')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def record(path, asins, prices=None, change=None, **archive_kwargs):
+
+    """
+        Looks up every ASIN of asins on a fake host, one at a time, with a
+        client recording to the archive at path. change is called after
+        every lookup.
+
+        :rType: FakeAmazonServer, stopped, that was the fake host.
+    """
+
+    responder = item_lookup_responder(prices=prices)
+    archive = ResponseArchive(path, **archive_kwargs)
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        api = AmazonAPI('key', 'secret', 'tag', archive=archive)
+
+        for asin in asins:
+            api.item_lookup('fake', ItemId=asin, ResponseGroup='Offers')
+            if change is not None:
+                change()
+
+    archive.close()
+
+    return server
+
+
+def asin_and_price(response):
+
+    item = next(extract_items(response.content))
+
+    return item.asin, item.lowest_new_price
+
+
+# ===============================================================
+#
+#                  Response Archive Unit Tests
+#
+# ===============================================================
+
+
+def test_replay_makes_no_requests():
+
+    with archive_path() as path:
+        server = record(path, ASINS[:3])
+        eq_(len(server.received), 3)
+
+        archive = ResponseArchive(path, mode='replay')
+        api = AmazonAPI('other-key', 'secret', 'tag', archive=archive)
+
+        # Nothing listens there anymore
+        with registered('fake', server.host):
+            response = api.item_lookup('fake', ItemId=ASINS[1],
+                                       ResponseGroup='Offers')
+            eq_(response.Items.Item.ASIN.string, ASINS[1])
+
+            # Other params are another request
+            assert_raises(ArchiveMissError, api.item_lookup, 'fake',
+                          ItemId=ASINS[1], ResponseGroup='Large')
+            assert_raises(ArchiveMissError, api.item_lookup, 'fake',
+                          ItemId=ASINS[5], ResponseGroup='Offers')
+        archive.close()
+
+
+def test_latest_response_wins():
+
+    with archive_path() as path:
+        prices = {ASINS[0]: 1000}
+        # Looked up on the same host, the second time at a lower price
+        record(path, ASINS[:1] * 2, prices=prices,
+               change=lambda: prices.update({ASINS[0]: 900}))
+
+        archive = ResponseArchive(path, mode='replay')
+        responses = list(archive.responses())
+
+        eq_(len(responses), 1)
+        eq_(asin_and_price(responses[0]), (ASINS[0], 900))
+        eq_(responses[0].params['ItemId'], ASINS[0])
+        eq_(responses[0].params['Operation'], 'ItemLookup')
+        ok_('AWSAccessKeyId' not in responses[0].params)
+        ok_('Signature' not in responses[0].params)
+        archive.close()
+
+
+def test_segments_roll_over():
+
+    with archive_path() as path:
+        record(path, ASINS, segment_size=2048)
+
+        archive = ResponseArchive(path, mode='replay')
+        counts = archive.counts()
+
+        eq_(counts['responses'], 30)
+        ok_(counts['segments'] > 1)
+        ok_(all(os.path.getsize(os.path.join(path, name)) <= 2048
+                for name in os.listdir(path) if name.endswith('.seg')))
+        eq_(sorted(response.params['ItemId']
+                   for response in archive.responses()), ASINS)
+        archive.close()
+
+
+def test_responses_are_compressed():
+
+    with archive_path() as path:
+        record(path, ASINS)
+
+        archive = ResponseArchive(path, mode='replay')
+        raw = sum(len(response.content) for response in archive.responses())
+        ok_(archive.counts()['bytes'] < raw)
+        archive.close()
+
+
+def test_reprocess_in_parallel():
+
+    prices = dict((asin, i) for i, asin in enumerate(ASINS))
+
+    with archive_path() as path:
+        record(path, ASINS, prices=prices, segment_size=4096)
+
+        archive = ResponseArchive(path, mode='replay')
+        results = list(archive.reprocess(asin_and_price, processes=2,
+                                         batch=4))
+        archive.close()
+
+    # In the order they were recorded
+    eq_(results, [(asin, prices[asin]) for asin in ASINS])
+
+
+def test_invalid_mode():
+
+    with archive_path() as path:
+        assert_raises(ValueError, ResponseArchive, path, mode='read')
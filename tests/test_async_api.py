@@ -0,0 +1,88 @@
+import threading
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AsyncAmazonAPI, AmazonAPIError, AmazonAPIResponseError
+from fake_server import FakeAmazonServer, item_lookup_responder
+
+
+# ===============================================================
+#
+#                  Async Client Unit Tests
+#
+# ===============================================================
+
+
+def test_async_item_lookup_returns_future():
+
+    with FakeAmazonServer() as server:
+        server.register('fake')
+
+        with AsyncAmazonAPI('key', 'secret', 'tag') as amz:
+            result = amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+            response = result.get(timeout=10)
+
+    eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+
+
+def test_async_calls_run_concurrently_with_bounded_workers():
+
+    in_flight = [0]
+    peak = [0]
+    lock = threading.Lock()
+    release = threading.Event()
+    responder = item_lookup_responder()
+
+    def slow_responder(params):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        release.wait(0.2)
+        with lock:
+            in_flight[0] -= 1
+        return responder(params)
+
+    with FakeAmazonServer(responder=slow_responder) as server:
+        server.register('fake')
+
+        with AsyncAmazonAPI('key', 'secret', 'tag', concurrency=8) as amz:
+            asins = ['B%09d' % i for i in range(40)]
+            results = [amz.item_lookup(host='fake', ItemId=asin)
+                       for asin in asins]
+            responses = [result.get(timeout=30) for result in results]
+
+    eq_([r.Items.Item.ASIN.string for r in responses], asins)
+    ok_(1 < peak[0] <= 8, msg="Peak in-flight calls was %d" % peak[0])
+
+
+def test_async_callback_is_called():
+
+    received = list()
+
+    with FakeAmazonServer() as server:
+        server.register('fake')
+
+        with AsyncAmazonAPI('key', 'secret', 'tag') as amz:
+            amz.item_lookup(host='fake', ItemId='B0041OSCBU',
+                            callback=received.append)
+
+    eq_(len(received), 1)
+
+
+def test_async_errors_raise_on_get():
+
+    responder = item_lookup_responder(invalid=['BAD'])
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+
+        with AsyncAmazonAPI('key', 'secret', 'tag') as amz:
+            result = amz.item_lookup(host='fake', ItemId='BAD')
+            assert_raises(AmazonAPIResponseError, result.get, 10)
+
+
+def test_async_invalid_host_raises_at_once():
+
+    with AsyncAmazonAPI('key', 'secret', 'tag') as amz:
+        assert_raises(AmazonAPIError, amz.item_lookup, host='co',
+                      ItemId='B0041OSCBU')
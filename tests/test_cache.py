@@ -0,0 +1,141 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from nose.tools import eq_, ok_
+
+from amazon import AmazonAPI
+from amazon.cache import ResponseCache, MemoryBackend, SQLiteBackend
+from fake_server import FakeAmazonServer, item_lookup_responder
+
+
+# ===============================================================
+#
+#                  Response Cache Unit Tests
+#
+# ===============================================================
+
+
+def test_key_ignores_timestamp_signature_and_access_key():
+
+    cache = ResponseCache()
+
+    first = cache.key('h', 'AWSAccessKeyId=a&ItemId=A&Operation=ItemLookup'
+                           '&Timestamp=2015-01-01T00%3A00%3A00Z')
+    second = cache.key('h', 'AWSAccessKeyId=b&ItemId=A&Operation=ItemLookup'
+                            '&Timestamp=2015-01-02T00%3A00%3A00Z'
+                            '&Signature=abc')
+
+    eq_(first, second)
+    ok_(first != cache.key('h', 'AssociateTag=t&ItemId=A'
+                                '&Operation=ItemLookup'))
+    ok_(first != cache.key('h', 'ItemId=B&Operation=ItemLookup'))
+    ok_(first != cache.key('other', 'ItemId=A&Operation=ItemLookup'))
+
+
+def test_ttl_per_operation_and_offers():
+
+    cache = ResponseCache(ttls={'ItemLookup': 600}, offers_ttl=60)
+
+    eq_(cache.ttl({'Operation': 'ItemLookup'}), 600)
+    eq_(cache.ttl({'Operation': 'ItemLookup',
+                   'ResponseGroup': 'ItemAttributes,Offers'}), 60)
+    eq_(cache.ttl({'Operation': 'BrowseNodeLookup'}), 3 * 24 * 3600)
+
+
+def test_memory_backend_lru_by_entries_and_bytes():
+
+    backend = MemoryBackend(max_entries=2, max_bytes=10)
+
+    backend.set('a', '1234', 60)
+    backend.set('b', '1234', 60)
+    backend.get('a')
+    backend.set('c', '1234', 60)
+
+    eq_(backend.get('b'), None, msg="Least recently used entry was kept")
+    eq_(backend.get('a'), '1234')
+
+    backend.set('d', '12345678', 60)
+
+    eq_(backend.get('a'), None)
+    eq_(backend.get('c'), None)
+    eq_(backend.get('d'), '12345678')
+
+
+def test_memory_backend_expires_entries():
+
+    backend = MemoryBackend()
+    backend.set('a', '1234', -1)
+
+    eq_(backend.get('a'), None)
+    eq_(backend.size, 0)
+
+
+def test_sqlite_backend_is_shared_and_lru():
+
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'cache.db')
+
+    try:
+        writer = SQLiteBackend(path, max_entries=2)
+        reader = SQLiteBackend(path, max_entries=2)
+
+        writer.set('a', '<a/>', 60)
+        eq_(reader.get('a'), '<a/>')
+
+        writer.set('b', '<b/>', 60)
+        writer.set('c', '<c/>', 60)
+
+        eq_(reader.get('a'), None, msg="Least recently used entry was kept")
+        eq_(reader.get('c'), '<c/>')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_sqlite_backend_keeps_totals_and_batches_hits():
+
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'cache.db')
+
+    try:
+        backend = SQLiteBackend(path, max_entries=2, touch_batch=10)
+
+        backend.set('a', '1234', 60)
+        backend.set('b', '12', 60)
+        backend.set('b', '123456', 60)
+        eq_(backend.counts(), dict(entries=2, bytes=10))
+
+        # A hit isn't written until the batch fills or the next set
+        backend.get('a')
+        accessed = sqlite3.connect(path).execute(
+            "SELECT key FROM responses ORDER BY accessed").fetchall()
+        eq_([key for key, in accessed], ['a', 'b'])
+
+        backend.set('c', '1', 60)
+        eq_(backend.get('b'), None, msg="Least recently used entry was kept")
+        eq_(backend.get('a'), '1234')
+        eq_(backend.counts(), dict(entries=2, bytes=5))
+
+        backend.clear()
+        eq_(backend.counts(), dict(entries=0, bytes=0))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_client_serves_repeated_calls_from_cache():
+
+    cache = ResponseCache()
+    amz = AmazonAPI('key', 'secret', 'tag', cache=cache)
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+
+        for _ in range(3):
+            response = amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+
+        amz.item_lookup(host='fake', ItemId='B000000001')
+
+    eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+    eq_(len(server.received), 2)
+    eq_(cache.stats(), dict(hits=2, misses=2))
@@ -0,0 +1,148 @@
+import threading
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AmazonAPI, AmazonAPIError
+from amazon import CoalescingAPI
+from amazon.amazon_api import InvalidRequestError
+from fake_server import FakeAmazonServer, item_lookup_responder
+
+
+def run_concurrently(calls):
+
+    """
+        Runs every call in a thread of its own, all at once.
+
+        :rType: List, of (result, error) in calls order.
+    """
+
+    results = [None] * len(calls)
+    start = threading.Event()
+
+    def run(i, call):
+        start.wait()
+        try:
+            results[i] = (call(), None)
+        except Exception as e:
+            results[i] = (None, e)
+
+    threads = [threading.Thread(target=run, args=(i, call))
+               for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def requested_ids(server):
+    return [params['ItemId'].split(',') for params in server.received]
+
+
+# ===============================================================
+#
+#                  Coalescing Unit Tests
+#
+# ===============================================================
+
+
+def test_single_asin_lookups_are_batched():
+
+    responder = item_lookup_responder(delay=0.05)
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        amz = CoalescingAPI(AmazonAPI('key', 'secret', 'tag'), window=0.2)
+
+        asins = ['B%09d' % i for i in range(25)]
+        results = run_concurrently([
+            lambda asin=asin: amz.item_lookup(host='fake', ItemId=asin)
+            for asin in asins])
+
+    eq_([error for _, error in results], [None] * 25)
+    eq_([response.Items.Item.ASIN.string for response, _ in results], asins)
+    eq_([len(response.Items.find_all('Item')) for response, _ in results],
+        [1] * 25)
+
+    eq_(sorted(sum(requested_ids(server), [])), asins)
+    eq_(len(server.received), 3)
+    ok_(all(len(ids) <= 10 for ids in requested_ids(server)))
+    eq_(amz.stats(), dict(calls=25, requests=3, shared=0, batched=25))
+
+
+def test_identical_calls_share_one_request():
+
+    responder = item_lookup_responder(delay=0.1)
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        amz = CoalescingAPI(AmazonAPI('key', 'secret', 'tag'))
+
+        results = run_concurrently([
+            lambda: amz.item_lookup(host='fake', ItemId='B1,B2')
+            for _ in range(8)])
+
+    eq_(len(server.received), 1)
+    ok_(all(response is results[0][0] for response, _ in results))
+    eq_(amz.stats()['shared'], 7)
+
+
+def test_batch_keeps_params_apart():
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+        amz = CoalescingAPI(AmazonAPI('key', 'secret', 'tag'), window=0.1)
+
+        run_concurrently([
+            lambda: amz.item_lookup(host='fake', ItemId='B1'),
+            lambda: amz.item_lookup(host='fake', ItemId='B2'),
+            lambda: amz.item_lookup(host='fake', ItemId='B3',
+                                    ResponseGroup='Offers'),
+            lambda: amz.item_lookup(host='fake', ItemId='B4',
+                                    VariationPage=2)])
+
+    groups = set((params.get('ResponseGroup'),
+                  frozenset(params['ItemId'].split(',')))
+                 for params in server.received)
+    eq_(groups, set([(None, frozenset(['B1', 'B2'])),
+                     ('Offers', frozenset(['B3'])),
+                     (None, frozenset(['B4']))]))
+
+
+def test_batched_errors_go_to_their_caller():
+
+    responder = item_lookup_responder(invalid=['BAD'])
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        amz = CoalescingAPI(AmazonAPI('key', 'secret', 'tag'), window=0.1)
+
+        results = run_concurrently([
+            lambda: amz.item_lookup(host='fake', ItemId='B1'),
+            lambda: amz.item_lookup(host='fake', ItemId='BAD')])
+
+    eq_(len(server.received), 1)
+    eq_(results[0][0].Items.Item.ASIN.string, 'B1')
+    ok_(isinstance(results[1][1], InvalidRequestError))
+    eq_(results[1][1].code, 'AWS.InvalidParameterValue')
+    eq_(results[1][1].item_id, 'BAD')
+
+
+def test_full_batch_does_not_wait_for_window():
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+        amz = CoalescingAPI(AmazonAPI('key', 'secret', 'tag'), window=30,
+                            max_batch=2)
+
+        results = run_concurrently([
+            lambda asin=asin: amz.item_lookup(host='fake', ItemId=asin)
+            for asin in ['B1', 'B2']])
+
+    eq_([error for _, error in results], [None, None])
+
+
+def test_max_batch_bounds():
+    assert_raises(AmazonAPIError, CoalescingAPI, None, max_batch=11)
@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+from unittest import SkipTest
+
+from bs4 import BeautifulSoup
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon.columns import (ItemColumns, Int64Column, COLUMNS,
+                            extract_columns)
+from amazon.lxml_parser import parse
+from amazon.models import extract_items
+from fake_server import load_fixture, items_xml
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def value(columns, name, row):
+
+    """
+        Value of a cell read back from the buffers, None when missing.
+    """
+
+    column = columns.columns[name]
+
+    if name in ('asin', 'parent_asin'):
+        start = row * column.width
+        return str(column.buffer[start:start + column.width]).rstrip('\0') \
+            or None
+
+    if hasattr(column, 'codes'):
+        code = column.codes[row]
+        return column.dictionary[code] if code >= 0 else None
+
+    if column.values[row] == Int64Column.NULL:
+        return None
+    return int(column.values[row])
+
+
+# ===============================================================
+#
+#                  Item Columns Unit Tests
+#
+# ===============================================================
+
+
+def test_columns_match_models():
+
+    for operation in ('ItemLookup', 'ItemSearch', 'SimilarityLookup'):
+        content = load_fixture(operation)
+        items = list(extract_items(content))
+
+        for source in (content, parse(content),
+                       BeautifulSoup(content, "xml")):
+            columns = ItemColumns()
+            eq_(columns.extend(source), len(items))
+            eq_(len(columns), len(items))
+
+            for row, item in enumerate(items):
+                fields = item.to_dict()
+                for name in COLUMNS:
+                    eq_(value(columns, name, row), fields[name],
+                        msg="%s %s row %d of %s" % (operation, name, row,
+                                                    type(source).__name__))
+
+
+def test_many_responses_and_parsers():
+
+    prices = dict(B1=1000, B2=250, B3=1000, B4=250)
+
+    columns = extract_columns([items_xml(['B1', 'B2'], prices=prices),
+                               parse(items_xml(['B3'], prices=prices)),
+                               BeautifulSoup(items_xml(['B4'], prices=prices),
+                                             "xml")],
+                              columns=('asin', 'lowest_new_price',
+                                       'currency'))
+
+    eq_(len(columns), 4)
+    eq_([value(columns, 'asin', row) for row in range(4)],
+        ['B1', 'B2', 'B3', 'B4'])
+    eq_(list(columns.columns['lowest_new_price'].values),
+        [1000, 250, 1000, 250])
+    # One code per distinct string, whatever the parser
+    eq_(columns.columns['currency'].dictionary, ['USD'])
+    eq_(list(columns.columns['currency'].codes), [0, 0, 0, 0])
+
+
+def test_missing_values():
+
+    columns = extract_columns([items_xml(['B1', 'B2'], invalid=['B2'])])
+
+    eq_(len(columns), 1)
+    eq_(value(columns, 'sales_rank', 0), None)
+    eq_(value(columns, 'parent_asin', 0), None)
+    eq_(list(columns.columns['brand'].codes), [-1])
+
+
+def test_unknown_column():
+    assert_raises(ValueError, ItemColumns, ('asin', 'offers'))
+
+
+def test_numpy_arrays():
+
+    if numpy is None:
+        raise SkipTest("numpy isn't installed")
+
+    columns = extract_columns([load_fixture('ItemSearch')])
+    arrays = columns.to_numpy()
+    items = list(extract_items(load_fixture('ItemSearch')))
+
+    eq_(arrays['asin'].dtype, numpy.dtype('S10'))
+    eq_(list(arrays['asin']), [item.asin for item in items])
+    eq_(arrays['list_price'].dtype, numpy.int64)
+    eq_(arrays['list_price'].tolist(), [item.list_price for item in items])
+    ok_(arrays['title'].dtype == numpy.int32)
+
+
+def sources():
+
+    # Fixture Items lack parent ASINs and prices, these have prices
+    return [load_fixture('ItemSearch'),
+            items_xml(['B1', 'B2'], prices=dict(B1=1000, B2=250))]
+
+
+def test_pandas_frame():
+
+    try:
+        import pandas
+    except ImportError:
+        raise SkipTest("pandas isn't installed")
+
+    frame = extract_columns(sources()).to_pandas()
+    items = [item for source in sources() for item in extract_items(source)]
+
+    def values(name):
+        return [None if pandas.isnull(value) else value
+                for value in frame[name]]
+
+    eq_(list(frame.columns), list(COLUMNS))
+    eq_(values('asin'), [item.asin for item in items])
+    ok_(all(isinstance(asin, unicode) for asin in frame['asin']))
+    eq_(values('parent_asin'), [None] * len(items))
+    eq_(str(frame['lowest_new_price'].dtype), 'Int64')
+    eq_(values('lowest_new_price'), [item.lowest_new_price for item in items])
+    eq_(frame['brand'].dtype.name, 'category')
+
+
+def test_arrow_table_and_parquet():
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SkipTest("pyarrow isn't installed")
+
+    columns = extract_columns(sources())
+    table = columns.to_arrow()
+    items = [item for source in sources() for item in extract_items(source)]
+
+    eq_(table.schema.field('asin').type, pyarrow.string())
+    eq_(table.schema.field('lowest_new_price').type, pyarrow.int64())
+    ok_(pyarrow.types.is_dictionary(table.schema.field('title').type))
+    eq_(table.column('parent_asin').to_pylist(), [None] * len(items))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'items.parquet')
+        columns.write_parquet(path)
+        written = pyarrow.parquet.read_table(path)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    eq_(written.num_rows, len(items))
+    eq_(written.column('asin').to_pylist(), [item.asin for item in items])
+    eq_(written.column('lowest_new_price').to_pylist(),
+        [item.lowest_new_price for item in items])
+    eq_(written.column('title').to_pylist(), [item.title for item in items])
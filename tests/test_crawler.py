@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+from time import time
+from contextlib import contextmanager
+
+from nose.tools import eq_
+
+from amazon import AmazonAPI
+from amazon.amazon_api import CircuitOpenError
+from amazon.crawler import BrowseNodeIndex, BrowseNodeCrawler
+from fake_server import FakeAmazonServer, browse_node_responder
+
+
+@contextmanager
+def index_path():
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        yield os.path.join(tmp_dir, 'nodes.db')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def crawl(path, server, roots, **kwargs):
+
+    server.register('fake')
+
+    index = BrowseNodeIndex(path)
+    crawler = BrowseNodeCrawler(AmazonAPI('key', 'secret', 'tag'), index,
+                                workers=4, batch=5)
+    try:
+        return crawler.crawl('fake', roots, **kwargs), index.counts('fake')
+    finally:
+        index.close()
+
+
+def looked_up(server):
+    return [int(params['BrowseNodeId']) for params in server.received]
+
+
+# ===============================================================
+#
+#                  BrowseNode Crawler Unit Tests
+#
+# ===============================================================
+
+
+def test_crawl_whole_tree_once():
+
+    with index_path() as path:
+        # 1 root, 3 children, 9 grandchildren
+        with FakeAmazonServer(responder=browse_node_responder(3)) as server:
+            result, counts = crawl(path, server, [1])
+
+        eq_(result, dict(crawled=13, failed=0, pending=0))
+        eq_(counts, dict(nodes=13, crawled=13, pending=0, edges=12))
+        eq_(sorted(looked_up(server)), sorted(set(looked_up(server))))
+
+        index = BrowseNodeIndex(path)
+        eq_(index.children('fake', 1), [11, 12, 13])
+        eq_(index.parents('fake', 123), [12])
+        eq_(index.node('fake', 12)['name'], 'Node 12')
+        eq_(index.node('fake', 123)['depth'], 2)
+
+
+def test_crawl_is_breadth_first():
+
+    with index_path() as path:
+        with FakeAmazonServer(responder=browse_node_responder(3)) as server:
+            crawl(path, server, [1])
+
+        depths = [len(str(node_id)) for node_id in looked_up(server)]
+        eq_(depths, sorted(depths))
+
+
+def test_crawl_follows_ancestors():
+
+    with index_path() as path:
+        with FakeAmazonServer(responder=browse_node_responder(3)) as server:
+            result, counts = crawl(path, server, [12])
+
+        eq_(counts['crawled'], 13)
+        eq_(BrowseNodeIndex(path).parents('fake', 12), [1])
+
+
+def test_crawl_resumes_from_checkpoint():
+
+    with index_path() as path:
+        with FakeAmazonServer(responder=browse_node_responder(3)) as server:
+            result, counts = crawl(path, server, [1], max_nodes=6)
+            eq_(result['crawled'], 6)
+            eq_(counts['pending'], 7)
+
+            result, counts = crawl(path, server, [1])
+
+        eq_(result['crawled'], 7)
+        eq_(counts['crawled'], 13)
+        eq_(len(looked_up(server)), 13, msg="Nodes were looked up twice")
+
+
+def test_failed_nodes_stay_pending():
+
+    with index_path() as path:
+        responder = browse_node_responder(3, fail=(12,))
+
+        with FakeAmazonServer(responder=responder) as server:
+            result, counts = crawl(path, server, [1])
+
+        eq_(result['failed'], 3, msg="Failed node wasn't retried")
+        eq_(counts['crawled'], 9)
+        eq_(counts['pending'], 0)
+
+        with FakeAmazonServer(responder=browse_node_responder(3)) as server:
+            result, counts = crawl(path, server, [1])
+
+        eq_(sorted(looked_up(server)), [12, 121, 122, 123])
+        eq_(counts['crawled'], 13)
+
+
+def test_any_lookup_error_fails_only_its_node():
+
+    class FlakyAPI(AmazonAPI):
+
+        def node_browse_lookup(self, host=None, browse_node_id=None,
+                               response_group=None):
+            if browse_node_id == 12:
+                raise CircuitOpenError("Circuit open")
+            if browse_node_id == 13:
+                # lxml's XMLSyntaxError is a SyntaxError
+                raise SyntaxError("Malformed XML")
+            return super(FlakyAPI, self).node_browse_lookup(
+                host, browse_node_id, response_group)
+
+    with index_path() as path:
+        with FakeAmazonServer(responder=browse_node_responder(3)) as server:
+            server.register('fake')
+            index = BrowseNodeIndex(path)
+            crawler = BrowseNodeCrawler(FlakyAPI('key', 'secret', 'tag'),
+                                        index, workers=4, batch=5)
+            result = crawler.crawl('fake', [1])
+            counts = index.counts('fake')
+            index.close()
+
+    eq_(result['failed'], 6)
+    eq_(counts['crawled'], 5)
+
+
+def test_recrawl_only_revisits_stale_subtrees():
+
+    with index_path() as path:
+        with FakeAmazonServer(responder=browse_node_responder(3)) as server:
+            crawl(path, server, [1])
+
+            # Make the subtree of 12 stale
+            index = BrowseNodeIndex(path)
+            with index._db as db:
+                db.execute("UPDATE nodes SET crawled = ? WHERE node_id IN"
+                           " (12, 121, 122, 123)", (time() - 3600,))
+            index.close()
+
+            del server.received[:]
+            result, counts = crawl(path, server, [1], max_age=600)
+            eq_(sorted(looked_up(server)), [12, 121, 122, 123])
+
+            del server.received[:]
+            result, counts = crawl(path, server, [1], max_age=600)
+            eq_(looked_up(server), [])
+
+        eq_(result['crawled'], 0)
@@ -0,0 +1,192 @@
+from nose.tools import eq_, ok_, assert_raises
+from requests import Timeout
+
+from amazon import CredentialPool, AmazonAPIError
+from amazon.amazon_api import CredentialsError, ServiceError
+from amazon.rate_limit import RateLimiter
+from amazon.resilience import RetryPolicy
+from fake_server import (FakeAmazonServer, ERROR_STATUS, load_fixture,
+                         item_lookup_responder, scripted_responder)
+
+
+def credentials(*keys):
+    return [(key, 'secret', 'tag-%s' % key) for key in keys]
+
+
+def failing_responder(bad_keys, error_code='InvalidClientTokenId'):
+
+    """
+        Answers the calls signed with any of bad_keys with error_code.
+    """
+
+    responder = item_lookup_responder()
+    status = ERROR_STATUS[error_code]
+    error = load_fixture(error_code=error_code)
+
+    def respond(params):
+        if params.get('AWSAccessKeyId') in bad_keys:
+            return status, error
+        return responder(params)
+
+    return respond
+
+
+# ===============================================================
+#
+#                  Credential Pool Unit Tests
+#
+# ===============================================================
+
+
+def test_pool_spreads_calls_over_credentials():
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+
+        limiter = RateLimiter(rate=20)
+        with CredentialPool(credentials('a', 'b', 'c'),
+                            rate_limiter=limiter) as pool:
+            for i in range(6):
+                response = pool.item_lookup(host='fake', ItemId='B%09d' % i)
+                eq_(response.Items.Item.ASIN.string, 'B%09d' % i)
+
+    keys = [params['AWSAccessKeyId'] for params in server.received]
+    eq_(sorted(keys), ['a', 'a', 'b', 'b', 'c', 'c'])
+
+    tags = set(params['AssociateTag'] for params in server.received)
+    eq_(tags, set(['tag-a', 'tag-b', 'tag-c']))
+
+
+def test_pool_prefers_credential_with_spare_budget():
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+
+        limiter = RateLimiter(rates={'fast': 50}, rate=0.5)
+        with CredentialPool(credentials('slow', 'fast'),
+                            rate_limiter=limiter) as pool:
+            for i in range(5):
+                pool.item_lookup(host='fake', ItemId='B%09d' % i)
+
+    keys = [params['AWSAccessKeyId'] for params in server.received]
+    eq_(keys.count('slow'), 1)
+    eq_(keys.count('fast'), 4)
+
+
+def test_pool_benches_invalid_credential():
+
+    responder = failing_responder(['bad'])
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+
+        with CredentialPool(credentials('bad', 'good'),
+                            rate_limiter=RateLimiter(rate=20)) as pool:
+            for i in range(4):
+                response = pool.item_lookup(host='fake', ItemId='B%09d' % i)
+                eq_(response.Items.Item.ASIN.string, 'B%09d' % i)
+
+            stats = pool.stats()
+
+    keys = [params['AWSAccessKeyId'] for params in server.received]
+    eq_(keys.count('bad'), 1, msg="Benched credential kept being used")
+
+    eq_(stats['bad']['errors'], 1)
+    eq_(stats['bad']['error_codes'], {'InvalidClientTokenId': 1})
+    eq_(stats['bad']['error_rate'], 1.0)
+    eq_(stats['bad']['benched'], 1)
+    eq_(stats['good']['calls'], 4)
+    eq_(stats['good']['error_rate'], 0.0)
+    ok_(stats['good']['throughput'] > 0)
+
+
+def test_pool_benches_credential_over_its_limit():
+
+    responder = failing_responder(['busy'], 'AccountLimitExceeded')
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+
+        # Over its limit for the hour, not worth retrying with that key
+        with CredentialPool(credentials('busy', 'idle'),
+                            rate_limiter=RateLimiter(rate=20),
+                            retry=RetryPolicy(base_delay=0.01)) as pool:
+            pool.item_lookup(host='fake', ItemId='B000000001')
+            pool.item_lookup(host='fake', ItemId='B000000002')
+
+            stats = pool.stats()
+
+    keys = [params['AWSAccessKeyId'] for params in server.received]
+    eq_(keys.count('busy'), 1)
+    eq_(stats['busy']['benched'], 1)
+    eq_(stats['idle']['calls'], 2)
+
+
+def test_pool_with_every_credential_benched():
+
+    responder = failing_responder(['a', 'b'])
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+
+        with CredentialPool(credentials('a', 'b'),
+                            rate_limiter=RateLimiter(rate=20)) as pool:
+            assert_raises(CredentialsError, pool.item_lookup, host='fake',
+                          ItemId='B000000001')
+            assert_raises(AmazonAPIError, pool.item_lookup, host='fake',
+                          ItemId='B000000001')
+
+    eq_(len(server.received), 2)
+
+
+def test_pool_does_not_retry_other_errors():
+
+    responder = failing_responder(['a', 'b'], 'InternalError')
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+
+        with CredentialPool(credentials('a', 'b'),
+                            rate_limiter=RateLimiter(rate=20)) as pool:
+            assert_raises(ServiceError, pool.item_lookup, host='fake',
+                          ItemId='B000000001')
+
+            stats = pool.stats()
+
+    eq_(len(server.received), 1)
+    eq_(sum(s['benched'] for s in stats.values()), 0)
+
+
+def test_pool_counts_every_failed_call():
+
+    with FakeAmazonServer(responder=scripted_responder([1])) as server:
+        server.register('fake')
+
+        with CredentialPool(credentials('a'),
+                            rate_limiter=RateLimiter(rate=20), timeout=0.2,
+                            pool_retries=0) as pool:
+            assert_raises(Timeout, pool.item_lookup, host='fake',
+                          ItemId='B000000001')
+            pool.item_lookup(host='fake', ItemId='B000000001')
+
+            stats = pool.stats()['a']
+
+    eq_(stats['calls'], 2)
+    eq_(stats['errors'], 1)
+    eq_(stats['error_codes'], {'ReadTimeout': 1})
+    eq_(stats['error_rate'], 0.5)
+
+
+def test_pool_rejects_unknown_host():
+
+    limiter = RateLimiter(rate=20)
+
+    with CredentialPool(credentials('a'), rate_limiter=limiter) as pool:
+        assert_raises(AmazonAPIError, pool.item_lookup, host='xx',
+                      ItemId='B000000001')
+
+    eq_(limiter.stats(), {})
+
+
+def test_pool_needs_credentials():
+    assert_raises(AmazonAPIError, CredentialPool, [])
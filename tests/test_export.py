@@ -0,0 +1,153 @@
+import os
+import csv
+import json
+import shutil
+import tempfile
+from contextlib import contextmanager
+from StringIO import StringIO
+
+from nose.tools import eq_, ok_
+
+from amazon import AmazonAPI
+from amazon.export import JSONLinesWriter, main, export, checkpoint
+from fake_server import FakeAmazonServer, item_lookup_responder
+
+
+ASINS = ['B%09d' % i for i in range(25)]
+
+CREDENTIALS = ['--access-key', 'key', '--secret-key', 'secret',
+               '--associate-tag', 'tag', '--rate', '1000']
+
+
+@contextmanager
+def export_dir():
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        with open(os.path.join(tmp_dir, 'asins.txt'), 'w') as asins:
+            asins.write('# ASINs\n\n' + '\n'.join(ASINS) + '\n')
+        yield tmp_dir
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def run(tmp_dir, output, *options, **kwargs):
+
+    with FakeAmazonServer(responder=item_lookup_responder(**kwargs)) as server:
+        server.register('fake')
+
+        exit_code = main([os.path.join(tmp_dir, 'asins.txt'), '--host',
+                          'fake', '--output', os.path.join(tmp_dir, output)] +
+                         CREDENTIALS + list(options))
+
+    return exit_code, server
+
+
+def requested_ids(server):
+    return sum([params['ItemId'].split(',') for params in server.received], [])
+
+
+# ===============================================================
+#
+#                  Bulk Export Unit Tests
+#
+# ===============================================================
+
+
+def test_export_jsonl():
+
+    with export_dir() as tmp_dir:
+        exit_code, server = run(tmp_dir, 'items.jsonl', '--fields',
+                                'title,product_group', invalid=['B000000003'])
+
+        with open(os.path.join(tmp_dir, 'items.jsonl')) as output:
+            rows = [json.loads(line) for line in output]
+
+    eq_(exit_code, 0)
+    eq_(len(server.received), 3)
+    eq_([row['asin'] for row in rows], ASINS)
+    eq_(rows[0], dict(asin='B000000000', title='Stand-in Item B000000000',
+                      product_group='Book'))
+    ok_(rows[3]['error'].startswith('AWS.InvalidParameterValue: '))
+
+
+def test_export_csv():
+
+    with export_dir() as tmp_dir:
+        exit_code, server = run(tmp_dir, 'items.csv', '--fields',
+                                'title,offers')
+
+        with open(os.path.join(tmp_dir, 'items.csv')) as output:
+            rows = list(csv.reader(output))
+
+    eq_(rows[0], ['asin', 'title', 'offers', 'error'])
+    eq_(rows[1], ['B000000000', 'Stand-in Item B000000000', '[]', ''])
+    eq_(len(rows), 26)
+
+
+def test_response_group_follows_fields():
+
+    with export_dir() as tmp_dir:
+        eq_(run(tmp_dir, 'items.jsonl', '--fields',
+                'sales_rank,lowest_new_price')[1].received[0]['ResponseGroup'],
+            'OfferSummary,SalesRank')
+        eq_(run(tmp_dir, 'items.jsonl')[1].received[0]['ResponseGroup'],
+            'Images,ItemAttributes,Offers,SalesRank')
+        eq_(run(tmp_dir, 'items.jsonl', '--fields', 'sales_rank',
+                '--response-group', 'Large')[1].received[0]['ResponseGroup'],
+            'Large')
+
+
+def test_export_resumes_from_output():
+
+    with export_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, 'items.csv')
+        run(tmp_dir, 'items.csv')
+
+        # Keep the header, 12 rows and half of the next one
+        with open(path) as output:
+            lines = output.readlines()
+        with open(path, 'w') as output:
+            output.writelines(lines[:13])
+            output.write(lines[13][:10])
+
+        exit_code, server = run(tmp_dir, 'items.csv', '--resume')
+
+        with open(path) as output:
+            rows = list(csv.reader(output))
+
+    eq_(sorted(requested_ids(server)), ASINS[12:])
+    eq_([row[0] for row in rows], ['asin'] + ASINS)
+
+
+def test_checkpoint_of_missing_output():
+    eq_(checkpoint('/nonexistent/items.jsonl'), 0)
+
+
+def test_export_keeps_bounded_queue():
+
+    consumed = [0]
+    written = [0]
+    backlog = [0]
+
+    def ids():
+        for asin in ASINS * 20:
+            consumed[0] += 1
+            backlog[0] = max(backlog[0], consumed[0] - written[0])
+            yield asin
+
+    class CountingWriter(JSONLinesWriter):
+        def write(self, row):
+            written[0] += 1
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+
+        amz = AmazonAPI('key', 'secret', 'tag')
+        counts = export(amz, 'fake', ids(), CountingWriter(None, ()),
+                        StringIO(), concurrency=2)
+
+    eq_(counts, dict(ids=500, items=500, errors=0))
+    # 2 * concurrency lookups of 10 queued, plus the one being read
+    ok_(backlog[0] <= 50, msg="%d ids were queued" % backlog[0])
@@ -0,0 +1,79 @@
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AmazonAPI, AmazonAPIResponseError
+from amazon.amazon_api import RESPONSE_ERRORS, ThrottlingError, response_error
+from fake_server import ERROR_STATUS, OPERATIONS, load_fixture
+
+
+clients = [AmazonAPI('key', 'secret', 'tag', parser=parser)
+           for parser in ('bs4', 'lxml')]
+
+
+# ===============================================================
+#
+#                  Recorded Responses Unit Tests
+#
+# ===============================================================
+
+
+def test_operation_fixtures_pass_check_response():
+
+    for amz in clients:
+        for operation in OPERATIONS:
+            response = amz._parse(load_fixture(operation))
+
+            ok_(amz._check_response(response) is response)
+            eq_(amz._error_code(response), None)
+
+
+def test_error_fixtures_carry_their_code():
+
+    for amz in clients:
+        for code in ERROR_STATUS:
+            response = amz._parse(load_fixture(error_code=code))
+
+            eq_(amz._error_code(response), code)
+
+
+def test_request_error_fixtures_raise():
+
+    request_errors = [code for code, status in ERROR_STATUS.items()
+                      if status == 200]
+
+    for amz in clients:
+        for code in request_errors:
+            response = amz._parse(load_fixture(error_code=code))
+
+            assert_raises(AmazonAPIResponseError, amz._check_response,
+                          response)
+
+
+def test_errors_raise_their_class_and_code():
+
+    for amz in clients:
+        for code in ERROR_STATUS:
+            response = amz._parse(load_fixture(error_code=code))
+            error_class, retryable = RESPONSE_ERRORS[code]
+
+            try:
+                amz._check_response(response)
+            except AmazonAPIResponseError as e:
+                eq_(type(e), error_class)
+                eq_(e.code, code)
+                eq_(e.retryable, retryable)
+                eq_(e.permanent, not retryable)
+                ok_(e.message)
+            else:
+                ok_(False, msg="%s didn't raise" % code)
+
+
+def test_error_classes_are_retryable_or_permanent():
+
+    ok_(response_error('InternalError').retryable)
+    ok_(isinstance(response_error('RequestThrottled'), ThrottlingError))
+    ok_(response_error('AWS.InvalidParameterValue').permanent)
+
+    unknown = response_error('AWS.SomethingNew', 'New error')
+    eq_(type(unknown), AmazonAPIResponseError)
+    eq_(unknown.code, 'AWS.SomethingNew')
+    ok_(unknown.permanent)
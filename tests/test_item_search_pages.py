@@ -0,0 +1,75 @@
+from nose.tools import eq_, ok_
+
+from amazon import AmazonAPI
+from fake_server import FakeAmazonServer, item_search_responder
+
+
+amz = AmazonAPI('key', 'secret', 'tag')
+
+
+def search(server, **kwargs):
+
+    server.register('fake')
+
+    items = amz.iter_item_search(host='fake', Keywords='Harry Potter',
+                                 SearchIndex='Books', **kwargs)
+
+    return [item.ASIN.string for item in items]
+
+
+# ===============================================================
+#
+#                  Paginated Item Search Unit Tests
+#
+# ===============================================================
+
+
+def test_iter_item_search_walks_pages_in_order():
+
+    with FakeAmazonServer(responder=item_search_responder(3)) as server:
+        asins = search(server)
+
+    eq_(len(asins), 30)
+    eq_(asins[0], 'P01I00')
+    eq_(asins[-1], 'P03I09')
+    eq_(asins, sorted(asins))
+
+
+def test_iter_item_search_stops_at_page_cap():
+
+    with FakeAmazonServer(responder=item_search_responder(40)) as server:
+        eq_(len(search(server)), 100)
+
+    with FakeAmazonServer(responder=item_search_responder(40)) as server:
+        server.register('fake')
+        items = amz.iter_item_search(host='fake', Keywords='Harry Potter',
+                                     SearchIndex='All')
+        eq_(len(list(items)), 50)
+
+
+def test_iter_item_search_max_items():
+
+    with FakeAmazonServer(responder=item_search_responder(10)) as server:
+        asins = search(server, max_items=25)
+
+    eq_(len(asins), 25)
+    eq_(len(server.received), 3, msg="Requested pages past max_items")
+
+
+def test_iter_item_search_without_prefetch():
+
+    with FakeAmazonServer(responder=item_search_responder(4)) as server:
+        eq_(len(search(server, prefetch=0)), 40)
+
+
+def test_iter_item_search_fetches_pages_concurrently():
+
+    responder = item_search_responder(10, delay=0.2)
+
+    with FakeAmazonServer(responder=responder) as server:
+        asins = search(server)
+
+    eq_(len(asins), 100)
+    # The first page tells how many there are, the other 9 go out at once
+    ok_(server.max_in_flight >= 5,
+        msg="At most %d pages requested at once" % server.max_in_flight)
@@ -0,0 +1,323 @@
+from time import time
+from contextlib import contextmanager
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AmazonAPI, AmazonAPIError, AmazonAPIResponseError
+from amazon.amazon_api import (HOSTS, DeadlineExceededError,
+                               InvalidRequestError, NoMatchesError,
+                               ServiceError)
+from amazon.rate_limit import RateLimiter
+from fake_server import (FakeAmazonServer, item_lookup_responder,
+                         fixture_responder, scripted_responder,
+                         load_fixture, items_xml)
+
+
+amz = AmazonAPI('key', 'secret', 'tag')
+
+ASINS = ['B%09d' % i for i in range(25)]
+
+
+# ===============================================================
+#
+#                  Bulk Item Lookup Unit Tests
+#
+# ===============================================================
+
+
+def test_lookup_many_chunks_and_keeps_input_order():
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+        results = list(amz.item_lookup_many(host='fake', asins=ASINS))
+
+    eq_([asin for asin, item, error in results], ASINS)
+    eq_([item.ASIN.string for asin, item, error in results], ASINS)
+    eq_(len(server.received), 3, msg="25 ASINs should take 3 requests")
+
+    for params in server.received:
+        ok_(len(params['ItemId'].split(',')) <= 10)
+
+
+def test_lookup_many_dedupes_ids():
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+        results = list(amz.item_lookup_many(host='fake',
+                                            asins=ASINS[:5] + ASINS[:5]))
+
+    eq_(len(results), 5)
+    eq_(len(server.received), 1)
+
+
+def test_lookup_many_unordered_returns_every_id():
+
+    with FakeAmazonServer(responder=item_lookup_responder()) as server:
+        server.register('fake')
+        results = list(amz.item_lookup_many(host='fake', asins=ASINS,
+                                            ordered=False))
+
+    eq_(sorted(asin for asin, item, error in results), ASINS)
+
+
+def test_lookup_many_reports_per_item_errors():
+
+    bad = ASINS[3]
+    responder = item_lookup_responder(invalid=[bad])
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        results = dict((asin, (item, error)) for asin, item, error
+                       in amz.item_lookup_many(host='fake', asins=ASINS))
+
+    item, error = results.pop(bad)
+
+    eq_(item, None)
+    ok_(isinstance(error, AmazonAPIResponseError))
+    eq_(error.code, 'AWS.InvalidParameterValue')
+
+    for item, error in results.values():
+        eq_(error, None)
+        ok_(item is not None)
+
+
+# ===============================================================
+#
+#                  Multi-market Lookup Unit Tests
+#
+# ===============================================================
+
+
+@contextmanager
+def markets(*responders):
+
+    """
+        Runs a fake server per responder, as markets fake0, fake1...
+    """
+
+    servers = [FakeAmazonServer(responder=responder).start()
+               for responder in responders]
+
+    try:
+        for i, server in enumerate(servers):
+            server.register('fake%d' % i)
+        yield servers
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def test_lookup_across_markets_merges_per_asin():
+
+    with markets(*[item_lookup_responder()] * 3) as servers:
+        results = amz.lookup_across_markets(ASINS, ['fake0', 'fake1',
+                                                    'fake2'])
+
+    eq_(sorted(results), ASINS)
+
+    for asin, by_market in results.iteritems():
+        eq_(sorted(by_market), ['fake0', 'fake1', 'fake2'])
+        for item, error in by_market.values():
+            eq_(error, None)
+            eq_(item.ASIN.string, asin)
+
+    eq_([len(server.received) for server in servers], [3, 3, 3])
+
+
+def test_lookup_across_markets_runs_markets_in_parallel():
+
+    with markets(*[item_lookup_responder(delay=0.3)] * 3):
+        start = time()
+        amz.lookup_across_markets(ASINS[:5], ['fake0', 'fake1', 'fake2'])
+        elapsed = time() - start
+
+    ok_(elapsed < 0.6, msg="Markets took %.2fs, one after the other" %
+        elapsed)
+
+
+def test_lookup_across_markets_has_a_budget_per_market():
+
+    api = AmazonAPI('key', 'secret', 'tag',
+                    rate_limiter=RateLimiter(rate=2, burst=1))
+
+    # 2 requests per market, 4 in all at 2 per second
+    with markets(*[item_lookup_responder()] * 2):
+        start = time()
+        api.lookup_across_markets(ASINS[:20], ['fake0', 'fake1'])
+        elapsed = time() - start
+
+    ok_(elapsed < 1, msg="Markets shared a budget: %.2fs" % elapsed)
+
+
+def test_lookup_across_markets_returns_partial_results():
+
+    with markets(item_lookup_responder(),
+                 item_lookup_responder(delay=2),
+                 fixture_responder('InternalError')):
+        start = time()
+        results = amz.lookup_across_markets(ASINS[:5], ['fake0', 'fake1',
+                                                        'fake2'],
+                                            timeout=0.5)
+        elapsed = time() - start
+
+    ok_(elapsed < 1, msg="Waited %.2fs for the slow market" % elapsed)
+
+    for asin, by_market in results.iteritems():
+        item, error = by_market['fake0']
+        eq_(item.ASIN.string, asin)
+
+        item, error = by_market['fake1']
+        eq_(item, None)
+        ok_(isinstance(error, DeadlineExceededError))
+
+        item, error = by_market['fake2']
+        eq_(item, None)
+        ok_(isinstance(error, ServiceError))
+
+
+def test_fake_markets_leave_hosts_as_they_were():
+
+    hosts = dict(HOSTS)
+
+    with markets(item_lookup_responder()) as servers:
+        with FakeAmazonServer() as server:
+            server.register('fake0')
+            eq_(HOSTS['fake0'], server.host)
+        eq_(HOSTS['fake0'], servers[0].host)
+
+    eq_(HOSTS, hosts)
+
+
+def test_lookup_across_markets_rejects_unknown_markets():
+
+    assert_raises(AmazonAPIError, amz.lookup_across_markets, ASINS, ['xx'])
+
+
+# ===============================================================
+#
+#                  Partial Results Unit Tests
+#
+# ===============================================================
+
+
+def test_batch_keeps_good_items_of_a_failed_response():
+
+    bad = [ASINS[2], ASINS[7]]
+
+    with FakeAmazonServer(responder=item_lookup_responder(bad)) as server:
+        server.register('fake')
+        result = amz.item_lookup_batch('fake', ASINS[:10])
+
+    eq_(len(server.received), 1)
+    ok_(not result.ok)
+    eq_([item.ASIN.string for item in result],
+        [asin for asin in ASINS[:10] if asin not in bad])
+
+    eq_(sorted(result.errors), bad)
+    for asin in bad:
+        error = result.errors[asin]
+        ok_(isinstance(error, InvalidRequestError))
+        eq_(error.item_id, asin)
+        ok_(error.permanent)
+
+    eq_(result.failed_ids(), bad)
+    eq_(result.failed_ids(retryable=True), [])
+    eq_(result.failed_ids(retryable=False), bad)
+
+
+def test_batch_errors_missing_code_or_message():
+
+    errors = ('<Errors>'
+              '<Error><Message>%s is broken</Message></Error>'
+              '<Error><Code>InternalError</Code></Error>'
+              '</Errors>' % ASINS[1])
+    content = items_xml(ASINS[:1]).replace('</IsValid>',
+                                           '</IsValid>' + errors)
+
+    with FakeAmazonServer(responder=lambda params: (200, content)) as server:
+        server.register('fake')
+        result = amz.item_lookup_batch('fake', ASINS[:3])
+
+    eq_([item.ASIN.string for item in result], ASINS[:1])
+    eq_(sorted(result.errors), ASINS[1:3])
+    # No Code to type it by
+    eq_(type(result.errors[ASINS[1]]), AmazonAPIError)
+    eq_(str(result.errors[ASINS[1]]), '%s is broken' % ASINS[1])
+    ok_(isinstance(result.errors[ASINS[2]], ServiceError))
+
+
+def test_batch_failed_request_fails_every_id():
+
+    script = ['InternalError']
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        server.register('fake')
+        result = amz.item_lookup_batch('fake', ASINS[:3])
+
+    eq_(len(result), 0)
+    ok_(all(isinstance(error, ServiceError)
+            for error in result.errors.values()))
+    eq_(result.failed_ids(retryable=True), ASINS[:3])
+
+
+def test_batch_account_limit_is_not_retryable():
+
+    script = ['AccountLimitExceeded']
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        server.register('fake')
+        result = amz.item_lookup_batch('fake', ASINS[:3])
+
+    eq_(set(error.status for error in result.errors.values()), set([503]))
+    eq_(result.failed_ids(retryable=True), [])
+    eq_(result.failed_ids(retryable=False), ASINS[:3])
+
+
+def test_batch_retry_only_failed_ids():
+
+    # Items are missing from the first response without an error naming them
+    first = [True]
+
+    def responder(params):
+        asins = params['ItemId'].split(',')
+        if first[0]:
+            first[0] = False
+            return 200, items_xml(asins[:5])
+        return 200, items_xml(asins)
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+
+        result = amz.item_lookup_batch('fake', ASINS[:10])
+        retry = result.failed_ids()
+        eq_(retry, ASINS[5:10])
+
+        result = amz.item_lookup_batch('fake', retry)
+
+    ok_(result.ok)
+    eq_(server.received[1]['ItemId'], ','.join(ASINS[5:10]))
+
+
+def test_similarity_batch_keeps_similar_items():
+
+    def responder(params):
+        content = load_fixture('SimilarityLookup')
+        error = load_fixture(error_code='AWS.ECommerceService.NoSimilarities')
+        errors = error[error.index('<Errors>'):error.index('</Errors>') + 9]
+        return 200, content.replace('<Request>', '<Request>' + errors, 1)
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        result = amz.similarity_lookup_batch('fake', ['B00CDIK908',
+                                                      'B0041OSCBU'])
+
+    ok_(len(result) > 0)
+    eq_(result.failed_ids(), ['B00CDIK908'])
+    ok_(isinstance(result.errors['B00CDIK908'], NoMatchesError))
+
+
+def test_batch_rejects_too_many_ids():
+
+    assert_raises(AmazonAPIError, amz.item_lookup_batch, 'us', ASINS[:11])
+    assert_raises(AmazonAPIError, amz.item_lookup_batch, 'us', [])
+    assert_raises(AmazonAPIError, amz.item_lookup_batch, 'xx', ASINS[:1])
@@ -0,0 +1,74 @@
+from bs4 import BeautifulSoup
+from nose.tools import eq_, assert_raises
+
+from amazon import AmazonAPI, AmazonAPIError, AmazonAPIResponseError
+from amazon.lxml_parser import parse
+from fake_server import FakeAmazonServer, items_xml, item_lookup_responder
+
+
+ASINS = ['B%09d' % i for i in range(5)]
+
+
+# ===============================================================
+#
+#                  lxml Parser Unit Tests
+#
+# ===============================================================
+
+
+def test_attribute_access_matches_soup():
+
+    content = items_xml(ASINS, invalid=[ASINS[2]])
+
+    soup = BeautifulSoup(content, "xml")
+    doc = parse(content)
+
+    eq_(doc.Items.Request.IsValid.string, soup.Items.Request.IsValid.string)
+    eq_(doc.Items.Item.ASIN.string, soup.Items.Item.ASIN.string)
+    eq_(doc.Errors.Error.Code.string, soup.Errors.Error.Code.string)
+    eq_(doc.Item.ItemAttributes.Title.string,
+        soup.Item.ItemAttributes.Title.string)
+    eq_(doc.ItemLookupResponse.name, soup.ItemLookupResponse.name)
+    eq_(doc.Items.Item.Missing, None)
+
+
+def test_find_all_matches_soup():
+
+    content = items_xml(ASINS)
+
+    soup = BeautifulSoup(content, "xml")
+    doc = parse(content)
+
+    eq_([item.ASIN.string for item in doc.find_all('Item')],
+        [item.ASIN.string for item in soup.find_all('Item')])
+    eq_(len(doc.Items.find_all('Item', recursive=False)), len(ASINS))
+    eq_(doc.Items.find_all('ASIN', recursive=False), [])
+
+
+def test_string_of_container_tags():
+
+    doc = parse('<a><b><c>text</c></b><d><e>1</e><f>2</f></d></a>')
+
+    eq_(doc.a.b.string, 'text')
+    eq_(doc.a.d.string, None)
+    eq_(doc.a.d.get_text(), '12')
+
+
+def test_client_with_lxml_parser():
+
+    amz = AmazonAPI('key', 'secret', 'tag', parser='lxml')
+
+    with FakeAmazonServer(responder=item_lookup_responder(['BAD'])) as server:
+        server.register('fake')
+
+        response = amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+        eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+
+        assert_raises(AmazonAPIResponseError, amz.item_lookup, host='fake',
+                      ItemId='BAD')
+
+
+def test_invalid_parser():
+
+    assert_raises(AmazonAPIError, AmazonAPI, 'key', 'secret', 'tag',
+                  parser='html')
@@ -0,0 +1,282 @@
+import socket
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AmazonAPI, AsyncAmazonAPI, AmazonAPIResponseError
+from amazon.amazon_api import ServiceError
+from amazon.cache import ResponseCache
+from amazon.metrics import (CallMetrics, Histogram, MetricsRecorder,
+                            StatsDExporter)
+from fake_server import FakeAmazonServer, fixture_responder
+
+
+def lookup(server, **kwargs):
+
+    server.register('fake')
+    calls = list()
+
+    amz = AmazonAPI('key', 'secret', 'tag', hooks=[calls.append], **kwargs)
+
+    try:
+        amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+    except AmazonAPIResponseError:
+        pass
+
+    return amz, calls
+
+
+# ===============================================================
+#
+#                  Metrics Hooks Unit Tests
+#
+# ===============================================================
+
+
+def test_hook_gets_every_phase():
+
+    with FakeAmazonServer(responder=fixture_responder()) as server:
+        amz, calls = lookup(server)
+
+    eq_(len(calls), 1)
+    metrics = calls[0]
+
+    eq_(metrics.host, server.host)
+    eq_(metrics.operation, 'ItemLookup')
+    eq_(metrics.status, 200)
+    eq_(metrics.error_code, None)
+    ok_(metrics.bytes > 0)
+    eq_(sorted(metrics.phases), ['check', 'http', 'params', 'parse', 'sign'])
+    ok_(all(seconds >= 0 for seconds in metrics.phases.values()))
+    ok_(metrics.duration >= sum(metrics.phases.values()) * 0.99)
+
+
+def test_hook_gets_error_code():
+
+    responder = fixture_responder('InternalError')
+
+    with FakeAmazonServer(responder=responder) as server:
+        amz, calls = lookup(server)
+
+    eq_(calls[0].status, 500)
+    eq_(calls[0].error_code, 'InternalError')
+    ok_(isinstance(calls[0].error, ServiceError))
+    eq_(calls[0].error.status, 500)
+
+    responder = fixture_responder('AWS.InvalidParameterValue')
+
+    with FakeAmazonServer(responder=responder) as server:
+        amz, calls = lookup(server)
+
+    eq_(calls[0].status, 200)
+    eq_(calls[0].error_code, 'AWS.InvalidParameterValue')
+    ok_(isinstance(calls[0].error, AmazonAPIResponseError))
+
+
+def test_hook_sees_cache_hits():
+
+    with FakeAmazonServer(responder=fixture_responder()) as server:
+        server.register('fake')
+        calls = list()
+
+        amz = AmazonAPI('key', 'secret', 'tag', cache=ResponseCache(),
+                        hooks=[calls.append])
+        amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+        amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+
+    eq_([metrics.cached for metrics in calls], [False, True])
+    ok_('http' not in calls[1].phases)
+
+
+def test_async_calls_reach_hooks():
+
+    recorder = MetricsRecorder()
+
+    with FakeAmazonServer(responder=fixture_responder()) as server:
+        server.register('fake')
+
+        with AsyncAmazonAPI('key', 'secret', 'tag', hooks=[recorder]) as amz:
+            results = [amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+                       for _ in range(5)]
+            for result in results:
+                result.get(timeout=10)
+
+    eq_(recorder.stats()['ItemLookup']['calls'], 5)
+
+
+def test_no_hooks_no_metrics():
+
+    amz = AmazonAPI('key', 'secret', 'tag')
+
+    eq_(amz._metrics('host', dict(Operation='ItemLookup')), None)
+
+    amz.add_hook(lambda metrics: None)
+    ok_(amz._metrics('host', dict(Operation='ItemLookup')) is not None)
+
+
+def test_failing_hook_does_not_fail_the_call():
+
+    def broken(metrics):
+        raise ValueError("Broken hook")
+
+    calls = list()
+
+    with FakeAmazonServer(responder=fixture_responder()) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', hooks=[broken, calls.append])
+
+        response = amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+
+    eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+    eq_(len(calls), 1)
+
+    responder = fixture_responder('InternalError')
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', hooks=[broken])
+
+        assert_raises(ServiceError, amz.item_lookup, host='fake',
+                      ItemId='B0041OSCBU')
+
+
+# ===============================================================
+#
+#                  Exporters Unit Tests
+#
+# ===============================================================
+
+
+def call_metrics(operation='ItemLookup', error_code=None, host='host',
+                 status=200):
+
+    metrics = CallMetrics(host, operation)
+    metrics.phases = dict(http=0.02, parse=0.003)
+    metrics.bytes = 1000
+    metrics.status = status
+    metrics.error_code = error_code
+    metrics.duration = 0.025
+
+    return metrics
+
+
+def test_histogram_percentiles():
+
+    histogram = Histogram()
+
+    for value in [0.001] * 90 + [0.5] * 10:
+        histogram.observe(value)
+
+    eq_(histogram.count, 100)
+    eq_(histogram.percentile(0.5), 0.001)
+    eq_(histogram.percentile(0.99), 0.5)
+    eq_(histogram.cumulative()[-1], (float('inf'), 100))
+
+
+def test_histogram_percentiles_past_the_last_bucket():
+
+    histogram = Histogram()
+
+    for value in [0.3] * 90 + [42.0] * 10:
+        histogram.observe(value)
+
+    # Bounded by the max, not infinite
+    eq_(histogram.percentile(0.5), 0.5)
+    eq_(histogram.percentile(0.99), 42.0)
+    eq_(histogram.max, 42.0)
+
+    histogram = Histogram()
+    histogram.observe(0.3)
+    eq_(histogram.percentile(0.5), 0.3)
+
+
+def test_recorder_stats():
+
+    recorder = MetricsRecorder()
+
+    recorder(call_metrics())
+    recorder(call_metrics(error_code='RequestThrottled'))
+    recorder(call_metrics('ItemSearch'))
+
+    stats = recorder.stats()
+
+    eq_(stats['ItemLookup']['calls'], 2)
+    eq_(stats['ItemLookup']['bytes'], 2000)
+    eq_(stats['ItemLookup']['errors'], {'RequestThrottled': 1})
+    eq_(stats['ItemLookup']['phases']['http']['count'], 2)
+    eq_(stats['ItemSearch']['phases']['total']['p50'], 0.025)
+
+
+def test_recorder_stats_per_host_and_status():
+
+    recorder = MetricsRecorder()
+
+    recorder(call_metrics())
+    recorder(call_metrics(host='other'))
+    recorder(call_metrics(error_code='RequestThrottled', status=503))
+    recorder(call_metrics(status=None))
+
+    stats = recorder.stats()['ItemLookup']
+
+    eq_(stats['calls'], 4)
+    eq_(stats['hosts'], {'host': {200: 1, 503: 1, None: 1},
+                         'other': {200: 1}})
+    eq_(stats['errors'], {'RequestThrottled': 1})
+    # Phases of every host and status together
+    eq_(stats['phases']['http']['count'], 4)
+
+
+def test_recorder_prometheus_text():
+
+    recorder = MetricsRecorder()
+    recorder(call_metrics(error_code='AWS.InvalidParameterValue'))
+    recorder(call_metrics(host='other', status=None))
+
+    text = recorder.prometheus()
+
+    ok_('# TYPE amazon_api_phase_seconds histogram' in text)
+    ok_('amazon_api_phase_seconds_bucket{operation="ItemLookup",host="host",'
+        'status="200",phase="http",le="0.025"} 1' in text)
+    ok_('amazon_api_phase_seconds_bucket{operation="ItemLookup",host="host",'
+        'status="200",phase="http",le="+Inf"} 1' in text)
+    ok_('amazon_api_calls_total{operation="ItemLookup",host="host",'
+        'status="200"} 1' in text)
+    ok_('amazon_api_calls_total{operation="ItemLookup",host="other",'
+        'status=""} 1' in text)
+    ok_('amazon_api_errors_total{operation="ItemLookup",host="host",'
+        'status="200",code="AWS.InvalidParameterValue"} 1' in text)
+
+
+def test_statsd_exporter_sends_packet():
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(5)
+
+    exporter = StatsDExporter(port=receiver.getsockname()[1])
+    exporter(call_metrics(error_code='AWS.InvalidParameterValue'))
+
+    lines = receiver.recv(65536).split('\n')
+    exporter.close()
+    receiver.close()
+
+    tags = '|#host:host,status:200'
+    eq_(lines, ['amazon_api.ItemLookup.http:20.000|ms' + tags,
+                'amazon_api.ItemLookup.parse:3.000|ms' + tags,
+                'amazon_api.ItemLookup.total:25.000|ms' + tags,
+                'amazon_api.ItemLookup.calls:1|c' + tags,
+                'amazon_api.ItemLookup.bytes:1000|c' + tags,
+                'amazon_api.ItemLookup.errors.AWS_InvalidParameterValue:1|c' +
+                tags])
+
+
+def test_statsd_tags():
+
+    exporter = StatsDExporter()
+    lines = exporter.lines(call_metrics(status=None))
+    eq_(lines[-1], 'amazon_api.ItemLookup.bytes:1000|c|#host:host')
+    exporter.close()
+
+    exporter = StatsDExporter(tags=False)
+    lines = exporter.lines(call_metrics())
+    eq_(lines[-1], 'amazon_api.ItemLookup.bytes:1000|c')
+    exporter.close()
@@ -0,0 +1,188 @@
+from bs4 import BeautifulSoup
+from nose.tools import eq_, ok_
+
+from amazon.lxml_parser import parse
+from amazon.models import (Item, BrowseNode, extract_items,
+                           extract_browse_nodes)
+from fake_server import load_fixture
+
+
+ITEMS_XML = """<?xml version="1.0" ?>
+<ItemLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2013-09-01">
+  <Items>
+    <Request><IsValid>True</IsValid></Request>
+    <Item>
+      <ASIN>B0041OSCBU</ASIN>
+      <SalesRank>42</SalesRank>
+      <SmallImage>
+        <URL>http://ecx.images-amazon.com/images/I/small.jpg</URL>
+        <Height Units="pixels">75</Height>
+        <Width Units="pixels">50</Width>
+      </SmallImage>
+      <ItemAttributes>
+        <Title>A Title</Title>
+        <ListPrice>
+          <Amount>1999</Amount>
+          <CurrencyCode>USD</CurrencyCode>
+        </ListPrice>
+      </ItemAttributes>
+      <OfferSummary>
+        <LowestNewPrice><Amount>1499</Amount></LowestNewPrice>
+        <TotalNew>1</TotalNew>
+      </OfferSummary>
+      <Offers>
+        <TotalOffers>1</TotalOffers>
+        <Offer>
+          <Merchant><Name>Amazon.com</Name></Merchant>
+          <OfferAttributes><Condition>New</Condition></OfferAttributes>
+          <OfferListing>
+            <OfferListingId>abc</OfferListingId>
+            <Price><Amount>1499</Amount><CurrencyCode>USD</CurrencyCode></Price>
+          </OfferListing>
+        </Offer>
+      </Offers>
+      <Variations>
+        <Item><ASIN>B000VARIANT</ASIN></Item>
+      </Variations>
+    </Item>
+    <Item>
+      <ASIN>B000NK8EWI</ASIN>
+    </Item>
+  </Items>
+</ItemLookupResponse>
+"""
+
+BROWSE_NODES_XML = """<?xml version="1.0" ?>
+<BrowseNodeLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2013-09-01">
+  <BrowseNodes>
+    <BrowseNode>
+      <BrowseNodeId>17</BrowseNodeId>
+      <Name>Literature &amp; Fiction</Name>
+      <Children>
+        <BrowseNode><BrowseNodeId>10</BrowseNodeId><Name>Classics</Name></BrowseNode>
+      </Children>
+      <Ancestors>
+        <BrowseNode>
+          <BrowseNodeId>1000</BrowseNodeId>
+          <Name>Subjects</Name>
+          <IsCategoryRoot>1</IsCategoryRoot>
+        </BrowseNode>
+      </Ancestors>
+    </BrowseNode>
+  </BrowseNodes>
+</BrowseNodeLookupResponse>
+"""
+
+
+# ===============================================================
+#
+#                  Typed Results Unit Tests
+#
+# ===============================================================
+
+
+def test_extract_items():
+
+    items = list(extract_items(ITEMS_XML))
+
+    eq_([item.asin for item in items], ['B0041OSCBU', 'B000NK8EWI'])
+
+    item = items[0]
+    eq_(item.title, 'A Title')
+    eq_(item.sales_rank, 42)
+    eq_(item.list_price, 1999)
+    eq_(item.lowest_new_price, 1499)
+    eq_(item.currency, 'USD')
+    eq_(item.total_offers, 1)
+
+    eq_(len(item.offers), 1)
+    eq_(item.offers[0].merchant, 'Amazon.com')
+    eq_(item.offers[0].price, 1499)
+
+    eq_(len(item.images), 1)
+    eq_(item.images[0].kind, 'SmallImage')
+    eq_(item.images[0].width, 50)
+
+
+def test_extract_items_from_parsed_responses():
+
+    expected = list(extract_items(ITEMS_XML))
+
+    eq_(list(extract_items(parse(ITEMS_XML))), expected)
+    eq_(list(extract_items(BeautifulSoup(ITEMS_XML, "xml"))), expected)
+
+
+def test_extract_items_from_lone_item():
+
+    expected = list(extract_items(ITEMS_XML))[:1]
+
+    eq_(list(extract_items(parse(ITEMS_XML).Items.Item)), expected)
+    eq_(list(extract_items(BeautifulSoup(ITEMS_XML, "xml").Items.Item)),
+        expected)
+
+
+def test_extract_browse_nodes():
+
+    nodes = extract_browse_nodes(BROWSE_NODES_XML)
+
+    eq_(len(nodes), 1)
+    eq_(nodes[0].node_id, 17)
+    eq_(nodes[0].name, 'Literature & Fiction')
+    eq_([child.node_id for child in nodes[0].children], [10])
+    eq_(nodes[0].ancestors[0].node_id, 1000)
+    eq_(nodes[0].ancestors[0].is_category_root, True)
+
+
+def test_extract_browse_nodes_from_parsed_responses():
+
+    expected = extract_browse_nodes(BROWSE_NODES_XML)
+
+    eq_(extract_browse_nodes(parse(BROWSE_NODES_XML)), expected)
+    eq_(extract_browse_nodes(BeautifulSoup(BROWSE_NODES_XML, "xml")),
+        expected)
+
+
+def test_recorded_responses_read_the_same_with_every_parser():
+
+    for operation in ('ItemLookup', 'ItemSearch', 'SimilarityLookup'):
+        content = load_fixture(operation)
+        expected = list(extract_items(content))
+
+        ok_(expected)
+        eq_(list(extract_items(parse(content))), expected)
+        eq_(list(extract_items(BeautifulSoup(content, "xml"))), expected)
+
+    content = load_fixture('BrowseNodeLookup')
+    expected = extract_browse_nodes(content)
+
+    ok_(expected)
+    eq_(extract_browse_nodes(parse(content)), expected)
+    eq_(extract_browse_nodes(BeautifulSoup(content, "xml")), expected)
+
+
+def test_soup_is_walked_not_serialized():
+
+    soup = BeautifulSoup(ITEMS_XML, "xml")
+    # Serialized as invalid XML, like the xmlns:= of some bs4 versions
+    soup.Items.Item['bad:'] = '<'
+    soup.__class__ = type('Unserializable', (BeautifulSoup,),
+                          {'__str__': lambda self: '<broken'})
+
+    eq_(list(extract_items(soup)), list(extract_items(ITEMS_XML)))
+
+
+def test_models_round_trip():
+
+    item = list(extract_items(ITEMS_XML))[0]
+    node = extract_browse_nodes(BROWSE_NODES_XML)[0]
+
+    eq_(Item.from_dict(item.to_dict()), item)
+    eq_(Item.from_json(item.to_json()), item)
+    eq_(BrowseNode.from_json(node.to_json()), node)
+
+
+def test_models_have_no_instance_dict():
+
+    item = list(extract_items(ITEMS_XML))[0]
+
+    ok_(not hasattr(item, '__dict__'))
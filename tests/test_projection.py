@@ -0,0 +1,156 @@
+from bs4 import BeautifulSoup
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import amazon_api, AmazonAPI, AmazonAPIError
+from amazon.amazon_api import InvalidRequestError
+from amazon.lxml_parser import parse
+from amazon.models import Item, extract_items
+from amazon.projection import Projection, response_groups
+from fake_server import (FakeAmazonServer, load_fixture, prune,
+                         projecting_responder, fixture_responder)
+
+
+FIELDS = ('title', 'sales_rank', 'lowest_new_price', 'total_offers')
+
+
+# ===============================================================
+#
+#                  Projection Unit Tests
+#
+# ===============================================================
+
+
+def test_smallest_response_group():
+
+    eq_(Projection(['ASIN', 'Title', 'LowestNewPrice', 'SalesRank'])
+        .response_group, 'OfferSummary,SalesRank,Small')
+    # Brand isn't in Small
+    eq_(response_groups(['asin', 'title', 'brand']), ('ItemAttributes',))
+    eq_(response_groups(['asin', 'offers', 'lowest_new_price']), ('Offers',))
+    eq_(response_groups(['asin']), ('SalesRank',))
+    eq_(response_groups(Item.__slots__),
+        ('Images', 'ItemAttributes', 'Offers', 'SalesRank'))
+
+
+def test_field_names():
+
+    projection = Projection(['ListPrice', 'lowest_used_price', 'CurrencyCode',
+                             'Images'])
+
+    eq_(projection.fields, ('asin', 'list_price', 'lowest_used_price',
+                            'currency', 'images'))
+
+
+def test_invalid_projection():
+
+    assert_raises(ValueError, Projection, ['Title', 'Reviews'])
+    assert_raises(ValueError, Projection, ['Title'], 'BrowseNodeLookup')
+
+
+def test_extract_only_fields():
+
+    for operation in ('ItemLookup', 'ItemSearch', 'SimilarityLookup'):
+        content = load_fixture(operation)
+        projection = Projection(FIELDS, operation)
+
+        full = list(extract_items(content))
+        for source in (content, parse(content),
+                       BeautifulSoup(content, "xml")):
+            projected = list(projection.extract(source))
+
+            eq_(len(projected), len(full))
+            for item, whole in zip(projected, full):
+                for field in Item.__slots__:
+                    expected = (getattr(whole, field)
+                                if field in projection.fields else None)
+                    eq_(getattr(item, field), expected,
+                        msg="%s %s" % (operation, field))
+
+
+def test_extract_nested_fields():
+
+    content = load_fixture('ItemLookup')
+    full = list(extract_items(content))
+
+    for source in (content, parse(content), BeautifulSoup(content, "xml")):
+        projected = list(extract_items(source, ('asin', 'offers', 'images')))
+
+        eq_([item.offers for item in projected],
+            [item.offers for item in full])
+        eq_([item.images for item in projected],
+            [item.images for item in full])
+        eq_([item.title for item in projected], [None] * len(full))
+
+
+def test_pruned_response_has_the_fields():
+
+    content = load_fixture('ItemLookup')
+    projection = Projection(FIELDS)
+    pruned = prune(content, projection.response_group)
+
+    ok_(len(pruned) < len(content))
+    eq_(list(projection.extract(pruned)), list(projection.extract(content)))
+
+
+# ===============================================================
+#
+#                  Item Fields Unit Tests
+#
+# ===============================================================
+
+
+def test_item_fields():
+
+    responder = projecting_responder(load_fixture('ItemLookup'))
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag')
+
+        items = amz.item_fields('fake', ['Title', 'SalesRank'],
+                                ItemId='B0041OSCBU')
+
+        assert_raises(AmazonAPIError, amz.item_fields, 'fake', ['Reviews'],
+                      ItemId='B0041OSCBU')
+
+    eq_(server.received[0]['ResponseGroup'], 'SalesRank,Small')
+    eq_(len(server.received), 1)
+
+    expected = list(extract_items(load_fixture('ItemLookup')))
+    eq_([(item.asin, item.title, item.sales_rank) for item in items],
+        [(item.asin, item.title, item.sales_rank) for item in expected])
+    eq_(set(item.lowest_new_price for item in items), set([None]))
+
+
+def test_item_fields_reads_the_raw_response():
+
+    def no_tree(*args):
+        raise AssertionError("Response parsed into a tree")
+
+    responder = projecting_responder(load_fixture('ItemLookup'))
+    expected = list(Projection(['Title']).extract(load_fixture('ItemLookup')))
+    trees = amazon_api.BeautifulSoup, amazon_api.lxml_parser.parse
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        amazon_api.BeautifulSoup = amazon_api.lxml_parser.parse = no_tree
+
+        try:
+            for parser in ('bs4', 'lxml'):
+                amz = AmazonAPI('key', 'secret', 'tag', parser=parser)
+                eq_(amz.item_fields('fake', ['Title'], ItemId='B0041OSCBU'),
+                    expected)
+        finally:
+            amazon_api.BeautifulSoup, amazon_api.lxml_parser.parse = trees
+
+
+def test_item_fields_raises_response_errors():
+
+    responder = fixture_responder('AWS.InvalidParameterValue')
+
+    with FakeAmazonServer(responder=responder) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag')
+
+        assert_raises(InvalidRequestError, amz.item_fields, 'fake',
+                      ['Title'], ItemId='B0041OSCBU')
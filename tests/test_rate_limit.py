@@ -0,0 +1,143 @@
+from time import time, sleep
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AmazonAPI
+from amazon.amazon_api import ThrottlingError
+from amazon.rate_limit import TokenBucket, RateLimiter
+from fake_server import FakeAmazonServer
+
+
+THROTTLED_XML = """<?xml version="1.0"?>
+<ItemLookupErrorResponse xmlns="http://ecs.amazonaws.com/doc/2013-09-01/">
+  <Error>
+    <Code>RequestThrottled</Code>
+    <Message>AWS Access Key ID: key. You are submitting requests too quickly.
+Please retry your requests at a slower rate.</Message>
+  </Error>
+</ItemLookupErrorResponse>
+"""
+
+# ===============================================================
+#
+#                  Rate Limiter Unit Tests
+#
+# ===============================================================
+
+
+def test_bucket_paces_calls():
+
+    bucket = TokenBucket(rate=50, burst=1)
+
+    start = time()
+    for _ in range(6):
+        bucket.acquire()
+    elapsed = time() - start
+
+    ok_(elapsed >= 0.09, msg="6 calls at 50/s took %.3fs" % elapsed)
+    eq_(bucket.stats()['waits'], 5)
+
+
+def test_bucket_allows_bursts():
+
+    bucket = TokenBucket(rate=1, burst=5)
+
+    waits = [bucket.acquire() for _ in range(5)]
+
+    eq_(waits, [0.0] * 5)
+
+
+def test_bucket_aimd():
+
+    bucket = TokenBucket(rate=4, min_rate=1, increase=0.5, decrease=0.5,
+                         cooldown=0)
+
+    bucket.throttled()
+    eq_(bucket.rate, 2)
+
+    bucket.throttled()
+    bucket.throttled()
+    eq_(bucket.rate, 1, msg="Rate went under min_rate")
+
+    bucket.succeeded()
+    eq_(bucket.rate, 1.5)
+
+    for _ in range(10):
+        bucket.succeeded()
+    eq_(bucket.rate, 4, msg="Rate went over max_rate")
+
+
+def test_bucket_decreases_once_per_cooldown():
+
+    bucket = TokenBucket(rate=10, decrease=0.5)
+
+    # Calls in flight together, throttled together
+    for _ in range(5):
+        bucket.throttled()
+
+    eq_(bucket.rate, 5)
+    eq_(bucket.stats()['throttles'], 5)
+
+    sleep(0.25)
+    bucket.throttled()
+    eq_(bucket.rate, 2.5)
+
+
+def test_bucket_gives_up_at_deadline():
+
+    bucket = TokenBucket(rate=2, burst=1)
+    bucket.acquire()
+
+    start = time()
+    eq_(bucket.acquire(deadline=time() + 0.1), None)
+    ok_(time() - start < 0.05, msg="Slept for a token it couldn't get")
+
+    # No token was taken for the call given up on
+    ok_(0.4 < bucket.acquire(deadline=time() + 1) <= 0.5)
+    eq_(bucket.stats()['calls'], 2)
+
+
+def test_bucket_reports_spare_budget():
+
+    bucket = TokenBucket(rate=10, burst=2)
+
+    eq_(bucket.expected_wait(), 0.0)
+
+    bucket.acquire()
+    bucket.acquire()
+
+    ok_(bucket.available() < 1)
+    ok_(0 < bucket.expected_wait() <= 0.1)
+
+
+def test_limiter_has_a_bucket_per_credential_and_host():
+
+    limiter = RateLimiter(rate=10)
+
+    ok_(limiter.bucket('a', 'h1') is limiter.bucket('a', 'h1'))
+    ok_(limiter.bucket('a', 'h1') is not limiter.bucket('a', 'h2'))
+    ok_(limiter.bucket('a', 'h1') is not limiter.bucket('b', 'h1'))
+
+
+def test_limiter_rates_per_credential():
+
+    limiter = RateLimiter(rates={'fast': 20}, rate=2)
+
+    eq_(limiter.bucket('fast', 'h').rate, 20)
+    eq_(limiter.bucket('slow', 'h').rate, 2)
+
+
+def test_throttled_response_lowers_rate():
+
+    limiter = RateLimiter(rate=10)
+    amz = AmazonAPI('key', 'secret', 'tag', rate_limiter=limiter)
+
+    with FakeAmazonServer(responder=lambda params: (503, THROTTLED_XML)) as server:
+        server.register('fake')
+        assert_raises(ThrottlingError, amz.item_lookup, host='fake',
+                      ItemId='A')
+
+    stats = limiter.stats()[('key', server.host)]
+
+    eq_(stats['throttles'], 1)
+    eq_(stats['rate'], 5)
@@ -0,0 +1,226 @@
+import os
+import shutil
+import tempfile
+from time import time, sleep
+from contextlib import contextmanager
+
+from nose.tools import eq_, ok_
+
+from amazon import AmazonAPI
+from amazon.models import Item
+from amazon.refresh import TrackedItems, RefreshScheduler, fingerprint
+from fake_server import FakeAmazonServer, item_lookup_responder
+
+
+ASINS = ['B%09d' % i for i in range(25)]
+
+
+@contextmanager
+def store_path():
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        yield os.path.join(tmp_dir, 'tracked.db')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@contextmanager
+def scheduler(prices, invalid=(), **kwargs):
+
+    """
+        RefreshScheduler tracking every ASIN of prices on a fake host whose
+        items cost prices[asin], polled again after a few hundredths of a
+        second.
+    """
+
+    options = dict(rate=1000, interval=0.02, min_interval=0.01,
+                   max_interval=0.08)
+    options.update(kwargs)
+
+    responder = item_lookup_responder(invalid=invalid, prices=prices)
+
+    with store_path() as path:
+        with FakeAmazonServer(responder=responder) as server:
+            server.register('fake')
+
+            store = TrackedItems(path)
+            refresher = RefreshScheduler(AmazonAPI('key', 'secret', 'tag'),
+                                         store, **options)
+            refresher.track('fake', sorted(prices))
+            refresher.server = server
+
+            try:
+                yield refresher
+            finally:
+                refresher.close()
+                store.close()
+
+
+def refresh(refresher, wait=0.1):
+
+    sleep(wait)
+
+    return sorted(item.asin for item in refresher.refresh('fake'))
+
+
+# ===============================================================
+#
+#                  Fingerprint Unit Tests
+#
+# ===============================================================
+
+
+def test_fingerprint_covers_only_the_fields():
+
+    item = Item(asin='B1', title=u'One', lowest_new_price=1000)
+
+    eq_(fingerprint(item), fingerprint(Item(asin='B1', title=u'Other',
+                                            lowest_new_price=1000)))
+    ok_(fingerprint(item) != fingerprint(Item(asin='B1', title=u'One',
+                                              lowest_new_price=999)))
+    ok_(fingerprint(item, ('title',)) !=
+        fingerprint(Item(asin='B1', title=u'Other'), ('title',)))
+
+    ok_(-2 ** 63 <= fingerprint(item) < 2 ** 63)
+
+
+# ===============================================================
+#
+#                  Refresh Scheduler Unit Tests
+#
+# ===============================================================
+
+
+def test_emits_only_changed_items():
+
+    prices = dict((asin, 1000) for asin in ASINS)
+
+    with scheduler(prices) as refresher:
+        eq_(refresh(refresher, 0), ASINS)
+        eq_(len(refresher.server.received), 3)
+
+        eq_(refresh(refresher), [])
+
+        prices[ASINS[3]] = 900
+        prices[ASINS[20]] = 1100
+        eq_(refresh(refresher), [ASINS[3], ASINS[20]])
+
+        changes = refresher.store.item('fake', ASINS[3])['changes']
+
+    eq_(changes, 1)
+
+
+def test_intervals_follow_changes():
+
+    prices = dict(volatile=1000, stable=1000)
+
+    with scheduler(prices) as refresher:
+        refresh(refresher, 0)
+
+        for i in range(3):
+            prices['volatile'] += 1
+            refresh(refresher)
+
+        volatile = refresher.store.item('fake', 'volatile')
+        stable = refresher.store.item('fake', 'stable')
+
+    # Multiplied by 0.5 on every change and by 1.5 otherwise
+    eq_(volatile['interval'], 0.01)
+    ok_(abs(stable['interval'] - 0.02 * 1.5 ** 3) < 1e-9)
+    eq_(volatile['changes'], 3)
+    eq_(stable['changes'], 0)
+
+
+def test_volatile_items_are_polled_more_often():
+
+    prices = dict(volatile=1000, stable=1000)
+
+    with scheduler(prices, max_interval=1) as refresher:
+        refresh(refresher, 0)
+
+        stop = time() + 0.6
+        while time() < stop:
+            prices['volatile'] += 1
+            refresh(refresher, 0.01)
+
+        volatile = refresher.store.item('fake', 'volatile')['polls']
+        stable = refresher.store.item('fake', 'stable')['polls']
+
+    ok_(volatile > 2 * stable, msg="%d polls for %d" % (volatile, stable))
+
+
+def test_lookups_stay_within_rate():
+
+    prices = dict(('B%09d' % i, 1000) for i in range(50))
+
+    with scheduler(prices, rate=20) as refresher:
+        start = time()
+        refresh(refresher, 0)
+        elapsed = time() - start
+
+        lookups = len(refresher.server.received)
+
+    # 5 lookups, the first one right away and the others 1/20s apart
+    eq_(lookups, 5)
+    ok_(elapsed >= 0.19, msg="5 lookups in %.2fs" % elapsed)
+
+
+def test_failed_polls_are_retried():
+
+    prices = dict((asin, 1000) for asin in ASINS[:5])
+
+    with scheduler(prices, invalid=[ASINS[1]]) as refresher:
+        eq_(refresh(refresher, 0), ASINS[:1] + ASINS[2:5])
+
+        failed = refresher.store.item('fake', ASINS[1])
+        eq_(failed['fingerprint'], None)
+        eq_(failed['errors'], 1)
+        eq_(failed['interval'], 0.02)
+
+        refresh(refresher)
+        eq_(refresher.store.item('fake', ASINS[1])['errors'], 2)
+
+
+def test_max_lookups_and_demand():
+
+    prices = dict((asin, 1000) for asin in ASINS)
+
+    with scheduler(prices, interval=100) as refresher:
+        eq_(len(list(refresher.refresh('fake', max_lookups=2))), 20)
+
+        counts = refresher.store.counts('fake')
+
+    eq_(counts['tracked'], 25)
+    eq_(counts['due'], 5)
+    # 25 ASINs polled every 100s, 10 per lookup
+    ok_(abs(counts['demand'] - 0.025) < 1e-9)
+
+
+def test_schedule_survives_restart():
+
+    prices = dict((asin, 1000) for asin in ASINS[:5])
+    responder = item_lookup_responder(prices=prices)
+
+    with store_path() as path:
+        with FakeAmazonServer(responder=responder) as server:
+            server.register('fake')
+            api = AmazonAPI('key', 'secret', 'tag')
+
+            store = TrackedItems(path)
+            refresher = RefreshScheduler(api, store, rate=1000, interval=0.01,
+                                         min_interval=0.01)
+            refresher.track('fake', ASINS[:5])
+            eq_(len(list(refresher.refresh('fake'))), 5)
+            refresher.close()
+            store.close()
+
+            sleep(0.05)
+            store = TrackedItems(path)
+            refresher = RefreshScheduler(api, store, rate=1000)
+            # Tracking again keeps the schedule and fingerprints
+            refresher.track('fake', ASINS[:5])
+            eq_(list(refresher.refresh('fake')), [])
+            refresher.close()
+            store.close()
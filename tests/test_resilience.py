@@ -0,0 +1,344 @@
+from time import time, sleep
+
+from nose.tools import eq_, ok_, assert_raises
+from requests import Timeout
+
+from amazon import AmazonAPI, AmazonAPIResponseError
+from amazon.amazon_api import (CircuitOpenError, DeadlineExceededError,
+                               CredentialsError, ServiceError,
+                               ThrottlingError)
+from amazon.rate_limit import RateLimiter
+from amazon.resilience import (RetryPolicy, CircuitBreaker, CircuitBreakers,
+                               Hedger)
+from fake_server import (FakeAmazonServer, fixture_responder, load_fixture,
+                         scripted_responder)
+
+
+def lookup(amz, host='fake'):
+    return amz.item_lookup(host=host, ItemId='B0041OSCBU')
+
+
+def fast_retries(max_attempts=3):
+    return RetryPolicy(max_attempts=max_attempts, base_delay=0.01)
+
+
+# ===============================================================
+#
+#                  Timeouts and Retries Unit Tests
+#
+# ===============================================================
+
+
+def test_stuck_request_times_out():
+
+    with FakeAmazonServer(responder=scripted_responder([2])) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', timeout=0.2, pool_retries=0)
+
+        start = time()
+        assert_raises(Timeout, lookup, amz)
+        elapsed = time() - start
+
+    ok_(elapsed < 1, msg="Timed out after %.2fs" % elapsed)
+
+
+def test_retries_transient_errors():
+
+    script = ['InternalError', 'RequestThrottled']
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', retry=fast_retries())
+
+        response = lookup(amz)
+
+    eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+    eq_(len(server.received), 3)
+    # The same signed request is sent again
+    eq_(server.received[0], server.received[2])
+
+
+def test_retries_timeouts():
+
+    with FakeAmazonServer(responder=scripted_responder([1])) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', timeout=0.2,
+                        retry=fast_retries())
+
+        lookup(amz)
+
+    eq_(len(server.received), 2)
+
+
+def test_retries_retryable_error_in_200_response():
+
+    error = load_fixture(error_code='InternalError')
+    responses = [(200, error)]
+
+    def respond(params):
+        if responses:
+            return responses.pop(0)
+        return fixture_responder()(params)
+
+    with FakeAmazonServer(responder=respond) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', retry=fast_retries())
+
+        response = lookup(amz)
+
+    eq_(len(server.received), 2)
+    eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+
+
+def test_does_not_retry_permanent_errors():
+
+    for code, error in [('AWS.InvalidParameterValue', AmazonAPIResponseError),
+                        ('InvalidClientTokenId', CredentialsError),
+                        ('AccountLimitExceeded', ThrottlingError)]:
+        with FakeAmazonServer(responder=scripted_responder([code])) as server:
+            server.register('fake')
+            amz = AmazonAPI('key', 'secret', 'tag', retry=fast_retries())
+
+            assert_raises(error, lookup, amz)
+
+        eq_(len(server.received), 1, msg="%s was retried" % code)
+
+
+def test_retryable_by_code_before_status():
+
+    retry = RetryPolicy()
+
+    ok_(retry.retryable(503, 'RequestThrottled'))
+    ok_(not retry.retryable(503, 'AccountLimitExceeded'))
+    ok_(retry.retryable(503))
+    ok_(retry.retryable(None))
+    ok_(not retry.retryable(400))
+
+
+def test_gives_up_after_max_attempts():
+
+    script = ['InternalError'] * 5
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', retry=fast_retries(3))
+
+        assert_raises(ServiceError, lookup, amz)
+
+    eq_(len(server.received), 3)
+
+
+def test_retries_stop_at_deadline():
+
+    script = ['InternalError'] * 5
+    retry = RetryPolicy(max_attempts=5, base_delay=2, max_delay=2)
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', retry=retry, deadline=0.3)
+
+        start = time()
+        assert_raises(ServiceError, lookup, amz)
+        elapsed = time() - start
+
+    ok_(elapsed < 0.5, msg="Retried past the deadline: %.2fs" % elapsed)
+
+
+def test_deadline_exceeded_waiting_for_budget():
+
+    with FakeAmazonServer(responder=scripted_responder([])) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', deadline=0.5,
+                        rate_limiter=RateLimiter(rate=1))
+
+        lookup(amz)
+        start = time()
+        assert_raises(DeadlineExceededError, lookup, amz)
+        elapsed = time() - start
+
+    eq_(len(server.received), 1)
+    ok_(elapsed < 0.1, msg="Waited %.2fs for a token past the deadline" %
+        elapsed)
+
+
+def test_backoff_has_jitter_within_bounds():
+
+    retry = RetryPolicy(base_delay=0.1, max_delay=0.3)
+
+    delays = [retry.delay(attempt) for attempt in range(5) for _ in range(50)]
+
+    ok_(all(0 <= delay <= 0.3 for delay in delays))
+    ok_(len(set(delays)) > 1)
+    ok_(max(retry.delay(0) for _ in range(50)) <= 0.1)
+
+
+# ===============================================================
+#
+#                  Circuit Breaker Unit Tests
+#
+# ===============================================================
+
+
+def test_breaker_opens_and_recovers():
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+
+    breaker.failed()
+    ok_(breaker.allow())
+    breaker.failed()
+    ok_(not breaker.allow())
+
+    sleep(0.15)
+    ok_(breaker.allow(), msg="No trial call after reset_timeout")
+    ok_(not breaker.allow(), msg="More than one trial call")
+
+    breaker.failed()
+    ok_(not breaker.allow(), msg="Failed trial didn't reopen the circuit")
+
+    sleep(0.15)
+    ok_(breaker.allow())
+    breaker.succeeded()
+    eq_(breaker.stats()['state'], CircuitBreaker.CLOSED)
+
+
+def test_open_circuit_fails_fast_per_host():
+
+    script = ['InternalError'] * 2
+    breakers = CircuitBreakers(failure_threshold=2, reset_timeout=0.2)
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        with FakeAmazonServer(responder=scripted_responder([])) as healthy:
+            server.register('fake')
+            healthy.register('healthy')
+            amz = AmazonAPI('key', 'secret', 'tag', breakers=breakers)
+
+            assert_raises(ServiceError, lookup, amz)
+            assert_raises(ServiceError, lookup, amz)
+            assert_raises(CircuitOpenError, lookup, amz)
+            eq_(len(server.received), 2)
+
+            lookup(amz, 'healthy')
+
+            sleep(0.25)
+            lookup(amz)
+
+    eq_(breakers.stats()[server.host]['state'], CircuitBreaker.CLOSED)
+    eq_(breakers.stats()[server.host]['rejected'], 1)
+
+
+def test_failed_trial_call_reopens_circuit():
+
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0.1)
+
+    with FakeAmazonServer(responder=scripted_responder([])) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', breakers=breakers)
+        breaker = breakers.breaker(server.host)
+        breaker.failed()
+        sleep(0.15)
+
+        # Trial call failing on something else than the network
+        parse = amz._parse
+        amz._parse = lambda content, raw=False: 1 / 0
+        assert_raises(ZeroDivisionError, lookup, amz)
+        amz._parse = parse
+
+        eq_(breaker.stats()['state'], CircuitBreaker.OPEN)
+        assert_raises(CircuitOpenError, lookup, amz)
+
+        sleep(0.15)
+        lookup(amz)
+
+    eq_(breaker.stats()['state'], CircuitBreaker.CLOSED)
+
+
+def test_expired_deadline_skips_breaker():
+
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0.1)
+    breaker = breakers.breaker('fake-host')
+    breaker.failed()
+    sleep(0.15)
+
+    amz = AmazonAPI('key', 'secret', 'tag', breakers=breakers)
+    assert_raises(DeadlineExceededError, amz._attempt, 'fake-host',
+                  'http://fake-host/', time() - 1, None)
+
+    # The trial call is still there to be made
+    eq_(breaker.stats()['state'], CircuitBreaker.OPEN)
+    ok_(breaker.allow())
+
+
+def test_running_out_of_budget_does_not_open_circuit():
+
+    breakers = CircuitBreakers(failure_threshold=3)
+
+    with FakeAmazonServer(responder=scripted_responder([])) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', deadline=0.5,
+                        breakers=breakers,
+                        rate_limiter=RateLimiter(rate=0.1, burst=1))
+
+        lookup(amz)
+        for _ in range(3):
+            assert_raises(DeadlineExceededError, lookup, amz)
+
+    eq_(len(server.received), 1)
+    eq_(breakers.stats()[server.host]['state'], CircuitBreaker.CLOSED)
+
+
+def test_throttling_does_not_open_circuit():
+
+    script = ['RequestThrottled'] * 3
+    breakers = CircuitBreakers(failure_threshold=2)
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', breakers=breakers)
+
+        for _ in range(3):
+            assert_raises(ThrottlingError, lookup, amz)
+
+    eq_(breakers.stats()[server.host]['state'], CircuitBreaker.CLOSED)
+
+
+# ===============================================================
+#
+#                  Hedged Requests Unit Tests
+#
+# ===============================================================
+
+
+def test_hedger_delay_is_latency_percentile():
+
+    hedger = Hedger(percentile=0.9, min_samples=10)
+
+    for i in range(9):
+        hedger.observe(0.01 * (i + 1))
+    eq_(hedger.delay(), None)
+
+    hedger.observe(1.0)
+    eq_(hedger.delay(), 1.0)
+
+
+def test_slow_request_is_hedged():
+
+    # The 6th request is stuck, its duplicate isn't
+    script = [None] * 5 + [3]
+    hedger = Hedger(percentile=0.5, min_samples=5)
+
+    with FakeAmazonServer(responder=scripted_responder(script)) as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', hedger=hedger)
+
+        for _ in range(5):
+            lookup(amz)
+
+        start = time()
+        response = lookup(amz)
+        elapsed = time() - start
+
+    eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+    ok_(elapsed < 1, msg="Hedged call took %.2fs" % elapsed)
+    eq_(len(server.received), 7)
+    eq_(hedger.stats()['hedges'], 1)
+    eq_(hedger.stats()['wins'], 1)
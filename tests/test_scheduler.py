@@ -0,0 +1,206 @@
+import threading
+from time import time, sleep
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon import AmazonAPI, AmazonAPIError
+from amazon.amazon_api import DeadlineExceededError
+from amazon.resilience import CircuitBreaker, CircuitBreakers
+from amazon.scheduler import PriorityScheduler
+from fake_server import FakeAmazonServer
+
+
+def acquire_all(scheduler, name, count, granted, lock):
+
+    def acquire():
+        scheduler.acquire(name, 'key', 'host')
+        with lock:
+            granted.append(name)
+
+    threads = [threading.Thread(target=acquire) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+def wait_for(condition, timeout=2.0):
+
+    stop = time() + timeout
+    while not condition() and time() < stop:
+        sleep(0.01)
+
+
+# ===============================================================
+#
+#                  Priority Scheduler Unit Tests
+#
+# ===============================================================
+
+
+def test_weighted_share():
+
+    scheduler = PriorityScheduler({'interactive': 3, 'background': 1},
+                                  rate=20, burst=1)
+    # Everyone queues up behind the next token
+    scheduler.rate_limiter.bucket('key', 'host').acquire()
+
+    granted = list()
+    lock = threading.Lock()
+    threads = (acquire_all(scheduler, 'interactive', 8, granted, lock) +
+               acquire_all(scheduler, 'background', 8, granted, lock))
+    for thread in threads:
+        thread.join()
+
+    eq_(len(granted), 16)
+    ok_(granted[:8].count('interactive') >= 5, granted)
+    ok_('background' in granted[:8], granted)
+
+    stats = scheduler.stats()
+    eq_(stats['interactive']['granted'], 8)
+    eq_(stats['background']['granted'], 8)
+    eq_(stats['background']['queued'], 0)
+    scheduler.close()
+
+
+def test_interactive_skips_background_backlog():
+
+    scheduler = PriorityScheduler(rate=20, burst=1)
+    granted = list()
+    lock = threading.Lock()
+    threads = acquire_all(scheduler, 'background', 10, granted, lock)
+
+    wait_for(lambda: scheduler.stats()['background']['queued'] >= 8)
+    wait = scheduler.acquire('interactive', 'key', 'host')
+
+    ok_(wait < 0.2, wait)
+    ok_(scheduler.stats()['background']['queued'] > 0)
+
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+
+def test_past_use_is_not_held_against_a_class():
+
+    scheduler = PriorityScheduler(rate=50, burst=1)
+    granted = list()
+    lock = threading.Lock()
+
+    # Background runs alone for a while, then goes idle
+    for thread in acquire_all(scheduler, 'background', 20, granted, lock):
+        thread.join()
+
+    threads = acquire_all(scheduler, 'interactive', 40, granted, lock)
+    wait_for(lambda: scheduler.stats()['interactive']['queued'] >= 35)
+
+    wait = scheduler.acquire('background', 'key', 'host')
+    with lock:
+        ahead = granted[20:].count('interactive')
+
+    for thread in threads:
+        thread.join()
+
+    # About 1 in 11 tokens, not after every interactive call
+    ok_(ahead < 20, "Waited behind %d interactive calls" % ahead)
+    ok_(wait < 0.6, wait)
+    scheduler.close()
+
+
+def test_queue_depth_and_close():
+
+    scheduler = PriorityScheduler(rate=0.1, burst=1)
+    scheduler.rate_limiter.bucket('key', 'host').acquire()
+    errors = list()
+
+    def acquire():
+        try:
+            scheduler.acquire('background', 'key', 'host')
+        except AmazonAPIError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=acquire) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+
+    wait_for(lambda: scheduler.stats()['background']['queued'] == 3)
+    eq_(scheduler.stats()['background']['queued'], 3)
+    eq_(scheduler.stats()['interactive']['queued'], 0)
+
+    scheduler.close()
+    for thread in threads:
+        thread.join()
+
+    eq_(len(errors), 3)
+    eq_(scheduler.stats()['background']['queued'], 0)
+    eq_(scheduler.stats()['background']['dropped'], 0)
+    assert_raises(AmazonAPIError, scheduler.acquire, 'background', 'key',
+                  'host')
+
+
+def test_unknown_class():
+
+    assert_raises(ValueError, PriorityScheduler().limiter, 'batch')
+
+
+# ===============================================================
+#
+#                  Scheduled Client Unit Tests
+#
+# ===============================================================
+
+
+def test_expired_call_is_dropped_unsent():
+
+    with FakeAmazonServer() as server:
+        server.register('fake')
+
+        with PriorityScheduler(rate=0.5, burst=1) as scheduler:
+            web = AmazonAPI('key', 'secret', 'tag',
+                            rate_limiter=scheduler.limiter('interactive'))
+            crawler = AmazonAPI('key', 'secret', 'tag',
+                                rate_limiter=scheduler.limiter('background',
+                                                               deadline=0.2))
+
+            web.item_lookup('fake', ItemId='B0041OSCBU')
+
+            start = time()
+            assert_raises(DeadlineExceededError, crawler.item_lookup, 'fake',
+                          ItemId='B00EOE0WKQ')
+            ok_(time() - start < 1.0)
+
+            stats = scheduler.stats()
+
+    eq_(len(server.received), 1)
+    eq_(server.received[0]['ItemId'], 'B0041OSCBU')
+    eq_(stats['background']['dropped'], 1)
+    eq_(stats['background']['granted'], 0)
+    eq_(stats['interactive']['granted'], 1)
+    ok_(stats['interactive']['wait_p50'] is not None)
+    eq_(stats['interactive']['wait_max'], stats['interactive']['wait_p99'])
+
+
+def test_dropped_calls_do_not_open_circuit():
+
+    breakers = CircuitBreakers(failure_threshold=1)
+
+    with FakeAmazonServer() as server:
+        server.register('fake')
+
+        with PriorityScheduler(rate=0.5, burst=1) as scheduler:
+            crawler = AmazonAPI('key', 'secret', 'tag', breakers=breakers,
+                                rate_limiter=scheduler.limiter('background',
+                                                               deadline=0.1))
+
+            crawler.item_lookup('fake', ItemId='B0041OSCBU')
+            for _ in range(3):
+                assert_raises(DeadlineExceededError, crawler.item_lookup,
+                              'fake', ItemId='B00EOE0WKQ')
+
+            stats = scheduler.stats()
+
+    eq_(len(server.received), 1)
+    eq_(stats['background']['dropped'], 3)
+    # Interactive calls to the host aren't turned away
+    eq_(breakers.stats()[server.host]['state'], CircuitBreaker.CLOSED)
+    eq_(breakers.stats()[server.host]['rejected'], 0)
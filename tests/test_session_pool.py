@@ -0,0 +1,50 @@
+from nose.tools import eq_, ok_
+
+from amazon import AmazonAPI
+from amazon.amazon_api import HOSTS
+from fake_server import FakeAmazonServer
+
+
+# ===============================================================
+#
+#                  Connection Pool Unit Tests
+#
+# ===============================================================
+
+
+def test_pooled_calls_reuse_connection():
+
+    with FakeAmazonServer() as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag')
+
+        for _ in range(5):
+            response = amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+
+        amz.close()
+
+    eq_(response.Items.Item.ASIN.string, 'B0041OSCBU')
+    eq_(len(server.connections), 1,
+        msg="Pooled client opened more than one connection")
+
+
+def test_unpooled_calls_open_new_connections():
+
+    with FakeAmazonServer() as server:
+        server.register('fake')
+        amz = AmazonAPI('key', 'secret', 'tag', pool=False)
+
+        for _ in range(5):
+            amz.item_lookup(host='fake', ItemId='B0041OSCBU')
+
+    ok_(len(server.connections) > 1)
+
+
+def test_idle_sessions_are_replaced():
+
+    amz = AmazonAPI('key', 'secret', 'tag', pool_idle_timeout=-1)
+
+    first = amz._session_pool.get_session(HOSTS['us'])
+    second = amz._session_pool.get_session(HOSTS['us'])
+
+    ok_(first is not second, msg="Idle session was not reopened")
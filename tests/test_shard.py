@@ -0,0 +1,312 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from time import time, sleep
+from contextlib import contextmanager
+
+from nose.tools import eq_, ok_, assert_raises
+
+from amazon.shard import WorkQueue, ShardedLookup, shard_of
+from fake_server import FakeAmazonServer, item_lookup_responder
+
+
+ASINS = ['B%09d' % i for i in range(100)]
+
+
+@contextmanager
+def queue_path():
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        yield os.path.join(tmp_dir, 'queue.db')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@contextmanager
+def work_queue(item_ids=ASINS, shards=1):
+
+    with queue_path() as path:
+        queue = WorkQueue(path)
+        queue.add('fake', item_ids, shards)
+
+        try:
+            yield queue
+        finally:
+            queue.close()
+
+
+def crash_once(marker):
+
+    """
+        Hook killing the worker process it runs in, the first time only.
+    """
+
+    def hook(metrics):
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+        except OSError:
+            return
+        os._exit(1)
+
+    return hook
+
+
+class FailingLookup(ShardedLookup):
+
+    """
+        Its lookups fail with an exception the first time only.
+    """
+
+    def __init__(self, marker, *args, **kwargs):
+        super(FailingLookup, self).__init__(*args, **kwargs)
+        self.marker = marker
+
+    def lookup(self, api, host, item_ids, params):
+        try:
+            os.close(os.open(self.marker, os.O_CREAT | os.O_EXCL))
+        except OSError:
+            return super(FailingLookup, self).lookup(api, host, item_ids,
+                                                     params)
+        raise KeyError(item_ids[0])
+
+
+# ===============================================================
+#
+#                  Work Queue Unit Tests
+#
+# ===============================================================
+
+
+def test_claims_are_exclusive():
+
+    with work_queue() as queue:
+        first = queue.claim('fake', 'a', '1')
+        second = queue.claim('fake', 'b', '1')
+
+        eq_(len(first), 10)
+        eq_(len(second), 10)
+        eq_(set(first) & set(second), set())
+        eq_(queue.counts('fake')['claimed'], 20)
+
+
+def test_claims_own_shard_first():
+
+    with work_queue(shards=2) as queue:
+        own = [item_id for item_id in ASINS if shard_of(item_id, 2) == 1]
+
+        claimed = list()
+        for claim in range(len(own) // 10 + 1):
+            claimed.extend(queue.claim('fake', 'a', str(claim), shard=1))
+
+        eq_(set(claimed[:len(own)]), set(own))
+        # Topped up from the other shard
+        eq_(len(claimed), 10 * (len(own) // 10 + 1))
+
+
+def test_ack_and_results():
+
+    with work_queue() as queue:
+        item_ids = queue.claim('fake', 'a', '1')
+        queue.ack('fake', dict((item_id, dict(title=item_id))
+                               for item_id in item_ids))
+
+        eq_(list(queue.results('fake')),
+            [(item_id, dict(title=item_id)) for item_id in sorted(item_ids)])
+        eq_(queue.counts('fake'),
+            dict(queued=100, pending=90, claimed=0, done=10, failed=0))
+
+        # Done ItemIds are neither claimed nor queued again
+        queue.add('fake', item_ids)
+        eq_(set(queue.claim('fake', 'a', '2', limit=100)) & set(item_ids),
+            set())
+
+
+def test_failed_item_ids_are_given_up_on():
+
+    with work_queue(ASINS[:1]) as queue:
+        for attempt in range(3):
+            eq_(queue.claim('fake', 'a', str(attempt)), ASINS[:1])
+            queue.retry('fake', ASINS[:1], delay=0)
+
+        eq_(queue.claim('fake', 'a', '3'), [])
+        eq_(queue.counts('fake')['failed'], 1)
+
+        queue.reset('fake')
+        eq_(queue.claim('fake', 'a', '4'), ASINS[:1])
+
+
+def test_failed_item_ids_back_off():
+
+    with work_queue(ASINS[:2]) as queue:
+        eq_(queue.next_retry('fake'), None)
+        eq_(queue.claim('fake', 'a', '1'), ASINS[:2])
+
+        start = time()
+        queue.retry('fake', ASINS[:1], delay=10)
+        queue.retry('fake', ASINS[1:2], delay=0.1)
+
+        eq_(queue.claim('fake', 'a', '2'), [])
+        retry = queue.next_retry('fake')
+        ok_(start + 0.1 <= retry < time() + 0.1)
+
+        # Doubled per attempt
+        sleep(retry - time() + 0.01)
+        eq_(queue.claim('fake', 'a', '3'), ASINS[1:2])
+        queue.retry('fake', ASINS[1:2], delay=0.1)
+        ok_(queue.next_retry('fake') >= start + 0.3)
+
+        queue.reset('fake')
+        eq_(queue.claim('fake', 'a', '4'), ASINS[:2])
+
+
+def test_queue_of_older_version_is_migrated():
+
+    with queue_path() as path:
+        db = sqlite3.connect(path)
+        db.execute("CREATE TABLE work (host TEXT NOT NULL,"
+                   " item_id TEXT NOT NULL, shard INTEGER NOT NULL,"
+                   " worker TEXT, claim TEXT,"
+                   " attempts INTEGER NOT NULL DEFAULT 0, done REAL,"
+                   " result TEXT, PRIMARY KEY (host, item_id)) WITHOUT ROWID")
+        db.execute("INSERT INTO work (host, item_id, shard)"
+                   " VALUES ('fake', 'B1', 0)")
+        db.commit()
+        db.close()
+
+        queue = WorkQueue(path)
+        eq_(queue.claim('fake', 'a', '1'), ['B1'])
+        queue.retry('fake', ['B1'], delay=10)
+        eq_(queue.claim('fake', 'a', '2'), [])
+        queue.close()
+
+
+def test_dead_worker_claims_are_released():
+
+    with queue_path() as path:
+        queue = WorkQueue(path)
+        queue.add('fake', ASINS[:20])
+        claimed = queue.claim('fake', 'dead', '1')
+        queue.claim('fake', 'alive', '1')
+        queue.close()
+
+        # Claims survive the process
+        queue = WorkQueue(path)
+        eq_(queue.release('fake', 'dead'), 10)
+        eq_(queue.claim('fake', 'other', '1'), claimed)
+        eq_(queue.release('fake'), 20)
+        queue.close()
+
+
+# ===============================================================
+#
+#                  Sharded Lookup Unit Tests
+#
+# ===============================================================
+
+
+def test_run_looks_up_every_item_id():
+
+    responder = item_lookup_responder(invalid=ASINS[5:6])
+
+    with queue_path() as path:
+        with FakeAmazonServer(responder=responder) as server:
+            server.register('fake')
+
+            lookup = ShardedLookup('key', 'secret', 'tag', path, processes=3,
+                                   threads=2, rate=1000,
+                                   fields=('title', 'lowest_new_price'))
+            counts = lookup.run('fake', ASINS, ResponseGroup='Offers')
+
+        eq_(counts, dict(queued=100, pending=0, claimed=0, done=100,
+                         failed=0, restarts=0))
+        # Each ItemId looked up once
+        looked_up = sum((params['ItemId'].split(',')
+                         for params in server.received), [])
+        eq_(sorted(looked_up), ASINS)
+
+        queue = WorkQueue(path)
+        results = dict(queue.results('fake'))
+        queue.close()
+
+        eq_(sorted(results), ASINS)
+        eq_(sorted(results[ASINS[0]]), ['lowest_new_price', 'title'])
+        ok_(results[ASINS[5]]['error'].startswith(
+            'AWS.InvalidParameterValue'))
+
+
+def test_dead_worker_is_restarted():
+
+    with queue_path() as path:
+        marker = path + '.crashed'
+
+        with FakeAmazonServer(responder=item_lookup_responder()) as server:
+            server.register('fake')
+
+            lookup = ShardedLookup('key', 'secret', 'tag', path, processes=2,
+                                   threads=1, rate=1000,
+                                   hooks=[crash_once(marker)])
+            counts = lookup.run('fake', ASINS)
+
+        ok_(os.path.exists(marker))
+        eq_(counts['restarts'], 1)
+        eq_(counts['done'], 100)
+        # The ItemIds of the dead worker were looked up again
+        looked_up = sum((params['ItemId'].split(',')
+                         for params in server.received), [])
+        eq_(sorted(set(looked_up)), ASINS)
+        ok_(0 < len(looked_up) - len(ASINS) <= 10)
+
+
+def test_failed_thread_fails_its_worker():
+
+    with queue_path() as path:
+        with FakeAmazonServer(responder=item_lookup_responder()) as server:
+            server.register('fake')
+
+            lookup = FailingLookup(path + '.failed', 'key', 'secret', 'tag',
+                                   path, processes=1, threads=2, rate=1000)
+            lookup.add('fake', ASINS)
+            assert_raises(SystemExit, lookup.work, 'fake', 0, '0.0', {})
+
+        queue = WorkQueue(path)
+        counts = queue.counts('fake')
+        queue.close()
+
+    # The claims of the failed thread wait for the worker to be restarted
+    eq_(counts['claimed'], 10)
+    eq_(counts['done'], 90)
+
+
+def test_worker_with_failed_thread_is_restarted():
+
+    with queue_path() as path:
+        with FakeAmazonServer(responder=item_lookup_responder()) as server:
+            server.register('fake')
+
+            lookup = FailingLookup(path + '.failed', 'key', 'secret', 'tag',
+                                   path, processes=2, threads=1, rate=1000)
+            counts = lookup.run('fake', ASINS)
+
+    eq_(counts['restarts'], 1)
+    eq_(counts['done'], 100)
+    eq_(counts['claimed'], 0)
+
+
+def test_processes_share_the_rate():
+
+    with queue_path() as path:
+        with FakeAmazonServer(responder=item_lookup_responder()) as server:
+            server.register('fake')
+
+            lookup = ShardedLookup('key', 'secret', 'tag', path, processes=2,
+                                   threads=2, rate=20)
+            start = time()
+            counts = lookup.run('fake', ASINS)
+            elapsed = time() - start
+
+    eq_(counts['done'], 100)
+    # 10 lookups, 5 per process at 10 per second, the first right away
+    ok_(elapsed >= 0.39, msg="10 lookups in %.2fs" % elapsed)
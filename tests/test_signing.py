@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import sys
+import hmac
+import random
+import threading
+from urllib import quote
+from urlparse import urlparse, parse_qsl
+from hashlib import sha256
+from base64 import b64encode
+
+from nose.tools import eq_
+
+from amazon import AmazonAPI
+from amazon.amazon_api import HOSTS
+from fake_server import FakeAmazonServer, items_xml
+
+
+def reference_url(amz, host, params):
+
+    """
+        URL built the way AmazonAPI did before RequestSigner, encoding and
+        signing every param from scratch.
+    """
+
+    string_params = ['%s=%s' % (key, quote(unicode(val).encode('utf-8'),
+                                safe='~'))
+                     for key, val
+                     in params.iteritems()]
+    params = '&'.join(sorted(string_params))
+
+    string_to_sign = 'GET'
+    string_to_sign += '\n%s' % host
+    string_to_sign += '\n/%s' % amz._resource
+    string_to_sign += '\n%s' % params
+
+    digest = hmac.new(amz.secret_key, string_to_sign, sha256).digest()
+    signature = quote(b64encode(digest))
+
+    return 'http://%s/%s?%s&Signature=%s' % (host, amz._resource, params,
+                                             signature)
+
+
+def random_params(rng):
+
+    params = dict(Operation=rng.choice(['ItemLookup', 'ItemSearch',
+                                        'SimilarityLookup']),
+                  ItemId=','.join('B%09d' % rng.randint(0, 10 ** 9)
+                                  for _ in range(rng.randint(1, 10))),
+                  ResponseGroup=rng.choice(['ItemAttributes,Images',
+                                            'Large', 'Offers']),
+                  Timestamp='2015-06-%02dT12:00:00Z' % rng.randint(1, 28))
+
+    if rng.random() < 0.5:
+        params['Keywords'] = rng.choice([u'Harry Potter', u'café crème',
+                                         u'a+b=c&d', u'~tilde/slash*'])
+
+    if rng.random() < 0.3:
+        params['ItemPage'] = rng.randint(1, 10)
+
+    if rng.random() < 0.2:
+        # Overriding a param the client sends by default
+        params['AssociateTag'] = 'other-20'
+
+    return params
+
+
+def assert_same_urls(amz, rounds=500):
+
+    rng = random.Random(42)
+
+    for _ in range(rounds):
+        host = rng.choice(sorted(HOSTS.values()))
+        params = amz._request_parameters(random_params(rng))
+
+        eq_(amz._build_url(host, dict(params)),
+            reference_url(amz, host, params))
+
+
+# ===============================================================
+#
+#                  Request Signing Unit Tests
+#
+# ===============================================================
+
+
+def test_signatures_match_reference():
+
+    assert_same_urls(AmazonAPI('AKIAEXAMPLE', 'secret/key+1=', 'tag-20'))
+
+
+def test_signatures_match_reference_with_unicode_credentials():
+
+    assert_same_urls(AmazonAPI(u'AKIAEXAMPLE', 'secret', u'tag-20'))
+
+
+def test_signatures_match_reference_with_long_secret():
+
+    # Keys longer than the SHA256 block are hashed first
+    assert_same_urls(AmazonAPI('AKIAEXAMPLE', 'k' * 100, 'tag-20'), 50)
+
+
+def test_signatures_match_reference_with_many_distinct_values():
+
+    # Goes over the cache of encoded values, which must be flushed
+    amz = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20')
+
+    for i in range(1000):
+        params = amz._request_parameters(dict(Operation='ItemLookup',
+                                              ResponseGroup='Group%d' % i,
+                                              ItemId='B0041OSCBU'))
+        eq_(amz._build_url(HOSTS['us'], dict(params)),
+            reference_url(amz, HOSTS['us'], params))
+
+
+# ===============================================================
+#
+#                  Concurrent Signing Unit Tests
+#
+# ===============================================================
+
+
+def run_threads(target, threads=16):
+
+    """
+        Runs target in threads at once, switching between threads as often
+        as the interpreter allows, and re-raises the first error.
+    """
+
+    errors = list()
+
+    def run(seed):
+        try:
+            target(random.Random(seed))
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+
+    try:
+        workers = [threading.Thread(target=run, args=(seed,))
+                   for seed in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        sys.setcheckinterval(interval)
+
+    if errors:
+        raise errors[0]
+
+
+def test_shared_client_signs_for_each_calls_host():
+
+    amz = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20')
+    hosts = sorted(HOSTS)
+
+    def sign(rng):
+        for _ in range(300):
+            host = rng.choice(hosts)
+            params = random_params(rng)
+            params.pop('Keywords', None)
+
+            host_name, url, cache_entry, metrics = amz._prepare(host, params)
+
+            eq_(urlparse(url).netloc, HOSTS[host])
+            eq_(url, reference_url(amz, HOSTS[host], params))
+
+    run_threads(sign)
+
+
+def test_shared_client_under_mixed_host_load():
+
+    amz = AmazonAPI('AKIAEXAMPLE', 'secret', 'tag-20', pool_size=16)
+    servers = [FakeAmazonServer() for _ in range(3)]
+    mismatches = list()
+
+    def checking_responder(server):
+
+        # Answers with its own host as the ASIN, so callers can tell where
+        # their request went
+        def responder(params):
+            params = dict(params)
+            signature = params.pop('Signature')
+            url = reference_url(amz, server.host, params)
+
+            if dict(parse_qsl(urlparse(url).query))['Signature'] != \
+                    signature:
+                mismatches.append((server.host, params))
+
+            return 200, items_xml([server.host])
+
+        return responder
+
+    for i, server in enumerate(servers):
+        server.responder = checking_responder(server)
+        server.start().register('fake%d' % i)
+
+    def call(rng):
+        for _ in range(50):
+            host = 'fake%d' % rng.randint(0, 2)
+            response = amz.item_lookup(host=host, ItemId='B0041OSCBU',
+                                       Keywords='Harry Potter')
+            eq_(response.Items.Item.ASIN.string, HOSTS[host])
+
+    try:
+        run_threads(call)
+    finally:
+        for server in servers:
+            server.stop()
+
+    eq_(mismatches, [])
+    eq_(sum(len(server.received) for server in servers), 16 * 50)